@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# main_0.py — Stage 0: collapse exact and near-duplicate references before Stage 1
+#
+# Dedup (default):
+#   python main_0.py --input data/all_references.csv --output data/deduped_for_stage1.csv \
+#                    --report data/dedup_clusters.csv --threshold 0.8
+#
+# Fan out a later stage's decisions to every duplicate id:
+#   python main_0.py --fanout ../Stage_7_Cash_Releasing_Benefit/data/screen_stage7.csv \
+#                    --input data/all_references.csv --report data/dedup_clusters.csv \
+#                    --output data/screen_stage7_all_ids.csv
+
+import argparse
+import os
+import sys
+
+from utils_0 import DEFAULT_THRESHOLD, cluster_references, fan_out, representatives
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.tables import read_table, write_table  # noqa: E402
+
+DEFAULT_INPUT = "data/all_references.csv"
+DEFAULT_OUTPUT = "data/deduped_for_stage1.csv"
+DEFAULT_REPORT = "data/dedup_clusters.csv"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Stage 0: exact + near-duplicate reference collapsing (no API calls)"
+    )
+    parser.add_argument("--input", default=DEFAULT_INPUT, help="Full reference export (.csv or .parquet)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Output CSV (representatives, or fanned-out stage file)")
+    parser.add_argument("--report", default=DEFAULT_REPORT, help="Cluster report CSV (written in dedup mode, read in --fanout mode)")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="MinHash Jaccard similarity needed to treat two records as duplicates (0-1)")
+    parser.add_argument("--id-col", default="id", help="Column name for unique article ID")
+    parser.add_argument("--fanout", default=None,
+                        help="Stage output CSV whose decisions should be copied to every cluster member")
+    args = parser.parse_args()
+
+    try:
+        sys.stdout.reconfigure(line_buffering=True)
+    except Exception:
+        pass
+
+    df = read_table(args.input)
+    if len(df) == 0:
+        print("⚠️ No rows to process.", flush=True)
+        return
+
+    if args.fanout:
+        report = read_table(args.report)
+        stage_df = read_table(args.fanout)
+        out = fan_out(stage_df, df, report, id_col=args.id_col)
+        write_table(out, args.output)
+        print(f"Fanned out {len(stage_df)} screened representatives to {len(out)} ids. Wrote: {args.output}", flush=True)
+        return
+
+    report = cluster_references(df, threshold=args.threshold, id_col=args.id_col)
+    reps = representatives(df, report, id_col=args.id_col)
+
+    write_table(report, args.report)
+    write_table(reps, args.output)
+
+    dup_clusters = report.loc[report["cluster_size"] > 1, "cluster_id"].nunique()
+    by_reason = report["match_reason"].value_counts().to_dict()
+    print(f"[DEDUP] {len(df)} records -> {len(reps)} to screen "
+          f"({len(df) - len(reps)} duplicates in {dup_clusters} clusters; threshold={args.threshold})", flush=True)
+    print(f"[DEDUP] match reasons: {by_reason}", flush=True)
+    print(f"Stage 0 de-duplication complete. Wrote: {args.output} and {args.report}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
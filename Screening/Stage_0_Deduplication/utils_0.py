@@ -0,0 +1,295 @@
+# utils_0.py — Stage 0 helpers: collapse exact and near-duplicate references before screening
+#
+# Clusters are built from three signals (union-find):
+#   1) identical normalized DOI
+#   2) identical normalized title (long titles only)
+#   3) MinHash/LSH similarity of title + abstract word shingles >= threshold
+# Two records are never merged if both carry a DOI and the DOIs differ, or both
+# carry a year and the years differ (Stage 1 decides on year, so fanning out a
+# decision across different years would be wrong).
+
+import re
+import unicodedata
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+NUM_PERM = 128
+SHINGLE_WORDS = 3
+DEFAULT_THRESHOLD = 0.8
+MIN_TITLE_KEY_LEN = 25
+TITLE_MIN_SIMILARITY = 0.5  # same title but different abstracts (data-entry mix-ups) are not merged
+MAX_BUCKET = 200          # ignore pathological LSH buckets (e.g. boilerplate-only abstracts)
+
+_MERSENNE = np.uint64(4294967311)   # prime > 2^32
+
+
+# -------------------- Normalization --------------------
+
+_DOI_PREFIX = re.compile(r"^(?:https?://(?:dx\.)?doi\.org/|doi:\s*)", re.I)
+
+def normalize_doi(v: Any) -> str:
+    """Lower-case DOI without resolver prefix; '' if missing."""
+    if not isinstance(v, str) or not v.strip():
+        return ""
+    s = _DOI_PREFIX.sub("", v.strip()).strip().rstrip(".").lower()
+    return s if s.startswith("10.") else ""
+
+def _fold(text: str) -> str:
+    """Lower-case, strip accents/punctuation, collapse whitespace."""
+    s = unicodedata.normalize("NFKD", text)
+    s = "".join(ch for ch in s if not unicodedata.combining(ch)).lower()
+    s = re.sub(r"[^\w\s]", " ", s)
+    return re.sub(r"\s+", " ", s).strip()
+
+def normalize_title(v: Any) -> str:
+    if not isinstance(v, str):
+        return ""
+    return _fold(v)
+
+# Copyright lines and publisher boilerplate differ between database exports
+_BOILERPLATE = [
+    re.compile(r"(?:©|\(c\)|copyright)\s*(?:\d{4})?[^.]*(?:\.|$)", re.I),
+    re.compile(r"all rights reserved\.?", re.I),
+    re.compile(r"published by [^.]*\.", re.I),
+    re.compile(r"\[(?:abstract truncated|publisher abstract)[^\]]*\]", re.I),
+]
+
+def strip_boilerplate(v: Any) -> str:
+    if not isinstance(v, str):
+        return ""
+    s = v
+    for pat in _BOILERPLATE:
+        s = pat.sub(" ", s)
+    return s
+
+def _year(v: Any) -> Optional[int]:
+    try:
+        y = int(float(v))
+    except Exception:
+        return None
+    return y if 1000 < y < 3000 else None
+
+
+# -------------------- MinHash / LSH --------------------
+
+def _shingle_hashes(text: str, k: int = SHINGLE_WORDS) -> np.ndarray:
+    words = text.split()
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+    if len(words) < k:
+        grams = [" ".join(words)]
+    else:
+        grams = {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64)
+
+def _permutations(num_perm: int, seed: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 2 ** 32 - 1, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, 2 ** 32 - 1, size=num_perm, dtype=np.uint64)
+    return a, b
+
+def minhash_signatures(texts: List[str], num_perm: int = NUM_PERM) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    MinHash signature per text (rows) plus a mask of texts that had any shingles.
+    (a*h + b) stays below 2^64 for 32-bit shingle hashes, so uint64 never overflows.
+    """
+    a, b = _permutations(num_perm)
+    sigs = np.full((len(texts), num_perm), np.iinfo(np.uint64).max, dtype=np.uint64)
+    has = np.zeros(len(texts), dtype=bool)
+    for i, t in enumerate(texts):
+        h = _shingle_hashes(t)
+        if h.size:
+            sigs[i] = ((a[:, None] * h[None, :] + b[:, None]) % _MERSENNE).min(axis=1)
+            has[i] = True
+    return sigs, has
+
+def lsh_params(threshold: float, num_perm: int = NUM_PERM) -> Tuple[int, int]:
+    """
+    (bands, rows) whose S-curve midpoint (1/b)^(1/r) sits comfortably below the threshold,
+    favouring recall — every candidate pair is verified against the threshold afterwards.
+    """
+    best = (num_perm, 1)
+    for r in range(1, num_perm + 1):
+        if num_perm % r:
+            continue
+        b = num_perm // r
+        if (1.0 / b) ** (1.0 / r) <= max(threshold - 0.15, 0.05):
+            best = (b, r)
+    return best
+
+def lsh_candidate_pairs(sigs: np.ndarray, has: np.ndarray, bands: int, rows: int) -> set:
+    pairs = set()
+    idx = np.flatnonzero(has)
+    for band in range(bands):
+        buckets: Dict[bytes, List[int]] = {}
+        block = sigs[:, band * rows:(band + 1) * rows]
+        for i in idx:
+            buckets.setdefault(block[i].tobytes(), []).append(int(i))
+        for members in buckets.values():
+            if 1 < len(members) <= MAX_BUCKET:
+                for x in range(len(members)):
+                    for y in range(x + 1, len(members)):
+                        pairs.add((members[x], members[y]))
+    return pairs
+
+
+# -------------------- Clustering --------------------
+
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, x: int) -> int:
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, x: int, y: int) -> None:
+        rx, ry = self.find(x), self.find(y)
+        if rx != ry:
+            self.parent[max(rx, ry)] = min(rx, ry)
+
+def _find_col(df: pd.DataFrame, name: str) -> Optional[str]:
+    for c in df.columns:
+        if str(c).strip().lower() == name:
+            return c
+    return None
+
+def cluster_references(
+    df: pd.DataFrame,
+    threshold: float = DEFAULT_THRESHOLD,
+    id_col: str = "id",
+    title_col: str = "Title",
+    abstract_col: str = "Abstract",
+) -> pd.DataFrame:
+    """
+    Cluster duplicate references. Returns one report row per input record:
+      <id_col>, cluster_id, representative_id, cluster_size, match_reason, similarity
+    match_reason is 'unique', 'representative', 'doi', 'title', 'minhash' or 'transitive'.
+    """
+    n = len(df)
+    ids = df[id_col].tolist()
+    titles = df[title_col].tolist() if title_col in df.columns else [""] * n
+    abstracts = df[abstract_col].tolist() if abstract_col in df.columns else [""] * n
+    doi_col = _find_col(df, "doi")
+    year_col = _find_col(df, "year")
+    dois = [normalize_doi(v) for v in df[doi_col].tolist()] if doi_col else [""] * n
+    years = [_year(v) for v in df[year_col].tolist()] if year_col else [None] * n
+    title_keys = [normalize_title(t) for t in titles]
+
+    uf = _UnionFind(n)
+    reason: Dict[int, Tuple[str, float]] = {}
+    # DOI / year carried by each cluster root, so transitive merges stay compatible too
+    cl_doi = {i: dois[i] for i in range(n)}
+    cl_year = {i: years[i] for i in range(n)}
+
+    def merge(i: int, j: int, why: str, sim: float) -> None:
+        ri, rj = uf.find(i), uf.find(j)
+        if ri == rj:
+            return
+        if cl_doi[ri] and cl_doi[rj] and cl_doi[ri] != cl_doi[rj]:
+            return
+        if cl_year[ri] is not None and cl_year[rj] is not None and cl_year[ri] != cl_year[rj]:
+            return
+        uf.union(ri, rj)
+        root = uf.find(ri)
+        cl_doi[root] = cl_doi[ri] or cl_doi[rj]
+        cl_year[root] = cl_year[ri] if cl_year[ri] is not None else cl_year[rj]
+        reason.setdefault(i, (why, sim))
+        reason.setdefault(j, (why, sim))
+
+    texts = [f"{title_keys[i]} {_fold(strip_boilerplate(abstracts[i]))}".strip() for i in range(n)]
+    has_abstract = [bool(strip_boilerplate(a).strip()) for a in abstracts]
+    sigs, has = minhash_signatures(texts)
+
+    def similarity(i: int, j: int) -> float:
+        return float(np.mean(sigs[i] == sigs[j]))
+
+    # 1) identical DOI
+    first: Dict[str, int] = {}
+    for i, k in enumerate(dois):
+        if k in first:
+            merge(first[k], i, "doi", 1.0)
+        elif k:
+            first[k] = i
+
+    # 2) identical long title — unless both abstracts exist and clearly disagree
+    first = {}
+    for i, k in enumerate(title_keys):
+        if len(k) < MIN_TITLE_KEY_LEN:
+            continue
+        if k not in first:
+            first[k] = i
+            continue
+        j = first[k]
+        if has_abstract[i] and has_abstract[j] and similarity(i, j) < TITLE_MIN_SIMILARITY:
+            continue
+        merge(j, i, "title", 1.0)
+
+    # 3) near duplicates on title + abstract shingles
+    bands, rows = lsh_params(threshold)
+    for i, j in sorted(lsh_candidate_pairs(sigs, has, bands, rows)):
+        sim = similarity(i, j)
+        if sim >= threshold:
+            merge(i, j, "minhash", round(sim, 3))
+
+    # Representative: has a DOI, then longest abstract (boilerplate excluded), then first occurrence
+    members: Dict[int, List[int]] = {}
+    for i in range(n):
+        members.setdefault(uf.find(i), []).append(i)
+
+    def rank(i: int):
+        return (0 if dois[i] else 1, -len(strip_boilerplate(abstracts[i]).strip()), i)
+
+    rows_out = []
+    for c, (root, idxs) in enumerate(sorted(members.items())):
+        rep = min(idxs, key=rank)
+        for i in idxs:
+            if len(idxs) == 1:
+                why, sim = "unique", 1.0
+            elif i == rep:
+                why, sim = "representative", 1.0
+            else:
+                why, sim = reason.get(i, ("transitive", 1.0))
+            rows_out.append({
+                id_col: ids[i],
+                "cluster_id": f"C{c:06d}",
+                "representative_id": ids[rep],
+                "cluster_size": len(idxs),
+                "match_reason": why,
+                "similarity": sim,
+                "_row": i,
+            })
+    report = pd.DataFrame(rows_out).sort_values("_row").drop(columns="_row").reset_index(drop=True)
+    return report
+
+
+def representatives(df: pd.DataFrame, report: pd.DataFrame, id_col: str = "id") -> pd.DataFrame:
+    """Input rows that represent their cluster (one per cluster), in original order."""
+    rep_ids = set(report.loc[report[id_col] == report["representative_id"], id_col])
+    out = df[df[id_col].isin(rep_ids)].copy()
+    sizes = report.set_index(id_col)["cluster_size"]
+    out["dup_cluster_size"] = out[id_col].map(sizes).astype(int)
+    return out
+
+
+def fan_out(
+    stage_df: pd.DataFrame,
+    all_df: pd.DataFrame,
+    report: pd.DataFrame,
+    id_col: str = "id",
+) -> pd.DataFrame:
+    """
+    Copy a stage's decision columns from each representative to every member of its cluster.
+    Members keep their own input columns; only representatives present in stage_df are expanded
+    (members of clusters excluded at an earlier stage stay out, like their representative).
+    """
+    decision_cols = [c for c in stage_df.columns if c not in all_df.columns and c != "dup_cluster_size"]
+    decisions = stage_df[[id_col] + decision_cols].rename(columns={id_col: "representative_id"})
+    members = report[[id_col, "representative_id", "cluster_id"]]
+    out = all_df.merge(members, on=id_col, how="inner").merge(decisions, on="representative_id", how="inner")
+    return out
@@ -1,5 +1,12 @@
 import json
-from typing import Dict, Any, Optional
+import os
+import sys
+from typing import Dict, Any, Optional, List
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.frames import column_values  # noqa: E402
 
 def safe_json_loads(s: str) -> Optional[Dict[str, Any]]:
     """Robustly parse JSON object from model output."""
@@ -32,6 +39,14 @@ def build_user_prompt(unique_id: str, year: Any, title: str, abstract: str) -> s
     lines.append("\nTASK: Determine if the article is in English and published 2019–2025, return STRICT JSON per schema.")
     return "\n".join(lines)
 
+# Columns build_user_prompts reads (the --slim projection)
+PROMPT_COLUMNS = ("id", "Year", "Title", "Abstract")
+
+def build_user_prompts(df: pd.DataFrame) -> List[str]:
+    """Build user prompts for a whole DataFrame at once (same text as build_user_prompt per row)."""
+    cols = zip(df["id"].tolist(), column_values(df, "Year"), column_values(df, "Title"), column_values(df, "Abstract"))
+    return [build_user_prompt(uid, year, title, abstract) for uid, year, title, abstract in cols]
+
 def normalize_result(obj: Dict[str, Any]) -> Dict[str, Any]:
     """Standardize model output into safe fields."""
     return {
@@ -2,7 +2,14 @@
 # Helpers for Stage 2 screening: "Is a UK study or applied to a UK setting?"
 
 import json
-from typing import Dict, Any, Optional
+import os
+import sys
+from typing import Dict, Any, Optional, List
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.frames import column_values, hint_columns, row_metadata  # noqa: E402
 
 # --- JSON parsing ---
 
@@ -79,6 +86,24 @@ def build_user_prompt(
     )
     return "\n".join(lines)
 
+# Columns build_user_prompts reads (the --slim projection)
+PROMPT_COLUMNS = ("id", "Title", "Abstract") + UK_HINT_KEYS
+
+def build_user_prompts(df: pd.DataFrame) -> List[str]:
+    """
+    Build the Stage 2 prompts for a whole DataFrame at once.
+    UK_HINT_KEYS columns are looked up once per frame rather than per row;
+    each prompt is identical to build_user_prompt() for that row.
+    """
+    hints = hint_columns(df, UK_HINT_KEYS)
+    ids = df["id"].tolist()
+    titles = column_values(df, "Title")
+    abstracts = column_values(df, "Abstract")
+    return [
+        build_user_prompt(ids[i], titles[i], abstracts[i], row_metadata(hints, i))
+        for i in range(len(ids))
+    ]
+
 
 # --- Normalization ---
 
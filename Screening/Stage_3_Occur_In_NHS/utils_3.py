@@ -1,7 +1,14 @@
 # utils_3.py — Stage 3 helpers: “Occurs in NHS / health & social care / community health settings”
 
 import json
-from typing import Dict, Any, Optional
+import os
+import sys
+from typing import Dict, Any, Optional, List
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.frames import column_values, hint_columns, row_metadata  # noqa: E402
 
 def safe_json_loads(s: str) -> Optional[Dict[str, Any]]:
     """Parse JSON robustly (fallback to first {...} block)."""
@@ -51,6 +58,20 @@ def build_user_prompt(unique_id: str, title: str, abstract: str, metadata: Dict[
     )
     return "\n".join(lines)
 
+# Columns build_user_prompts reads (the --slim projection)
+PROMPT_COLUMNS = ("id", "Title", "Abstract") + HINT_KEYS
+
+def build_user_prompts(df: pd.DataFrame) -> List[str]:
+    """Stage 3 prompts for every row of df; care-setting HINT_KEYS columns are resolved once."""
+    hints = hint_columns(df, HINT_KEYS)
+    ids = df["id"].tolist()
+    titles = column_values(df, "Title")
+    abstracts = column_values(df, "Abstract")
+    return [
+        build_user_prompt(ids[i], titles[i], abstracts[i], row_metadata(hints, i))
+        for i in range(len(ids))
+    ]
+
 def _normalize_detected_context(v: Any) -> str:
     if v is None:
         return "Unknown"
@@ -1,7 +1,14 @@
 # utils_4.py — Stage 4 helpers: “Peer-reviewed or grey literature (exclude protocols, editorials, predatory journals)”
 
 import json
-from typing import Dict, Any, Optional
+import os
+import sys
+from typing import Dict, Any, Optional, List
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.frames import column_values  # noqa: E402
 
 def safe_json_loads(s: str) -> Optional[Dict[str, Any]]:
     """Safely parse JSON from model output (fallback to first {...} block)."""
@@ -39,6 +46,14 @@ def build_user_prompt(unique_id: str, title: str, abstract: str, metadata: Dict[
     )
     return "\n".join(lines)
 
+# Columns build_user_prompts reads (the --slim projection)
+PROMPT_COLUMNS = ("id", "Title", "Abstract")
+
+def build_user_prompts(df: pd.DataFrame) -> List[str]:
+    """Build user prompts for a whole DataFrame at once (same text as build_user_prompt per row)."""
+    cols = zip(df["id"].tolist(), column_values(df, "Title"), column_values(df, "Abstract"))
+    return [build_user_prompt(uid, title, abstract, None) for uid, title, abstract in cols]
+
 def _normalize_publication_type(v: Any) -> str:
     if v is None:
         return "Unknown"
@@ -1,9 +1,17 @@
 # utils_5.py — Stage 5 helpers: “Uses comparison group AND measures primary outcomes (cost/impact)”
 
 import json
+import os
 import re
+import sys
 from typing import Dict, Any, Optional, List
 
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.cues import cue_labels  # noqa: E402
+from common.frames import column_values, hint_columns, row_metadata  # noqa: E402
+
 def safe_json_loads(s: str) -> Optional[Dict[str, Any]]:
     """Parse JSON robustly, falling back to the first {...} block."""
     if not s:
@@ -27,58 +35,7 @@ HINT_KEYS = (
 )
 
 # ------- Lightweight cue finders (to help the model “see” implicit comparators / outcomes) -------
-
-_COMPARATOR_CUES = {
-    # Explicit
-    r"\b(control|placebo|comparator|randomi[sz]ed|standard care|usual care|business as usual|BAU)\b": "explicit",
-    r"\b(non[- ]inferiority|superiority|head[- ]to[- ]head|versus|vs\.?)\b": "explicit",
-    # Implicit — time / pre-post with a defined change
-    r"\b(pre[- ]?intervention|post[- ]?intervention|pre[- ]?implementation|post[- ]?implementation|baseline|before|after)\b": "pre_post",
-    r"\b(increased|decreased|reduced|fell|rose|change(d)? by|from .* to)\b": "delta",
-    # Implicit — switch/substitution
-    r"\b(switch(ed|ing)?|transition(ed|ing)?|substitut(e|ion)|replace(d|ment))\b": "switch",
-    # Implicit — scenario / counterfactual in modelling
-    r"\b(counterfactual|do[- ]?nothing|status quo|current strategy|baseline scenario|no intervention)\b": "scenario",
-    # Implicit — benchmark vs observed
-    r"\b(expected|forecast(ed)?|predicted)\b.*\b(actual|observed)\b": "benchmark_vs_observed",
-    # Implicit — technique/device head-to-head
-    r"\b(first[- ]generation|second[- ]generation|technique [AB]|method [AB])\b": "technique"
-}
-
-_OUTCOME_CUES = {
-    # Economics
-    r"\b(cost(s)?|saving(s)?|budget|expenditure|tariff|price|ICER|QALY(s)?|ROI|net monetary benefit|NMB)\b": "cost",
-    r"\b(QALY|utility|utilities|quality[- ]adjusted)\b": "qaly",
-    # Service utilisation & time
-    r"\b(utili[sz]ation|throughput|admission(s)?|readmission(s)?|attendance(s)?|uptake|hospitali[sz]ation(s)?)\b": "utilization",
-    r"\b(length of stay|LOS|waiting time(s)?|time to|duration|turnaround time)\b": "time",
-    # Clinical / detection / effectiveness (broadened)
-    r"\b(mortality|morbidity|complication(s)?|effectiveness|efficacy|detection rate(s)?|remission|healing|hysterectomy|hba1c|glycated haemoglobin|weight loss|body mass index|bmi|fatigue)\b": "clinical",
-    # Safety
-    r"\b(adverse event(s)?|safety|harms?)\b": "safety",
-    # PROs / HRQoL (QoL only here to avoid overlap with 'clinical')
-    r"\b(PROs?|PROMs?|HRQoL|EQ-5D|HUI3|quality of life|qol)\b": "pro",
-    # Workforce/retention
-    r"\b(retention|turnover)\b": "impact"
-}
-
-def _find_cues(text: Any, patterns: Dict[str, str], max_hits: int = 8) -> List[str]:
-    """Return a small set of cue labels present in text (case-insensitive). NaN-safe."""
-    if not isinstance(text, str) or not text:
-        return []
-    hits = []
-    low = text.lower()
-    for pat, label in patterns.items():
-        if re.search(pat, low):
-            hits.append(label)
-            if len(hits) >= max_hits:
-                break
-    # dedupe preserving order
-    out = []
-    for h in hits:
-        if h not in out:
-            out.append(h)
-    return out
+# Cue tables live in common/cues.py and are scanned once per abstract (shared with Stages 6 and 7).
 
 def _shorten(v: Any, n: int = 4000) -> str:
     if v is None:
@@ -106,8 +63,8 @@ def build_user_prompt(unique_id: str, title: Any, abstract: Any, metadata: Dict[
         lines.append(_shorten(abstract, 4000))
 
         # Surface detected cues to guide the model
-        comp_cues = _find_cues(abstract, _COMPARATOR_CUES)
-        out_cues = _find_cues(abstract, _OUTCOME_CUES)
+        comp_cues = cue_labels(abstract, "stage5_comparator")
+        out_cues = cue_labels(abstract, "stage5_outcome")
         if comp_cues:
             lines.append(f"\nDetected comparator cues (incl. implicit): {sorted(set(comp_cues))}")
         if out_cues:
@@ -134,6 +91,24 @@ def build_user_prompt(unique_id: str, title: Any, abstract: Any, metadata: Dict[
     )
     return "\n".join(lines)
 
+# Columns build_user_prompts reads (the --slim projection)
+PROMPT_COLUMNS = ("id", "Title", "Abstract") + HINT_KEYS
+
+def build_user_prompts(df: pd.DataFrame) -> List[str]:
+    """
+    Build all Stage 5 prompts for a DataFrame in one go.
+    Design/outcome HINT_KEYS are resolved per frame (not per row) and the text
+    per row is exactly what build_user_prompt() returns.
+    """
+    hints = hint_columns(df, HINT_KEYS)
+    ids = df["id"].tolist()
+    titles = column_values(df, "Title")
+    abstracts = column_values(df, "Abstract")
+    return [
+        build_user_prompt(ids[i], titles[i], abstracts[i], row_metadata(hints, i))
+        for i in range(len(ids))
+    ]
+
 # --- Normalization helpers ---
 
 def _norm_bool(x: Any) -> bool:
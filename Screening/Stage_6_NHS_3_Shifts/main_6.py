@@ -9,8 +9,25 @@ import time
 import argparse
 import pandas as pd
 
-from openai_client import create_openai_client, call_gpt_api
-from utils_6 import build_user_prompt, safe_json_loads, normalize_result
+from openai_client import create_openai_client, call_gpt_api, call_gpt_api_n, call_gpt_api_detailed, call_gpt_api_stream
+from utils_6 import PROMPT_COLUMNS, build_user_prompts, safe_json_loads, normalize_result
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.archive import RawArchive, archive_path  # noqa: E402
+from common.budget import BudgetStats, fit_prompts, get_tokenizer, stage_policy  # noqa: E402
+from common.compress import CompressionStats, compress_frame  # noqa: E402
+from common.consistency import VoteStats, majority_vote, sc_trigger, single_vote  # noqa: E402
+from common.decision import DECISION_MAX_TOKENS, decision_only_instruction, include_probability  # noqa: E402
+from common.early_stop import STAGE_POLICIES, StopStats, key_order_instruction, stopper, truncated_fields  # noqa: E402
+from common.fingerprint import reuse_map, stage_fingerprints, summary_line  # noqa: E402
+from common.jobqueue import LEASE_SECONDS, JobQueue  # noqa: E402
+from common.metrics import METRICS_INTERVAL, RunMetrics  # noqa: E402
+from common.profiling import PROFILE_MODES, Profiler  # noqa: E402
+from common.store import ScreeningStore  # noqa: E402
+from common.tables import TableWriter, count_rows, iter_table  # noqa: E402
+from common.trace import TraceRecorder  # noqa: E402
+from common.triage import MODEL_DIR as TRIAGE_MODEL_DIR, TriageModel, TriageStats  # noqa: E402
+from common.workers import RateBudget, Shard, run_sharded  # noqa: E402
 
 # ---- Defaults ----
 DEFAULT_INPUT = "data/sample_articles.csv"
@@ -28,8 +45,8 @@ def read_system_prompt(path: str) -> str:
 def main():
     # ---- 1. CLI args ----
     parser = argparse.ArgumentParser(description="Stage 6 screening: NHS Three Shifts")
-    parser.add_argument("--input", default=DEFAULT_INPUT, help="Path to input CSV")
-    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Path to output CSV")
+    parser.add_argument("--input", default=DEFAULT_INPUT, help="Path to input table (.csv or .parquet)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Path to output table (.csv or .parquet)")
     parser.add_argument("--system", default=DEFAULT_SYSTEM, help="Path to system prompt file")
     parser.add_argument("--model", default=DEFAULT_MODEL, help="OpenAI model name")
     parser.add_argument("--limit", type=int, default=None, help="Process only first N rows (for testing)")
@@ -38,7 +55,106 @@ def main():
         "--progress-every", type=int, default=25,
         help="Print a plain progress line every N rows"
     )
+    parser.add_argument("--slim", action="store_true",
+                        help="Read only the prompt columns (id/Title/Abstract + hints) and write only those plus this stage's results")
+    parser.add_argument("--export-csv", default=None,
+                        help="Also write a CSV copy of the output (e.g. for reviewers when --output is .parquet)")
+    parser.add_argument("--db", default=None,
+                        help="SQLite store to record this run in (articles, decisions, raw responses)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="With --db: reuse stored decisions whose input row, system prompt, utils and model are unchanged")
+    parser.add_argument("--chunk-size", type=int, default=None,
+                        help="Stream the input N rows at a time and append each chunk to the output (flat memory)")
+    parser.add_argument("--token-budget", action="store_true",
+                        help="Apply this stage's input policy (fields, boilerplate-stripped abstract, token caps) and report tokens saved")
+    parser.add_argument("--max-prompt-tokens", type=int, default=None,
+                        help="Hard cap on user-prompt tokens (implies --token-budget; default per stage in common/budget.py)")
+    parser.add_argument("--compress", action="store_true",
+                        help="Send the first sentence and cue-bearing sentences instead of the whole abstract (full abstract when confidence is low)")
+    parser.add_argument("--compress-window", type=int, default=1,
+                        help="With --compress: neighbouring sentences kept around each cue sentence")
+    parser.add_argument("--self-consistency", type=int, default=0, metavar="N",
+                        help="Adaptive voting: when the first sample is low-confidence or the guardrail flips include, ask for N more samples (one call) and take the majority")
+    parser.add_argument("--sc-threshold", type=float, default=0.7,
+                        help="With --self-consistency: re-sample when confidence_stage6 is below this")
+    parser.add_argument("--sc-temperature", type=float, default=0.7,
+                        help="With --self-consistency: sampling temperature of the extra samples")
+    parser.add_argument("--logprobs", action="store_true",
+                        help="Ask for token logprobs and record p_include_stage6 (probability of the include value token)")
+    parser.add_argument("--decision-only", action="store_true",
+                        help="Ask only for include and the fields the guardrails need (no reason text; capped output)")
+    parser.add_argument("--early-stop", nargs="?", const="stage", choices=["stage", "exclude", "always"],
+                        help="Stream the answer and cancel it once include and the required fields are known "
+                             "(exclude: only for excluded articles; always; default: the stage policy in common/early_stop.py)")
+    parser.add_argument("--metrics", action="store_true",
+                        help="Print a live [METRICS] line (articles/s, latency p50/p95, retries, 429s, tokens/s, cache and include rate, ETA)")
+    parser.add_argument("--metrics-every", type=float, default=METRICS_INTERVAL,
+                        help="Seconds between metrics snapshots")
+    parser.add_argument("--metrics-jsonl", default=None,
+                        help="Append each metrics snapshot to this JSON-lines file")
+    parser.add_argument("--metrics-prom", default=None,
+                        help="Rewrite this Prometheus textfile (node_exporter textfile collector) at each snapshot")
+    parser.add_argument("--profile", nargs="?", const="timers", choices=PROFILE_MODES,
+                        help="Time each phase (load, build, api, parse, normalize, merge, write) and print a summary; "
+                             "optionally add a stack sampler, cProfile or tracemalloc")
+    parser.add_argument("--profile-out", default=None,
+                        help="Prefix for the profile files (.folded stacks, .prof; default: profile_stage6)")
+    parser.add_argument("--trace", default=None,
+                        help="Append per-article spans (queue wait, attempts, parse, guardrails) to this OTLP/JSON-lines file; "
+                             "inspect with python -m common.trace")
+    parser.add_argument("--triage", nargs="?", const=TRIAGE_MODEL_DIR, default=None, metavar="MODEL_DIR",
+                        help="Score articles with the local triage classifier (python -m common.triage train) and send "
+                             "only the uncertain band to the API")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Screen in N processes, each on a stable hash shard of the ids; "
+                             "the output is merged in input order (same file as one process)")
+    parser.add_argument("--rpm", type=float, default=None,
+                        help="Cap API requests per minute (one budget shared by all --workers)")
+    parser.add_argument("--queue", default=None,
+                        help="Pull articles from a shared work queue (python -m common.jobqueue) instead of the "
+                             "input table; results are written back to the queue")
+    parser.add_argument("--lease-seconds", type=float, default=LEASE_SECONDS,
+                        help="With --queue: visibility timeout of a leased batch (renewed by a heartbeat while running)")
+    parser.add_argument("--archive", default=None,
+                        help="Compressed raw-response archive for python -m common.archive renormalize "
+                             "(default: <output>.raw.sqlite, or <queue>.raw.sqlite with --queue)")
+    parser.add_argument("--no-archive", action="store_true", help="Do not archive raw responses")
+    parser.add_argument("--shard", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--shard-dir", default=None, help=argparse.SUPPRESS)
     args = parser.parse_args()
+    if args.incremental and not args.db:
+        parser.error("--incremental needs --db")
+    if args.queue and args.workers > 1:
+        parser.error("--queue spreads the work already; start more runners instead of --workers")
+    if args.workers > 1 and not args.shard:
+        # Coordinator: N copies of this command on hash shards of the input, merged in input order
+        run_sharded(6, args.workers, args.input, args.output, lambda df, res: df.merge(res, on="id", how="left"),
+                    export_csv=args.export_csv, chunk_size=args.chunk_size,
+                    columns=PROMPT_COLUMNS if args.slim else None, limit=args.limit, trace=args.trace)
+        return
+    archive_file = archive_path(args, args.output)  # before a shard worker repoints the output
+    shard = Shard.from_args(6, args)
+    prof = Profiler(6, args.profile, args.profile_out)
+    triage = TriageModel.load(6, args.triage) if args.triage else None
+    triaged = TriageStats(triage) if triage else None
+    if args.early_stop and (args.logprobs or args.decision_only):
+        parser.error("--early-stop streams the full schema; use it without --logprobs/--decision-only")
+    early_policy = (STAGE_POLICIES[6] if args.early_stop == "stage" else args.early_stop) if args.early_stop else None
+    early = StopStats(6, early_policy) if early_policy else None
+    should_stop = stopper(6, early_policy, normalize_result) if early_policy else None
+    decision_suffix = decision_only_instruction(6) if args.decision_only else ""
+    if early:
+        decision_suffix = key_order_instruction(6)
+    detailed = args.logprobs or args.decision_only
+    max_tokens = DECISION_MAX_TOKENS if args.decision_only else None
+    policy = stage_policy(6, args.max_prompt_tokens) if (args.token_budget or args.max_prompt_tokens) else None
+    budget = BudgetStats(6, policy, get_tokenizer()) if policy else None
+    compress = CompressionStats(6) if args.compress else None
+    votes = VoteStats(6) if args.self_consistency > 0 else None
+    # Options that change what a stored decision holds: part of its --incremental fingerprint
+    fp_settings = {"token_budget": policy, "logprobs": args.logprobs or None}
+    fp_settings["compress_window"] = args.compress_window if compress else None
+    fp_settings["self_consistency"] = (args.self_consistency, args.sc_threshold, args.sc_temperature) if votes else None
 
     # Ensure unbuffered/line-buffered stdout so progress appears live (esp. in PowerShell)
     try:
@@ -47,61 +163,218 @@ def main():
         pass
 
     # ---- 2. Load input ----
-    df = pd.read_csv(args.input)
-    if args.limit:
-        df = df.head(args.limit).copy()
-
-    total = len(df)
+    columns = PROMPT_COLUMNS if args.slim else None
+    jobs = JobQueue(args.queue, 6, args.lease_seconds) if args.queue else None
+    if jobs:
+        total = jobs.remaining()
+    else:
+        total = shard.total(args.input, args.limit) if shard else count_rows(args.input, limit=args.limit)
     if total == 0:
         print("⚠️ No rows to process.", flush=True)
+        if shard:
+            shard.close()   # an empty shard still reports back to the coordinator
         return
 
     # ---- 3. Prep system prompt + API client ----
     system_prompt = read_system_prompt(args.system)
     client = create_openai_client()
+    metrics = None
+    if args.metrics or args.metrics_jsonl or args.metrics_prom:
+        metrics = RunMetrics(6, total, console=args.metrics, jsonl_path=args.metrics_jsonl,
+                             prom_path=args.metrics_prom, interval=args.metrics_every)
+        client = metrics.instrument(client)
+    trace = TraceRecorder(6, args.trace, model=args.model)
+    client = trace.instrument(client)
+    client = RateBudget(args.rpm, shard.rate_path if shard else None, trace).instrument(client)
+
+    # Optional SQLite store (batched writes, WAL)
+    store = ScreeningStore(args.db) if args.db else None
+    if store:
+        run_id = store.start_run(6, model=args.model, system_prompt=args.system,
+                                 input_path=args.input, output_path=args.output)
+
+    archive = RawArchive(archive_file, 6, model=args.model) if archive_file else None
+
+    # Whole input as one frame, or --chunk-size rows at a time (merged and appended per chunk)
+    writer = TableWriter(args.output)
+    csv_writer = TableWriter(args.export_csv) if args.export_csv else None
+    done = n_reused = 0
+    prof.lap("setup")
+    chunks = jobs.batches(args.chunk_size) if jobs else iter_table(args.input, args.chunk_size, columns=columns, limit=args.limit)
+    for df in chunks:
+        prof.lap("load")
+        if shard:
+            df = shard.select(df)
+            if df.empty:
+                continue
+        if store:
+            store.add_articles(df)
+            prof.lap("store")
+
+        # Build user prompts for the whole frame
+        # Optional cue-anchored extract of the abstract (flags kept per row for the A/B report)
+        if compress:
+            seen, compressed = compress_frame(df, 6, args.compress_window, compress)
+        else:
+            seen, compressed = df, None
+        if budget:
+            prompts, seen = fit_prompts(seen, build_user_prompts, policy, budget, PROMPT_COLUMNS)
+        else:
+            prompts = build_user_prompts(seen)
+
+        if decision_suffix:
+            prompts = [p + decision_suffix for p in prompts]
+
+        # Fingerprints per row; --incremental reuses decisions whose fingerprint still matches
+        ids = df["id"].tolist()
+        fps = stage_fingerprints(seen, system_prompt + decision_suffix, args.model, build_user_prompts, normalize_result,
+                                 settings=fp_settings) if store else [None] * len(df)
+        reuse = reuse_map(store.previous_decisions(6, ids), ids, fps) if args.incremental else {}
+        tri = triage.decide(df, ids) if triage else None
+        if tri:
+            triaged.add(tri)
+        local = tri.local if tri else {}
+
+        prof.lap("build")
+        trace.chunk_ready()
+        results = []
 
-    results = []
+        # ---- 4. Iterate over rows ----
+        for i, (uid, user_prompt) in enumerate(zip(ids, prompts), start=done + 1):
+            trace.begin(uid)
+            if uid in reuse:
+                raw, normalized = None, dict(reuse[uid])
+            elif uid in local:
+                raw, normalized = None, dict(local[uid])
+            else:
+                # Call GPT API
+                if early:
+                    raw, stopped = call_gpt_api_stream(client, system_prompt, user_prompt, model=args.model,
+                                                       should_stop=should_stop)
+                    tokens = None
+                    early.add(raw, stopped)
+                elif detailed:
+                    raw, tokens = call_gpt_api_detailed(client, system_prompt, user_prompt, model=args.model,
+                                                        logprobs=args.logprobs, max_tokens=max_tokens)
+                else:
+                    raw = call_gpt_api(
+                        client=client,
+                        system_prompt=system_prompt,
+                        user_prompt=user_prompt,
+                        model=args.model,
+                    )
+                    tokens = None
+                prof.lap("api")
+                trace.lap("api")
 
-    # ---- 4. Iterate over rows ----
-    for i, (idx, row) in enumerate(df.iterrows(), start=1):
-        uid = row["id"]
-        title = row.get("Title", "")
-        abstract = row.get("Abstract", "")
-        metadata = {k: (None if pd.isna(v) else v) for k, v in row.to_dict().items()}
+                # Parse + normalize output
+                # A cancelled stream keeps its complete fields; the reason is marked as truncated
+                parsed = truncated_fields(raw) if early and stopped else (safe_json_loads(raw) or {})
+                prof.lap("parse")
+                trace.parsed(raw, parsed)
+                normalized = normalize_result(parsed)
+                if args.logprobs:
+                    normalized["p_include_stage6"] = include_probability(tokens)
+                prof.lap("normalize")
+                trace.normalized(parsed, normalized)
 
-        # Build user prompt
-        user_prompt = build_user_prompt(uid, title, abstract, metadata)
+                # Adaptive self-consistency: extra samples only for weak first answers
+                if votes:
+                    trigger = sc_trigger(parsed, normalized, 6, args.sc_threshold)
+                    if trigger:
+                        extra = call_gpt_api_n(client, system_prompt, user_prompt, model=args.model,
+                                               n=args.self_consistency, temperature=args.sc_temperature)
+                        first = normalized["include_stage6"]
+                        samples = [normalized] + [normalize_result(safe_json_loads(r) or {}) for r in extra]
+                        normalized = majority_vote(samples, 6, trigger)
+                        votes.add(trigger, len(extra), normalized["include_stage6"] != first)
+                    else:
+                        single_vote(normalized, 6)
+                        votes.add(None, 0, False)
+                    prof.lap("self_consistency")
+                    trace.lap("self_consistency")
+            normalized["id"] = uid
+            if tri:
+                normalized.setdefault("p_triage_stage6", tri.p[uid])
+            if compressed is not None:
+                normalized["stage6_compressed"] = compressed[i - done - 1]
+            if archive and raw is not None:
+                archive.add(uid, raw, normalized, stopped=bool(early and stopped), samples=extra if votes and trigger else None)
+            if store:
+                # A local triage decision is no model answer: no fingerprint, so --incremental never reuses it
+                store.add_decision(run_id, 6, uid, normalized, raw=raw, prompt=user_prompt,
+                                   fingerprint=fps[i - done - 1] if uid in reuse or uid not in local else None,
+                                   reused=uid in reuse)
 
-        # Call GPT API
-        raw = call_gpt_api(
-            client=client,
-            system_prompt=system_prompt,
-            user_prompt=user_prompt,
-            model=args.model,
-        )
+            if jobs:
+                jobs.complete(uid, normalized, raw, failed=raw is None and uid not in reuse and uid not in local)
+            results.append(normalized)
 
-        # Parse + normalize output
-        parsed = safe_json_loads(raw) or {}
-        normalized = normalize_result(parsed)
-        normalized["id"] = uid
+            if metrics:
+                metrics.row(normalized.get("include_stage6"), cached=uid in reuse)
+            prof.lap("record")
 
-        results.append(normalized)
+            if args.sleep > 0 and uid not in reuse and uid not in local:
+                time.sleep(args.sleep)
+                prof.lap("sleep")
+                trace.lap("rate_limit.sleep")
+            trace.end(normalized, reused=uid in reuse)
 
-        if args.sleep > 0:
-            time.sleep(args.sleep)
+            # Progress print
+            if args.progress_every and (i % args.progress_every == 0 or i == 1 or i == total):
+                print(f"[PROGRESS] {i}/{total} (last id={uid})", flush=True)
+            prof.lap("progress")
 
-        # Progress print
-        if args.progress_every and (i % args.progress_every == 0 or i == 1 or i == total):
-            print(f"[PROGRESS] {i}/{total} (last id={uid})", flush=True)
+        if shard:
+            shard.add(results)   # merged in input order by the coordinator
+        elif not jobs:
+            # ---- 5. Merge results back ----
+            res_df = pd.DataFrame(results)
+            merged = df.merge(res_df, on="id", how="left")
+            prof.lap("merge")
 
-    # ---- 5. Merge results back ----
-    res_df = pd.DataFrame(results)
-    merged = df.merge(res_df, on="id", how="left")
+            # ---- 6. Save ----
+            writer.append(merged)
+            if csv_writer:
+                csv_writer.append(merged)
+            prof.lap("write")
+        n_reused += sum(1 for uid in ids if uid in reuse)
+        done += len(df)
 
-    # ---- 6. Save ----
-    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
-    merged.to_csv(args.output, index=False)
-    print(f"Stage 6 screening complete. Wrote: {args.output}", flush=True)
+    if shard:
+        shard.close()
+    if jobs:
+        jobs.close()
+    if archive:
+        archive.close()
+    writer.close()
+    if csv_writer:
+        csv_writer.close()
+    prof.lap("write")
+    if store:
+        store.finish_run(run_id, n_rows=total, n_reused=n_reused, n_recomputed=total - n_reused)
+        if args.incremental:
+            print(summary_line(n_reused, total - n_reused), flush=True)
+        store.close()
+    if budget:
+        print(budget.line(), flush=True)
+    if compress:
+        print(compress.line(), flush=True)
+    if votes:
+        print(votes.line(), flush=True)
+    if early:
+        print(early.line(), flush=True)
+    if triaged:
+        print(triaged.line(), flush=True)
+    if jobs:
+        print(jobs.line(), flush=True)
+    if archive:
+        print(archive.line(), flush=True)
+    if metrics:
+        metrics.snapshot()
+    prof.finish()
+    trace.close()
+    print(f"Stage 6 screening complete. Wrote: {args.output if not jobs else args.queue}", flush=True)
 
 
 if __name__ == "__main__":
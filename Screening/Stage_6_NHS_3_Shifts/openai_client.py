@@ -52,3 +52,113 @@ def call_gpt_api(client, system_prompt, user_prompt, model="gpt-4o", max_retries
 
     # If all retries failed, return None
     return None
+
+
+def call_gpt_api_n(client, system_prompt, user_prompt, model="gpt-4o", n=4, temperature=0.7, max_retries=3):
+    """
+    Ask for `n` independent samples in ONE request (the API's `n` parameter).
+    Used by the self-consistency vote; a higher temperature than call_gpt_api
+    so the samples can actually disagree.
+
+    Returns:
+        list of str: One response text per choice (empty list if all retries fail).
+    """
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+    for attempt in range(max_retries):
+        try:
+            response = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                n=n
+            )
+            return [choice.message.content for choice in response.choices]
+
+        except Exception as e:
+            print(f"[Error - Attempt {attempt + 1}] {e}")
+            time.sleep(5)
+
+    return []
+
+
+def call_gpt_api_detailed(client, system_prompt, user_prompt, model="gpt-4o", logprobs=False,
+                          top_logprobs=5, max_tokens=None, max_retries=3):
+    """
+    Like call_gpt_api, but can also ask for token logprobs and cap the output
+    length (used by --logprobs and --decision-only).
+
+    Returns:
+        (str or None, list or None): The response text and choices[0].logprobs.content
+        (None when logprobs were not requested or all retries fail).
+    """
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+    extra = {}
+    if logprobs:
+        extra["logprobs"] = True
+        extra["top_logprobs"] = top_logprobs
+    if max_tokens:
+        extra["max_tokens"] = max_tokens
+    for attempt in range(max_retries):
+        try:
+            response = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0.2,
+                **extra
+            )
+            choice = response.choices[0]
+            tokens = choice.logprobs.content if logprobs and choice.logprobs is not None else None
+            return choice.message.content, tokens
+
+        except Exception as e:
+            print(f"[Error - Attempt {attempt + 1}] {e}")
+            time.sleep(5)
+
+    return None, None
+
+
+def call_gpt_api_stream(client, system_prompt, user_prompt, model="gpt-4o", should_stop=None, max_retries=3):
+    """
+    Stream the response and cancel it as soon as should_stop(text_so_far) is True
+    (used by --early-stop once the decision fields are known).
+
+    Returns:
+        (str or None, bool): The text received and whether the stream was cancelled early.
+    """
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+    for attempt in range(max_retries):
+        try:
+            stream = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0.2,
+                stream=True
+            )
+            text = ""
+            try:
+                for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content or ""
+                    text += delta
+                    # A value is only complete once its ',' or '}' arrives
+                    if should_stop and ("," in delta or "}" in delta) and should_stop(text):
+                        return text, True
+            finally:
+                stream.close()
+            return text, False
+
+        except Exception as e:
+            print(f"[Error - Attempt {attempt + 1}] {e}")
+            time.sleep(5)
+
+    return None, False
@@ -1,8 +1,16 @@
 # utils_6.py — Stage 6 helpers: NHS Three Shifts (with main_shift)
 
 import json
+import os
+import sys
 from typing import Dict, Any, Optional, List
 
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.cues import cue_counts  # noqa: E402
+from common.frames import column_values  # noqa: E402
+
 ALLOWED = {"community": "Community", "digital": "Digital", "prevention": "Prevention"}
 
 def safe_json_loads(s: str) -> Optional[Dict[str, Any]]:
@@ -21,37 +29,6 @@ def safe_json_loads(s: str) -> Optional[Dict[str, Any]]:
     return None
 
 def build_user_prompt(unique_id: str, title: str, abstract: str, metadata: Dict[str, Any]) -> str:
-    import re
-
-    CUES = {
-        "Community": [
-            r"\bcommunity\b", r"\bprimary care\b", r"\bpharmacy\b", r"\bout[- ]of[- ]hospital\b",
-            r"\bneighbourhood\b", r"\bintegrated care\b", r"\bhome[- ]based\b", r"\bambulatory\b"
-        ],
-        "Digital": [
-            r"\bdigital\b", r"\bapp\b", r"\btele(medicine|health)\b", r"\bremote monitoring\b",
-            r"\b(virtual ward|e[- ]?health|m[- ]?health)\b", r"\bAI\b", r"\bmachine learning\b",
-            r"\belectronic (record|health record)\b"
-        ],
-        "Prevention": [
-            r"\bprevent(ion|ive|ing)?\b", r"\b(prophylaxis|prophylactic)\b", r"\bscreen(ing|ed)\b",
-            r"\bvaccin(e|ation|ated)\b", r"\brisk reduction\b", r"\bearly detection\b",
-            r"\bpre(operative|operative)\b.*\b(beta[- ]blocker|statin|antibiotic|thromboprophylaxis)\b",
-            r"\bfluoride\b", r"\bchemoprevent(ion|ive)\b", r"\brelapse prevention\b", r"\bre[- ]admission prevention\b"
-        ]
-    }
-
-    def find_hits(text: str, pats):
-        if not text:
-            return []
-        low = text.lower()
-        hits = []
-        for p in pats:
-            if re.search(p, low):
-                hits.append(p)
-        # shorten to a few
-        return hits[:6]
-
     lines = [f"ARTICLE ID: {unique_id}"]
     if title:
         lines.append(f"Title: {title}")
@@ -59,12 +36,8 @@ def build_user_prompt(unique_id: str, title: str, abstract: str, metadata: Dict[
         lines.append("Abstract:")
         lines.append(str(abstract)[:4000])
 
-        # add cue hints
-        cue_summary = {}
-        for lab, pats in CUES.items():
-            hits = find_hits(abstract, pats)
-            if hits:
-                cue_summary[lab] = len(hits)
+        # add cue hints (shift cue table lives in common/cues.py; at most 6 per shift)
+        cue_summary = cue_counts(abstract, "stage6_shift", cap=6)
         if cue_summary:
             lines.append(f"\nDetected shift cue counts (heuristic): {cue_summary}")
 
@@ -74,6 +47,14 @@ def build_user_prompt(unique_id: str, title: str, abstract: str, metadata: Dict[
     )
     return "\n".join(lines)
 
+# Columns build_user_prompts reads (the --slim projection)
+PROMPT_COLUMNS = ("id", "Title", "Abstract")
+
+def build_user_prompts(df: pd.DataFrame) -> List[str]:
+    """Build user prompts for a whole DataFrame at once (same text as build_user_prompt per row)."""
+    cols = zip(df["id"].tolist(), column_values(df, "Title"), column_values(df, "Abstract"))
+    return [build_user_prompt(uid, title, abstract, None) for uid, title, abstract in cols]
+
 
 def _norm_shift_one(s: Any) -> Optional[str]:
     if not s:
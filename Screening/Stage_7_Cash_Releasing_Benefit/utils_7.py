@@ -1,9 +1,16 @@
 # utils_7.py — Stage 7 helpers: “Explicit cash-releasing saving / positive ROI (STRICT PHRASES)”
 
 import json
-import re
+import os
+import sys
 from typing import Dict, Any, Optional, List
 
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.cues import cue_labels  # noqa: E402
+from common.frames import column_values  # noqa: E402
+
 # -------------------- Robust JSON loader --------------------
 
 def safe_json_loads(s: str) -> Optional[Dict[str, Any]]:
@@ -28,43 +35,8 @@ def safe_json_loads(s: str) -> Optional[Dict[str, Any]]:
 # Anything that looks like generic “cost-effectiveness”, “ICER/QALY”, “ROI”, “efficiency”, or vague “cost reduction”
 # is intentionally NOT captured here.
 
-_CASH_SAVING_CUES = {
-    # INCLUDE phrases (and minimal safe variants)
-    r"\bin[- ]year cost saving(s)?\b": "in_year_cost_saving",
-    r"\bin[- ]year negative net budget impact\b": "in_year_negative_net_budget_impact",
-    r"\bnegative net budget impact\b": "negative_net_budget_impact",
-    r"\bnet saving(s)?\b": "net_saving",
-    r"\bexpenditure reduction(s)?\b": "expenditure_reduction",
-    r"\bcash[- ]releasing saving(s)?\b": "cash_releasing_saving",
-    r"\bbudget impact:\s*negative\b": "negative_budget_impact_colon_form",
-    # “net benefit” is allowed per spec; restrict to avoid clinical “net benefit” by requiring nearby fiscal terms.
-    # Two-part pattern: either the exact “net benefit” phrase with a money cue nearby, or explicit “net budget benefit”.
-    r"(?:(?:net\s+benefit(?:s)?)\b(?:(?:(?!\n).){0,60})(?:£|\$|eur|euro|cost|budget|saving|expenditure|financial))": "net_benefit_with_money_cue",
-    r"\bnet budget benefit(s)?\b": "net_budget_benefit",
-}
-
-_MONEY_CUES = re.compile(r"(£|\$|eur|euro|cost|budget|saving|expenditure|financial)", re.I)
-
-def _find_cues(text: Any, patterns: Dict[str, str], max_hits: int = 12) -> List[str]:
-    """Return a small set of cue labels present in text (case-insensitive). NaN-safe."""
-    if not isinstance(text, str) or not text:
-        return []
-    hits: List[str] = []
-    low = text.lower()
-    for pat, label in patterns.items():
-        try:
-            if re.search(pat, low, flags=re.I | re.M):
-                hits.append(label)
-                if len(hits) >= max_hits:
-                    break
-        except re.error:
-            continue
-    # dedupe preserving order
-    out: List[str] = []
-    for h in hits:
-        if h not in out:
-            out.append(h)
-    return out
+# The STRICT cue table itself lives in common/cues.py (STAGE7_CASH_SAVING) so the
+# abstract is scanned once, in a single pass shared with Stages 5 and 6.
 
 def _shorten(v: Any, n: int = 4000) -> str:
     if v is None:
@@ -92,7 +64,7 @@ def build_user_prompt(unique_id: str, title: Any, abstract: Any, metadata: Dict[
         lines.append(_shorten(abstract, 4000))
 
         # Surface detected STRICT cues to guide the model
-        cues = _find_cues(abstract, _CASH_SAVING_CUES)
+        cues = cue_labels(abstract, "stage7_cash_saving")
         if cues:
             lines.append(f"\nDetected cash-saving cues (STRICT): {sorted(set(cues))}")
 
@@ -120,6 +92,26 @@ def build_user_prompt(unique_id: str, title: Any, abstract: Any, metadata: Dict[
     )
     return "\n".join(lines)
 
+# Columns build_user_prompts reads (the --slim projection)
+PROMPT_COLUMNS = ("id", "Title", "Abstract")
+
+def build_user_prompts(
+    df: pd.DataFrame,
+    id_col: str = "id",
+    title_col: str = "Title",
+    abstract_col: str = "Abstract",
+) -> List[str]:
+    """
+    Build the Stage 7 prompts for a whole DataFrame at once (honours --id-col/--title-col/--abstract-col).
+    Rows without an id column fall back to row_<index>, as the runner did.
+    """
+    if id_col in df.columns:
+        ids = df[id_col].tolist()
+    else:
+        ids = [f"row_{idx}" for idx in df.index]
+    cols = zip(ids, column_values(df, title_col), column_values(df, abstract_col))
+    return [build_user_prompt(uid, title, abstract, None) for uid, title, abstract in cols]
+
 # -------------------- Normalization --------------------
 
 def _clamp_conf(x: Any) -> float:
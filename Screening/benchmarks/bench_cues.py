@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Benchmark: single-pass cue scanner (common/cues.py) vs the old per-pattern re.search loops.
+
+Builds a synthetic corpus by re-mixing sentences from the bundled 361-article abstracts,
+plus adversarial long single-line abstracts (many "expected"/"from" cues with no closing
+"observed"/"to"), then checks both implementations agree on every article and reports
+abstracts/second.
+
+Usage (from the Screening/ folder):
+  python benchmarks/bench_cues.py --n 100000
+"""
+
+import argparse
+import csv
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.cues import CUE_TABLES, Seq, _TABLE_FLAGS, _alternatives, scan_cues  # noqa: E402
+
+DEFAULT_SOURCE = os.path.join(os.path.dirname(__file__), "..", "Stage_1_2019_2025_english", "Data", "361_articles.csv")
+
+_ADVERSARIAL = (
+    "expected ", "forecast ", "predicted ", "from ", "preoperative ", "net benefit ",
+    "baseline ", "cost ", "community ", "screening ",
+)
+
+
+def load_sentences(path: str):
+    csv.field_size_limit(10 ** 8)
+    sentences = []
+    with open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+        for row in csv.DictReader(f):
+            abstract = row.get("Abstract") or ""
+            sentences.extend(s.strip() + "." for s in abstract.split(".") if s.strip())
+    return sentences
+
+
+def synthetic_corpus(sentences, n: int, seed: int = 7, adversarial_every: int = 50):
+    """Yield n abstracts (~1.5–4k chars); every `adversarial_every`-th is a long worst case."""
+    rng = random.Random(seed)
+    for i in range(n):
+        if adversarial_every and i % adversarial_every == 0:
+            yield "".join(rng.choice(_ADVERSARIAL) for _ in range(400))
+        else:
+            yield " ".join(rng.choice(sentences) for _ in range(rng.randint(10, 25)))[:4000]
+
+
+def _legacy_pattern(alt) -> str:
+    return alt.pattern if isinstance(alt, Seq) else alt
+
+
+def legacy_scan(text: str):
+    """Reference: what utils_5/6/7 did before — one re.search per pattern, per table."""
+    low = text.lower()
+    out = {}
+    for table, rows in CUE_TABLES.items():
+        flags = _TABLE_FLAGS.get(table, 0)
+        out[table] = tuple(
+            entry for entry, (spec, _label) in enumerate(rows)
+            if any(re.search(_legacy_pattern(alt), low, flags) for alt in _alternatives(spec))
+        )
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the shared cue scanner")
+    parser.add_argument("--n", type=int, default=100_000, help="Number of synthetic abstracts")
+    parser.add_argument("--source", default=DEFAULT_SOURCE, help="CSV with an Abstract column")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--skip-legacy", action="store_true", help="Only time the new scanner")
+    args = parser.parse_args()
+
+    corpus = list(synthetic_corpus(load_sentences(args.source), args.n, seed=args.seed))
+    chars = sum(len(t) for t in corpus)
+    print(f"Corpus: {len(corpus)} abstracts, {chars / len(corpus):.0f} chars avg", flush=True)
+
+    scan_cues.cache_clear()
+    t0 = time.perf_counter()
+    new = [scan_cues(t) for t in corpus]
+    t_new = time.perf_counter() - t0
+    print(f"[single-pass] {t_new:.2f}s  ({len(corpus) / t_new:,.0f} abstracts/s)", flush=True)
+
+    # Later stages re-reading the same article hit the per-text memo
+    window = corpus[-scan_cues.cache_info().maxsize:]
+    t0 = time.perf_counter()
+    for t in window:
+        scan_cues(t)
+    t_memo = time.perf_counter() - t0
+    print(f"[memoized re-read] {len(window)} abstracts in {t_memo:.3f}s", flush=True)
+
+    if args.skip_legacy:
+        return
+
+    t0 = time.perf_counter()
+    old = [legacy_scan(t) for t in corpus]
+    t_old = time.perf_counter() - t0
+    print(f"[legacy re.search] {t_old:.2f}s  ({len(corpus) / t_old:,.0f} abstracts/s)", flush=True)
+    print(f"Speed-up: {t_old / t_new:.1f}x", flush=True)
+
+    mismatches = sum(
+        1 for a, b in zip(new, old)
+        if {k: tuple(h.entry for h in v) for k, v in a.items()} != b
+    )
+    print(f"Mismatched articles: {mismatches}", flush=True)
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+End-to-end throughput benchmark: runs the real main_N.py runners against the
+local fake OpenAI endpoint (benchmarks/fake_openai.py) and records, per
+configuration:
+
+  articles/s (wall), p50/p95/p99 call latency, requests and injected errors,
+  prompt/completion tokens per article, CPU seconds per article (runner processes)
+
+Configurations are the cross product of the swept settings:
+  --concurrency  parallel runner processes, each on its own shard of the input
+  --cache        off  = cold run;  warm = a priming --db/--incremental run first,
+                 then the timed run reuses the stored decisions
+  --chunk-size   0 = whole file, N = --chunk-size N streaming mode
+  --variant      named extra runner arguments, e.g. --variant big_chunks="--chunk-size 5000"
+                 (how any newer runner option is swept)
+  --early-stop   adds an early_stop variant (streamed, cancelled once the decision
+                 is known) and checks that its decision columns match the default
+                 non-streamed run, row for row (reason_stageN excepted); exits 1 if not
+
+Results go to benchmarks/results/e2e-<commit>-<time>.json; --compare an older
+file to print throughput deltas for matching configurations.
+
+Usage (from the Screening/ folder):
+  python benchmarks/bench_e2e.py --stages 1,5,7 --corpus bundled --latency-ms 50
+  python benchmarks/bench_e2e.py --stages 5 --corpus synthetic --n 10000,100000 \\
+      --latency-ms 0 --concurrency 1,8 --cache off,warm
+  python benchmarks/bench_e2e.py --stages 5 --compare benchmarks/results/e2e-<old>.json
+  python benchmarks/bench_e2e.py --stages 1,5 --early-stop
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCREENING = os.path.abspath(os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+sys.path.insert(0, SCREENING)
+from fake_openai import start_server  # noqa: E402
+from common.tables import count_rows, read_table  # noqa: E402
+
+STAGE_DIRS = {
+    1: "Stage_1_2019_2025_english",
+    2: "Stage_2_UK_Based_Study",
+    3: "Stage_3_Occur_In_NHS",
+    4: "Stage_4_Exclude_PEC_NonPeerReviewed",
+    5: "Stage_5_Comparator_And_Outcomes",
+    6: "Stage_6_NHS_3_Shifts",
+    7: "Stage_7_Cash_Releasing_Benefit",
+}
+
+# Bundled input each stage was validated on
+BUNDLED_INPUTS = {
+    1: "Data/361_articles.csv",
+    2: "data/361_articles_post_stage1_screen.csv",
+    3: "data/361_articles_post_stage2_screen.csv",
+    4: "data/361_articles_post_stage3_screen.csv",
+    5: "data/361_articles_post_stage4_screen.csv",
+    6: "data/361_articles_post_stage5_screen.csv",
+    7: "data/361_articles_post_stage6_screen.csv",
+}
+
+SOURCE = os.path.join(SCREENING, STAGE_DIRS[1], BUNDLED_INPUTS[1])
+
+
+def _ints(s: str) -> List[int]:
+    return [int(x) for x in s.split(",") if x.strip()]
+
+
+def _git_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SCREENING,
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def synthetic_corpus(n: int, path: str, seed: int = 7) -> str:
+    """n abstracts re-mixed from the bundled sentences (ids S0..S{n-1}); cached by path."""
+    if os.path.exists(path):
+        return path
+    csv.field_size_limit(10 ** 8)
+    titles, sentences = [], []
+    with open(SOURCE, "r", encoding="utf-8", errors="replace", newline="") as f:
+        for row in csv.DictReader(f):
+            titles.append(row.get("Title") or "")
+            sentences.extend(s.strip() + "." for s in (row.get("Abstract") or "").split(".") if s.strip())
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["id", "Year", "Title", "Abstract"])
+        for i in range(n):
+            w.writerow([f"S{i}", rng.randint(2015, 2025), rng.choice(titles),
+                        " ".join(rng.choice(sentences) for _ in range(rng.randint(6, 14)))])
+    return path
+
+
+def shard_csv(path: str, k: int, workdir: str) -> List[str]:
+    """Split a CSV into k shards by row position (row i -> shard i % k)."""
+    if k <= 1:
+        return [path]
+    csv.field_size_limit(10 ** 8)
+    outs = [os.path.join(workdir, f"shard{j}.csv") for j in range(k)]
+    handles = [open(p, "w", encoding="utf-8", newline="") for p in outs]
+    try:
+        writers = [csv.writer(h) for h in handles]
+        with open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            for w in writers:
+                w.writerow(header)
+            for i, row in enumerate(reader):
+                writers[i % k].writerow(row)
+    finally:
+        for h in handles:
+            h.close()
+    return outs
+
+
+def _cpu_children() -> float:
+    ru = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return ru.ru_utime + ru.ru_stime
+
+
+def output_path(workdir: str, tag: str, j: int) -> str:
+    return os.path.join(workdir, f"out_{tag}_{j}.csv")
+
+
+def run_shards(stage: int, jobs: List[tuple], workdir: str, env: Dict[str, str], tag: str) -> List[int]:
+    """Start one runner per (shard, extra_args) job at once, wait for all, return exit codes."""
+    procs = []
+    for j, (shard, extra) in enumerate(jobs):
+        out = output_path(workdir, tag, j)
+        cmd = [sys.executable, f"main_{stage}.py", "--input", shard, "--output", out,
+               "--progress-every", "0"] + list(extra)
+        procs.append(subprocess.Popen(cmd, cwd=os.path.join(SCREENING, STAGE_DIRS[stage]), env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True))
+    codes = []
+    for p in procs:
+        _, err = p.communicate()
+        if p.returncode:
+            sys.stderr.write(err[-2000:])
+        codes.append(p.returncode)
+    return codes
+
+
+def bench_one(server, stage: int, corpus_path: str, n_rows: int, concurrency: int, cache: str,
+              chunk_size: int, variant: str, variant_args: List[str], workdir: str) -> Dict[str, Any]:
+    env = dict(os.environ, OPENAI_BASE_URL=server.base_url, OPENAI_API_KEY="bench",
+               PYTHONUNBUFFERED="1")
+    cfg_dir = tempfile.mkdtemp(prefix=f"s{stage}_", dir=workdir)
+    shards = shard_csv(corpus_path, concurrency, cfg_dir)
+    extra = list(variant_args)
+    if chunk_size:
+        extra += ["--chunk-size", str(chunk_size)]
+    if cache == "warm":
+        # One store per shard so concurrent writers never share a file
+        jobs = [(sh, extra + ["--db", os.path.join(cfg_dir, f"store{j}.sqlite"), "--incremental"])
+                for j, sh in enumerate(shards)]
+        run_shards(stage, jobs, cfg_dir, env, "prime")
+    else:
+        jobs = [(sh, extra) for sh in shards]
+
+    server.stats.reset()
+    cpu0 = _cpu_children()
+    t0 = time.perf_counter()
+    procs_codes = run_shards(stage, jobs, cfg_dir, env, "timed")
+    wall = time.perf_counter() - t0
+    cpu = _cpu_children() - cpu0
+    s = server.stats.snapshot()
+    return {
+        "stage": stage,
+        "rows": n_rows,
+        "concurrency": concurrency,
+        "cache": cache,
+        "chunk_size": chunk_size,
+        "variant": variant,
+        "ok": all(c == 0 for c in procs_codes),
+        "wall_s": round(wall, 3),
+        "articles_per_s": round(n_rows / wall, 2) if wall > 0 else None,
+        "cpu_s": round(cpu, 3),
+        "cpu_ms_per_article": round(1000.0 * cpu / n_rows, 3) if n_rows else None,
+        "prompt_tokens_per_article": round(s["prompt_tokens"] / n_rows, 1) if n_rows else None,
+        "completion_tokens_per_article": round(s["completion_tokens"] / n_rows, 1) if n_rows else None,
+        **s,
+        "_outputs": [output_path(cfg_dir, "timed", j) for j in range(len(jobs))],
+    }
+
+
+def decision_mismatches(stage: int, base: List[str], other: List[str]) -> int:
+    """Rows whose output columns differ between two runs (reason_stageN excepted; a missing row counts)."""
+    frames = []
+    for paths in (base, other):
+        df = pd.concat([read_table(p) for p in paths if os.path.exists(p)], ignore_index=True)
+        df = df.drop(columns=[f"reason_stage{stage}"], errors="ignore").set_index("id").sort_index()
+        frames.append(df.astype(object).where(df.notna(), "").astype(str))
+    a, b = frames
+    if list(a.columns) != list(b.columns):
+        return max(len(a), len(b))
+    a, b = a.align(b, join="outer")
+    return int((a != b).any(axis=1).sum())
+
+
+def config_key(r: Dict[str, Any]) -> tuple:
+    return (r["stage"], r["corpus"], r["rows"], r["concurrency"], r["cache"], r["chunk_size"], r["variant"],
+            r["latency_ms"], r["error_rate"])
+
+
+def compare(results: List[Dict[str, Any]], old_path: str) -> None:
+    with open(old_path, "r", encoding="utf-8") as f:
+        old = {config_key(r): r for r in json.load(f)["results"]}
+    print(f"\nComparison with {old_path}:")
+    for r in results:
+        o = old.get(config_key(r))
+        if not o or not o.get("articles_per_s") or not r.get("articles_per_s"):
+            continue
+        delta = 100.0 * (r["articles_per_s"] - o["articles_per_s"]) / o["articles_per_s"]
+        print(f"  stage {r['stage']} rows={r['rows']} conc={r['concurrency']} cache={r['cache']} "
+              f"chunk={r['chunk_size']} {r['variant']}: {o['articles_per_s']} -> {r['articles_per_s']} "
+              f"articles/s ({delta:+.1f}%)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="End-to-end runner benchmark against a fake OpenAI endpoint")
+    parser.add_argument("--stages", default="1,2,3,4,5,6,7")
+    parser.add_argument("--corpus", default="bundled", choices=["bundled", "synthetic"])
+    parser.add_argument("--n", default="10000", help="Synthetic corpus sizes (comma-separated, up to 100000)")
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--concurrency", default="1", help="Parallel runner processes (comma-separated)")
+    parser.add_argument("--cache", default="off", help="off,warm")
+    parser.add_argument("--chunk-size", default="0", help="0 = whole file (comma-separated)")
+    parser.add_argument("--variant", action="append", default=[],
+                        help='NAME="--runner --args" (repeatable); default variant has no extra args')
+    parser.add_argument("--early-stop", action="store_true",
+                        help="Also run every configuration with --early-stop and check its decisions match")
+    parser.add_argument("--workdir", default=None, help="Scratch folder (default: a temp dir)")
+    parser.add_argument("--out", default=None, help="Results JSON (default benchmarks/results/e2e-<commit>-<time>.json)")
+    parser.add_argument("--compare", default=None, help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    variants = {"default": []}
+    for v in args.variant:
+        name, _, rest = v.partition("=")
+        variants[name.strip()] = shlex.split(rest)
+    if args.early_stop:
+        variants["early_stop"] = ["--early-stop"]
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_e2e_")
+    os.makedirs(workdir, exist_ok=True)
+    server = start_server(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate)
+    print(f"[BENCH] fake endpoint {server.base_url} latency={args.latency_ms}ms "
+          f"jitter={args.jitter_ms}ms errors={args.error_rate:.1%}; scratch={workdir}", flush=True)
+
+    if args.corpus == "bundled":
+        corpora = [("bundled", None)]
+    else:
+        corpora = [("synthetic", n) for n in _ints(args.n)]
+
+    results = []
+    grid = itertools.product(_ints(args.stages), corpora, _ints(args.concurrency),
+                             [c.strip() for c in args.cache.split(",")], _ints(args.chunk_size), variants.items())
+    for stage, (corpus, n), conc, cache, chunk, (vname, vargs) in grid:
+        if corpus == "bundled":
+            path = os.path.join(SCREENING, STAGE_DIRS[stage], BUNDLED_INPUTS[stage])
+        else:
+            path = synthetic_corpus(n, os.path.join(workdir, f"synthetic_{n}.csv"))
+        rows = count_rows(path)
+        r = bench_one(server, stage, path, rows, conc, cache, chunk, vname, vargs, workdir)
+        r.update({"corpus": corpus, "latency_ms": args.latency_ms, "error_rate": args.error_rate})
+        results.append(r)
+        lat = "/".join("-" if r[k] is None else f"{r[k]:g}" for k in ("latency_ms_p50", "latency_ms_p95", "latency_ms_p99"))
+        print(f"[BENCH] stage {stage} {corpus} rows={rows} conc={conc} cache={cache} chunk={chunk} {vname}: "
+              f"{r['articles_per_s']} art/s  p50/p95/p99={lat} ms  req={r['requests']} err={r['errors']}  "
+              f"tok/art={r['prompt_tokens_per_article']}+{r['completion_tokens_per_article']}  "
+              f"cpu={r['cpu_ms_per_article']}ms/art{'' if r['ok'] else '  [RUNNER FAILED]'}", flush=True)
+
+    server.shutdown()
+    mismatched = 0
+    if args.early_stop:
+        base = {config_key(dict(r, variant="default")): r for r in results if r["variant"] == "default"}
+        for r in results:
+            if r["variant"] != "early_stop":
+                continue
+            ref = base[config_key(dict(r, variant="default"))]
+            r["early_stop_mismatches"] = decision_mismatches(r["stage"], ref["_outputs"], r["_outputs"])
+            mismatched += r["early_stop_mismatches"]
+            print(f"[BENCH] early-stop stage {r['stage']} conc={r['concurrency']} cache={r['cache']} "
+                  f"chunk={r['chunk_size']}: {r['early_stop_mismatches']}/{r['rows']} rows differ from the "
+                  f"non-streamed run; completion tokens/article {ref['completion_tokens_per_article']} -> "
+                  f"{r['completion_tokens_per_article']}", flush=True)
+    for r in results:
+        r.pop("_outputs")
+    commit = _git_commit()
+    out = args.out or os.path.join(HERE, "results", f"e2e-{commit}-{time.strftime('%Y%m%dT%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    meta = {
+        "commit": commit,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "argv": sys.argv[1:],
+    }
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2)
+    print(f"[BENCH] wrote {out}", flush=True)
+
+    if args.compare:
+        compare(results, args.compare)
+    if mismatched:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the per-article CPU hot paths in every stage's utils_N.py:
+
+  build_user_prompt   (Stages 5-7 include the common/cues.py scan, run cold)
+  scan_cues           (the shared single-pass cue scanner, cache bypassed)
+  safe_json_loads     (clean JSON, prose-wrapped JSON -> brace fallback, garbage)
+  normalize_result    (typical and messy model output; Stage 5 _normalize_outcomes alone too)
+
+Each case runs over a list of inputs: realistic abstracts from the bundled CSVs,
+or adversarial long inputs (50k-char cue-dense abstracts, unbalanced braces,
+long outcome lists). A repeat times one full pass; the report gives min/median
+microseconds per call plus tracemalloc peak and allocated KiB per pass.
+
+Regression gate: --save writes a baseline, --baseline compares against one and
+exits 1 when a case's median is more than --threshold (default 25%) slower
+and at least --min-delta-us slower in absolute terms (sub-microsecond noise).
+
+Usage (from the Screening/ folder):
+  python benchmarks/bench_utils.py --save benchmarks/results/utils-baseline.json
+  python benchmarks/bench_utils.py --baseline benchmarks/results/utils-baseline.json --threshold 0.25
+  python benchmarks/bench_utils.py --filter stage5
+"""
+
+import argparse
+import gc
+import importlib
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCREENING = os.path.abspath(os.path.join(HERE, ".."))
+sys.path.insert(0, SCREENING)
+from common.cues import scan_cues  # noqa: E402
+
+STAGE_DIRS = {
+    1: "Stage_1_2019_2025_english",
+    2: "Stage_2_UK_Based_Study",
+    3: "Stage_3_Occur_In_NHS",
+    4: "Stage_4_Exclude_PEC_NonPeerReviewed",
+    5: "Stage_5_Comparator_And_Outcomes",
+    6: "Stage_6_NHS_3_Shifts",
+    7: "Stage_7_Cash_Releasing_Benefit",
+}
+SOURCE = os.path.join(SCREENING, STAGE_DIRS[1], "Data", "361_articles.csv")
+
+
+class Case(NamedTuple):
+    name: str
+    fn: Callable[[Any], Any]
+    inputs: List[Any]
+    setup: Optional[Callable[[], None]] = None
+
+
+def load_utils(stage: int):
+    path = os.path.join(SCREENING, STAGE_DIRS[stage])
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    return importlib.import_module(f"utils_{stage}")
+
+
+# -------------------- Inputs --------------------
+
+def realistic_articles() -> pd.DataFrame:
+    return pd.read_csv(SOURCE)
+
+
+def adversarial_abstracts(n: int = 20, length: int = 50_000, seed: int = 3) -> List[str]:
+    """Long single-paragraph abstracts dense with cue openers that rarely close."""
+    words = ["expected", "forecast", "from", "baseline", "cost", "community", "screening", "digital",
+             "prevention", "readmission", "savings", "versus", "control", "pre", "post", "net", "benefit"]
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        parts, size = [], 0
+        while size < length:
+            w = rng.choice(words)
+            parts.append(w)
+            size += len(w) + 1
+        out.append(" ".join(parts))
+    return out
+
+
+def model_outputs(df: pd.DataFrame) -> Dict[str, List[str]]:
+    """Raw response strings in the shapes safe_json_loads meets in practice."""
+    rng = random.Random(5)
+    clean = []
+    for _ in range(len(df)):
+        clean.append(json.dumps({
+            "include": rng.random() < 0.5, "reason": "x" * rng.randint(50, 250),
+            "confidence": round(rng.random(), 2), "detected_outcomes": ["cost", "clinical"],
+        }))
+    wrapped = [f"Here is my assessment:\n```json\n{c}\n```\nLet me know if you need more." for c in clean]
+    garbage = ["{" * 5000 + "not json" + "}" * 4999, "no braces at all " * 500, "{\"include\": tru" * 300] * 10
+    return {"clean": clean, "wrapped": wrapped, "garbage": garbage}
+
+
+def parsed_objects(rng: random.Random, n: int, messy: bool) -> List[Dict[str, Any]]:
+    out = []
+    outcome_words = ["cost-effectiveness (ICER)", "quality-adjusted life years", "30-day readmission",
+                     "length of stay", "all-cause mortality", "adverse events", "EQ-5D", "staff turnover",
+                     "uptake", "budget impact", "HbA1c", "patient satisfaction"]
+    for _ in range(n):
+        obj = {
+            "include": rng.choice([True, False, "true", "no"]) if messy else rng.random() < 0.5,
+            "reason": "r" * (2000 if messy else 120),
+            "confidence": rng.choice(["0.8", 1.7, -1, "high", None]) if messy else round(rng.random(), 2),
+            "detected_language": rng.choice(["English", "english ", "EN", "fr"]),
+            "publication_year": rng.choice([2019, "2021", "c. 2020", None]),
+            "detected_setting": rng.choice(["UK", "United Kingdom (England)", "Scotland", "USA", ""]),
+            "detected_context": rng.choice(["NHS", "nhs trust", "Private", "Unknown"]),
+            "publication_type": rng.choice(["Peer-reviewed", "conference abstract", "PEC", "other"]),
+            "has_comparator": rng.choice([True, "yes", "0"]),
+            "detected_comparator": rng.choice(["usual care", "before/after design", "placebo", None]),
+            "has_primary_outcomes": rng.choice([True, False, "y"]),
+            "detected_outcomes": (", ".join(rng.choices(outcome_words, k=40)) if messy
+                                  else rng.sample(outcome_words, k=3)),
+            "main_shift": rng.choice(["Community", "digital", "Prevention ", "hospital"]),
+            "shifts_detected": rng.sample(["Community", "digital", "prevention", "other"], k=2),
+            "cash_releasing": rng.choice([True, False]),
+            "cash_saving_terms": rng.sample(["cost saving", "release", "ROI", "bed days"], k=2),
+        }
+        out.append(obj)
+    return out
+
+
+# -------------------- Cases --------------------
+
+def build_cases(only: Optional[str]) -> List[Case]:
+    df = realistic_articles()
+    abstracts = [a if isinstance(a, str) else "" for a in df["Abstract"].tolist()]
+    titles = [t if isinstance(t, str) else "" for t in df["Title"].tolist()]
+    long_abs = adversarial_abstracts()
+    outs = model_outputs(df)
+    rng = random.Random(11)
+    typical = parsed_objects(rng, len(df), messy=False)
+    messy = parsed_objects(rng, len(df), messy=True)
+    cold = scan_cues.cache_clear
+
+    cases: List[Case] = [
+        Case("cues.scan_cues/realistic", scan_cues.__wrapped__, abstracts),
+        Case("cues.scan_cues/adversarial_50k", scan_cues.__wrapped__, long_abs),
+    ]
+    for stage in range(1, 8):
+        u = load_utils(stage)
+        rows = list(zip(df["id"].tolist(), df["Year"].tolist(), titles, abstracts))
+        long_rows = [(f"L{i}", 2020, "t", a) for i, a in enumerate(long_abs)]
+        if stage == 1:
+            def bup(r, u=u):
+                return u.build_user_prompt(r[0], r[1], r[2], r[3])
+        else:
+            def bup(r, u=u):
+                return u.build_user_prompt(r[0], r[2], r[3], {})
+        pre = f"stage{stage}."
+        cases += [
+            Case(pre + "build_user_prompt/realistic", bup, rows, cold),
+            Case(pre + "build_user_prompt/adversarial_50k", bup, long_rows, cold),
+            Case(pre + "safe_json_loads/clean", u.safe_json_loads, outs["clean"]),
+            Case(pre + "safe_json_loads/wrapped", u.safe_json_loads, outs["wrapped"]),
+            Case(pre + "safe_json_loads/garbage", u.safe_json_loads, outs["garbage"]),
+            Case(pre + "normalize_result/typical", u.normalize_result, typical),
+            Case(pre + "normalize_result/messy", u.normalize_result, messy),
+        ]
+        if stage == 5:
+            cases += [
+                Case(pre + "_normalize_outcomes/typical", u._normalize_outcomes, [o["detected_outcomes"] for o in typical]),
+                Case(pre + "_normalize_outcomes/messy_40_terms", u._normalize_outcomes, [o["detected_outcomes"] for o in messy]),
+            ]
+    if only:
+        cases = [c for c in cases if only in c.name]
+    return cases
+
+
+# -------------------- Runner --------------------
+
+def time_case(case: Case, repeats: int, min_pass_s: float) -> Dict[str, Any]:
+    fn, inputs = case.fn, case.inputs
+
+    def one_pass() -> float:
+        if case.setup:
+            case.setup()
+        t0 = time.perf_counter()
+        for x in inputs:
+            fn(x)
+        return time.perf_counter() - t0
+
+    one_pass()  # warm-up (imports, regex compilation)
+    # Loop the pass until it lasts at least min_pass_s so short cases are measurable
+    loops = 1
+    while True:
+        t = sum(one_pass() for _ in range(loops))
+        if t >= min_pass_s or loops >= 1000:
+            break
+        loops *= 2
+    gc_was = gc.isenabled()
+    gc.disable()
+    try:
+        per_call = []
+        for _ in range(repeats):
+            t = sum(one_pass() for _ in range(loops))
+            per_call.append(1e6 * t / (loops * len(inputs)))
+    finally:
+        if gc_was:
+            gc.enable()
+
+    if case.setup:
+        case.setup()
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.take_snapshot()
+    for x in inputs:
+        fn(x)
+    _, peak = tracemalloc.get_traced_memory()
+    diff = tracemalloc.take_snapshot().compare_to(base, "filename")
+    tracemalloc.stop()
+    allocated = sum(s.size_diff for s in diff if s.size_diff > 0)
+
+    return {
+        "name": case.name,
+        "calls_per_pass": len(inputs),
+        "us_per_call_min": round(min(per_call), 3),
+        "us_per_call_median": round(statistics.median(per_call), 3),
+        "peak_kib_per_pass": round(peak / 1024.0, 1),
+        "retained_kib_per_pass": round(allocated / 1024.0, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for utils_N hot paths")
+    parser.add_argument("--filter", default=None, help="Only cases whose name contains this text")
+    parser.add_argument("--repeats", type=int, default=7)
+    parser.add_argument("--min-pass-ms", type=float, default=50.0, help="Minimum timed duration per repeat")
+    parser.add_argument("--save", default=None, help="Write results JSON (use as a baseline later)")
+    parser.add_argument("--baseline", default=None, help="Baseline JSON to compare medians against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown vs baseline (0.25 = 25%%)")
+    parser.add_argument("--min-delta-us", type=float, default=1.0, help="Ignore slowdowns smaller than this per call")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'case':52s} {'calls':>6s} {'min us':>10s} {'median us':>10s} {'peak KiB':>9s} {'kept KiB':>9s}")
+    for case in build_cases(args.filter):
+        r = time_case(case, args.repeats, args.min_pass_ms / 1000.0)
+        results.append(r)
+        print(f"{r['name']:52s} {r['calls_per_pass']:6d} {r['us_per_call_min']:10.2f} "
+              f"{r['us_per_call_median']:10.2f} {r['peak_kib_per_pass']:9.1f} {r['retained_kib_per_pass']:9.1f}",
+              flush=True)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}, f, indent=2)
+        print(f"Saved {args.save}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            base = {r["name"]: r for r in json.load(f)["results"]}
+        regressions = []
+        for r in results:
+            b = base.get(r["name"])
+            if not b:
+                continue
+            ratio = r["us_per_call_median"] / max(b["us_per_call_median"], 1e-9)
+            delta = r["us_per_call_median"] - b["us_per_call_median"]
+            if ratio > 1.0 + args.threshold and delta >= args.min_delta_us:
+                regressions.append((r["name"], b["us_per_call_median"], r["us_per_call_median"], ratio))
+        if regressions:
+            print(f"\nREGRESSIONS (> {args.threshold:.0%} slower than {args.baseline}):")
+            for name, old, new, ratio in regressions:
+                print(f"  {name}: {old:.2f} -> {new:.2f} us/call (x{ratio:.2f})")
+            sys.exit(1)
+        print(f"\nNo case slower than baseline by more than {args.threshold:.0%}.")
+
+
+if __name__ == "__main__":
+    main()
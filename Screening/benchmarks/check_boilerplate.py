@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Regression check for common/budget.py strip_boilerplate (--token-budget).
+
+Structured-abstract headings and the trailing copyright/publisher block must go;
+ordinary words that happen to be heading names ("...community setting.", "...the
+results."), enumerations like "(a) ... (b) ... (c) ..." and "published by" /
+"copyright" inside a sentence must stay.
+
+Usage (from the Screening/ folder):
+  python benchmarks/check_boilerplate.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.budget import strip_boilerplate  # noqa: E402
+
+CASES = [
+    # (input, expected, copyright)
+    ("Patients were seen in an NHS community setting. Costs fell by 10%.",
+     "Patients were seen in an NHS community setting. Costs fell by 10%.", True),
+    ("We compare the results. Savings were small.",
+     "We compare the results. Savings were small.", True),
+    ("These are our findings. The design. The aims. One method.",
+     "These are our findings. The design. The aims. One method.", True),
+    ("BACKGROUND: Falls are costly. METHODS. We ran a trial. Results: Costs fell. CONCLUSIONS: Worth it.",
+     "Falls are costly. We ran a trial. Costs fell. Worth it.", True),
+    ("Background:\nFalls are costly.\nSETTING : Community care.",
+     "Falls are costly. Community care.", True),
+    ("Options were (a) home care, (b) day care and (c) hospital care. Costs fell.",
+     "Options were (a) home care, (b) day care and (c) hospital care. Costs fell.", True),
+    ("Costs fell. © 2021 The Authors. Published by Elsevier Ltd. All rights reserved.",
+     "Costs fell.", True),
+    ("Costs fell. Copyright © 2020 Wiley Periodicals LLC",
+     "Costs fell.", True),
+    ("Costs fell. © 2021 The Authors.",
+     "Costs fell. © 2021 The Authors.", False),
+    ("Costs fell. © 2020 Elsevier B.V. All rights reserved.",
+     "Costs fell.", True),
+    ("Costs fell. Published by Elsevier Ltd. All rights reserved.",
+     "Costs fell.", True),
+    # publisher / copyright wording inside the abstract is evidence, not boilerplate
+    ("The guidance published by NICE in 2019 recommends annual screening. Costs fell.",
+     "The guidance published by NICE in 2019 recommends annual screening. Costs fell.", True),
+    ("Prescription drug and population data published by the NHS were used to derive the per person per month costs.",
+     "Prescription drug and population data published by the NHS were used to derive the per person per month costs.", True),
+    ("Costs were modelled on 2019 tariffs, copyright 2020 data aside. Savings were small.",
+     "Costs were modelled on 2019 tariffs, copyright 2020 data aside. Savings were small.", True),
+    ("Published by NHS England, the tariff sets prices. Costs fell.",
+     "Published by NHS England, the tariff sets prices. Costs fell.", True),
+]
+
+
+def main() -> int:
+    failed = 0
+    for text, expected, copyright in CASES:
+        got = strip_boilerplate(text, copyright)
+        if got != expected:
+            failed += 1
+            print(f"FAIL {text!r}\n  expected {expected!r}\n  got      {got!r}")
+    print(f"{len(CASES) - failed}/{len(CASES)} boilerplate cases pass")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
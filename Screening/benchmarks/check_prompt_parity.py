@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Parity + timing check: build_user_prompts(df) (batch) vs build_user_prompt per row (old runner loop).
+
+For each stage it loads the bundled stage input, adds synthetic metadata hint columns
+(strings, numbers, NaN, empty strings, long values) so the hint paths are exercised,
+optionally replicates rows up to --rows, and asserts every prompt is byte-identical.
+
+Usage (from the Screening/ folder):
+  python benchmarks/check_prompt_parity.py --rows 20000
+"""
+
+import argparse
+import importlib
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+SCREENING_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+STAGES = {
+    1: ("Stage_1_2019_2025_english", "Data/361_articles.csv"),
+    2: ("Stage_2_UK_Based_Study", "data/361_articles_post_stage1_screen.csv"),
+    3: ("Stage_3_Occur_In_NHS", "data/361_articles_post_stage2_screen.csv"),
+    4: ("Stage_4_Exclude_PEC_NonPeerReviewed", "data/361_articles_post_stage3_screen.csv"),
+    5: ("Stage_5_Comparator_And_Outcomes", "data/361_articles_post_stage4_screen.csv"),
+    6: ("Stage_6_NHS_3_Shifts", "data/361_articles_post_stage5_screen.csv"),
+    7: ("Stage_7_Cash_Releasing_Benefit", "data/361_articles_post_stage6_screen.csv"),
+}
+
+
+def load_stage_utils(n: int):
+    folder = os.path.join(SCREENING_DIR, STAGES[n][0])
+    sys.path.insert(0, folder)
+    try:
+        sys.modules.pop(f"utils_{n}", None)
+        return importlib.import_module(f"utils_{n}")
+    finally:
+        sys.path.remove(folder)
+
+
+def with_hint_columns(df: pd.DataFrame, keys, seed: int = 0) -> pd.DataFrame:
+    """Add hint columns mixing text, numbers, NaN, '' and over-long values."""
+    rng = random.Random(seed)
+    choices = ["England", "NHS Trust", "", np.nan, 42, 3.5, "x" * 500, "Primary care; community"]
+    df = df.copy()
+    for k in keys:
+        df[k] = [rng.choice(choices) for _ in range(len(df))]
+    return df
+
+
+def per_row_prompts(u, n: int, df: pd.DataFrame):
+    """What main_N.py did before: iterrows + to_dict + pd.isna per row."""
+    out = []
+    for idx, row in df.iterrows():
+        metadata = {k: (None if pd.isna(v) else v) for k, v in row.to_dict().items()}
+        if n == 1:
+            out.append(u.build_user_prompt(row["id"], row.get("Year", ""), row.get("Title", ""), row.get("Abstract", "")))
+        elif n == 7:
+            out.append(u.build_user_prompt(row.get("id", f"row_{idx}"), row.get("Title", ""), row.get("Abstract", ""), metadata))
+        else:
+            out.append(u.build_user_prompt(row["id"], row.get("Title", ""), row.get("Abstract", ""), metadata))
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Batch vs per-row prompt parity check")
+    parser.add_argument("--rows", type=int, default=None, help="Replicate each stage input up to N rows")
+    parser.add_argument("--stages", default="1,2,3,4,5,6,7")
+    args = parser.parse_args()
+
+    failed = False
+    for n in [int(s) for s in args.stages.split(",")]:
+        u = load_stage_utils(n)
+        df = pd.read_csv(os.path.join(SCREENING_DIR, *STAGES[n]))
+        keys = getattr(u, "UK_HINT_KEYS", None) or getattr(u, "HINT_KEYS", ())
+        df = with_hint_columns(df, keys, seed=n)
+        if args.rows and args.rows > len(df):
+            df = pd.concat([df] * (args.rows // len(df) + 1), ignore_index=True).head(args.rows)
+
+        t0 = time.perf_counter()
+        old = per_row_prompts(u, n, df)
+        t_old = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        new = u.build_user_prompts(df)
+        t_new = time.perf_counter() - t0
+
+        diff = sum(a != b for a, b in zip(old, new)) + abs(len(old) - len(new))
+        failed |= diff > 0
+        print(
+            f"Stage {n}: {len(df)} rows  per-row {t_old:.2f}s  batch {t_new:.2f}s  "
+            f"({t_old / max(t_new, 1e-9):.1f}x)  mismatches={diff}",
+            flush=True,
+        )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
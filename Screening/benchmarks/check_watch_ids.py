@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Regression check for the watch-folder ledger's duplicate detection (common/watch.py).
+
+Two RIS exports that both number their only record "ID  - 1" but hold different
+papers must both be screened, under different ids; the same paper dropped
+again with another record number must not be.
+
+Usage (from the Screening/ folder):
+  python benchmarks/check_watch_ids.py
+"""
+
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.references import read_references  # noqa: E402
+from common.watch import Ledger  # noqa: E402
+
+RIS = """TY  - JOUR
+ID  - {rid}
+TI  - {title}
+AB  - {title}. A costing study in English community services.
+PY  - 2021
+DO  - {doi}
+ER  -
+"""
+
+FILES = [
+    # (name, record number, title, doi, expected new records)
+    ("w1.ris", 1, "Virtual wards for frail older people in the NHS", "10.1000/ward.1", 1),
+    ("w2.ris", 1, "Community pharmacy hypertension case finding", "10.1000/pharm.2", 1),
+    ("w3.ris", 7, "Virtual wards for frail older people in the NHS", "10.1000/ward.1", 0),
+]
+
+
+def main() -> int:
+    failed = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        ledger = Ledger(os.path.join(tmp, "watch.sqlite"))
+        ids = []
+        for name, rid, title, doi, expected in FILES:
+            path = os.path.join(tmp, name)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(RIS.format(rid=rid, title=title, doi=doi))
+            df = read_references(path)
+            new = ledger.new_records(df, {})
+            if len(new) != expected:
+                failed += 1
+                print(f"FAIL {name}: expected {expected} new, got {len(new)}")
+            if not new.empty:
+                ledger.record(new, new, pd.Series(True, index=new.index), [], name)
+                ids.extend(new["id"].tolist())
+        rows = ledger.counts()["screened"]
+        if rows != 2 or len(set(ids)) != 2:
+            failed += 1
+            print(f"FAIL ledger holds {rows} screened records with ids {ids}, expected 2 distinct")
+        ledger.close()
+    print(f"{len(FILES) + 1 - failed}/{len(FILES) + 1} watch-ledger checks pass")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
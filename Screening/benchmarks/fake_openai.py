@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Local fake OpenAI endpoint for benchmarks (POST /v1/chat/completions).
+
+Answers every stage's schema with one deterministic JSON object per prompt
+(include ~60% of the time), after an injected latency, and fails a configurable
+fraction of requests with HTTP 429/500 so client retries are exercised.
+With "stream": true (the runners' --early-stop) the answer is sent as SSE
+chat.completion.chunk events: half the latency before the first chunk, the rest
+spread over the chunks, so a stream the client cancels early finishes sooner.
+The runners reach it through OPENAI_BASE_URL, which the openai client honours.
+
+Usage (from the Screening/ folder):
+  python benchmarks/fake_openai.py --port 8099 --latency-ms 300 --jitter-ms 100 --error-rate 0.02
+  $env:OPENAI_BASE_URL = "http://127.0.0.1:8099/v1"
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+_OUTCOMES = ["cost", "utilization", "clinical", "pro", "safety"]
+_SHIFTS = ["Community", "Digital", "Prevention"]
+STREAM_CHUNK = 12   # characters per streamed delta (a few tokens)
+
+# Answer-format instructions appended by --early-stop / --decision-only; the decision
+# is drawn from the article part only, so every mode gets the same answer
+_INSTRUCTIONS = re.compile(r"\n\n(?:KEY ORDER:|OUTPUT \(decision only\):).*\Z", re.S)
+
+
+def estimate_tokens(text: str) -> int:
+    """~4 characters per token; close enough for throughput accounting."""
+    return max(1, len(text) // 4)
+
+
+def fake_decision(prompt: str) -> Dict[str, Any]:
+    """Superset of every stage's JSON fields, derived from the prompt text (reason last)."""
+    article = _INSTRUCTIONS.sub("", prompt)
+    r = random.Random(int(hashlib.sha1(article.encode("utf-8")).hexdigest()[:12], 16))
+    include = r.random() < 0.6
+    return {
+        "include": include,
+        "confidence": round(0.5 + r.random() / 2, 2),
+        "detected_language": "English",
+        "publication_year": 2021,
+        "detected_setting": "UK" if include else "Non-UK",
+        "detected_context": "NHS" if include else "Other",
+        "publication_type": "Peer-reviewed" if include else "Other",
+        "has_comparator": include,
+        "detected_comparator": "Usual care" if include else "Unknown",
+        "has_primary_outcomes": include,
+        "detected_outcomes": r.sample(_OUTCOMES, k=r.randint(0, 3)),
+        "main_shift": r.choice(_SHIFTS),
+        "shifts_detected": r.sample(_SHIFTS, k=r.randint(1, 2)),
+        "cash_releasing": include and r.random() < 0.3,
+        "cash_saving_terms": ["cost saving"] if include else [],
+        "reason": "benchmark fake: " + ("meets" if include else "fails") + " the stage criterion",
+    }
+
+
+class FakeStats:
+    """Thread-safe request accounting (reset between benchmark configurations)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.latencies: List[float] = []
+            self.requests = 0
+            self.errors = 0
+            self.prompt_tokens = 0
+            self.completion_tokens = 0
+            self.prompts_seen: Dict[str, int] = {}
+
+    def record(self, latency: float, error: bool, prompt: str, p_tok: int, c_tok: int) -> None:
+        key = hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+        with self.lock:
+            self.requests += 1
+            self.errors += int(error)
+            self.latencies.append(latency)
+            if not error:
+                self.prompt_tokens += p_tok
+                self.completion_tokens += c_tok
+            self.prompts_seen[key] = self.prompts_seen.get(key, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            lat = sorted(self.latencies)
+            distinct = len(self.prompts_seen)
+
+            def pct(p: float) -> Optional[float]:
+                if not lat:
+                    return None
+                return round(lat[min(len(lat) - 1, int(p * len(lat)))] * 1000.0, 2)
+
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "retried_prompts": sum(1 for v in self.prompts_seen.values() if v > 1),
+                "distinct_prompts": distinct,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "latency_ms_p50": pct(0.50),
+                "latency_ms_p95": pct(0.95),
+                "latency_ms_p99": pct(0.99),
+            }
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, addr: Tuple[str, int], latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 error_rate: float = 0.0, seed: int = 0):
+        super().__init__(addr, _Handler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.stats = FakeStats()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def draw(self) -> Tuple[float, int]:
+        """(delay in seconds, injected HTTP error code or 0)."""
+        with self.rng_lock:
+            delay = max(0.0, self.rng.gauss(self.latency_ms, self.jitter_ms) if self.jitter_ms else self.latency_ms)
+            fail = 0
+            if self.rng.random() < self.error_rate:
+                fail = 429 if self.rng.random() < 0.5 else 500
+        return delay / 1000.0, fail
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True   # headers and body go out in separate writes; avoid the 40 ms delayed-ACK stall
+
+    def log_message(self, fmt: str, *args: Any) -> None:  # keep benchmark output clean
+        pass
+
+    def _send(self, code: int, body: Dict[str, Any]) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, content: str, model: str, spread: float) -> int:
+        """Send content as SSE chunks; returns the characters delivered before the client hung up."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def event(delta: Dict[str, Any], finish: Optional[str] = None) -> bytes:
+            chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+            return b"data: " + json.dumps(chunk).encode("utf-8") + b"\n\n"
+
+        pieces = [content[i:i + STREAM_CHUNK] for i in range(0, len(content), STREAM_CHUNK)]
+        sent = 0
+        try:
+            for k, piece in enumerate(pieces):
+                self.wfile.write(event({"role": "assistant", "content": piece} if k == 0 else {"content": piece}))
+                self.wfile.flush()
+                sent += len(piece)
+                time.sleep(spread / len(pieces))
+            self.wfile.write(event({}, "stop") + b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):   # the client cancelled the stream
+            pass
+        return sent
+
+    def do_POST(self) -> None:
+        t0 = time.perf_counter()
+        length = int(self.headers.get("Content-Length") or 0)
+        req = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send(404, {"error": {"message": "unknown path " + self.path}})
+            return
+        server: FakeOpenAIServer = self.server  # type: ignore[assignment]
+        messages = req.get("messages") or []
+        prompt = "\n".join(str(m.get("content", "")) for m in messages)
+        user = str(messages[-1].get("content", "")) if messages else ""
+        delay, fail = server.draw()
+        stream = bool(req.get("stream"))
+        time.sleep(delay / 2 if stream and not fail else delay)
+        p_tok = estimate_tokens(prompt)
+        if fail:
+            server.stats.record(time.perf_counter() - t0, True, user, p_tok, 0)
+            self._send(fail, {"error": {"message": "injected failure", "type": "server_error"}})
+            return
+        content = json.dumps(fake_decision(user))
+        if stream:
+            sent = self._stream(content, req.get("model", "fake"), delay / 2)
+            server.stats.record(time.perf_counter() - t0, False, user, p_tok, estimate_tokens(content[:sent]))
+            return
+        n = max(1, int(req.get("n") or 1))
+        c_tok = estimate_tokens(content) * n
+        server.stats.record(time.perf_counter() - t0, False, user, p_tok, c_tok)
+        self._send(200, {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": req.get("model", "fake"),
+            "choices": [
+                {"index": k, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+                for k in range(n)
+            ],
+            "usage": {"prompt_tokens": p_tok, "completion_tokens": c_tok, "total_tokens": p_tok + c_tok},
+        })
+
+
+def start_server(host: str = "127.0.0.1", port: int = 0, **kwargs: Any) -> FakeOpenAIServer:
+    """Start a fake endpoint on a background thread (port 0 = pick a free port)."""
+    server = FakeOpenAIServer((host, port), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local fake OpenAI chat-completions endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="Mean injected latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=50.0, help="Std-dev of the injected latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with 429/500")
+    args = parser.parse_args()
+    server = FakeOpenAIServer((args.host, args.port), latency_ms=args.latency_ms,
+                              jitter_ms=args.jitter_ms, error_rate=args.error_rate)
+    print(f"Fake OpenAI endpoint on {server.base_url} (Ctrl+C to stop)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
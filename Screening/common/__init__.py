@@ -0,0 +1,5 @@
+# common — helpers shared by the Stage 1–7 screening runners.
+#
+# Each stage folder stays independently runnable; stage modules put the
+# Screening/ directory on sys.path and import from here, e.g.
+#   from common.cues import cue_labels
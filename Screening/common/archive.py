@@ -0,0 +1,333 @@
+# archive.py — Compressed side-car archive of raw model responses, and offline renormalization
+#
+# Every runner writes each fresh model answer (not --incremental reuse or
+# --triage local decisions, which have none) to an archive next to its output:
+#   screen_stage5.csv  ->  screen_stage5.raw.sqlite      (--archive PATH / --no-archive)
+# One row per (stage, id), the latest run winning, holding the raw response,
+# the extra --self-consistency samples, whether an --early-stop stream was
+# cancelled, and the decision row as written. Blobs are zlib-compressed against a
+# per-stage preset dictionary (the stage's system prompt, which names every field
+# and allowed value), so short JSON answers compress well; the dictionary is
+# stored in the archive, so a later prompt edit does not break old rows.
+#
+# renormalize re-applies the stage's *current* utils_N.normalize_result to the
+# archived responses — the same replay the runner does (truncated_fields for
+# cancelled streams, majority_vote over the stored samples) — and reports which
+# decisions flip, with no API calls. Use it after editing a guardrail, e.g.
+# Stage 5's outcome inference, Stage 3's Unknown-context exclusion or Stage 6's
+# main_shift fallback.
+#
+# Usage (from the Screening/ folder):
+#   python -m common.archive stats --archive Stage_5_Comparator_And_Outcomes/data/screen_stage5.raw.sqlite
+#   python -m common.archive show --archive .../screen_stage5.raw.sqlite --id J500
+#   python -m common.archive renormalize --archive .../screen_stage5.raw.sqlite --flips flips_stage5.csv
+#   python -m common.archive renormalize --archive .../screen_stage5.raw.sqlite \
+#          --table .../screen_stage5.csv --write .../screen_stage5_renormalized.csv
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+import zlib
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+
+import pandas as pd
+
+from common.consistency import majority_vote
+from common.early_stop import truncated_fields
+from common.stages import STAGES, load_utils, read_system_prompt
+from common.store import clean, json_default
+from common.tables import read_table, write_table
+
+BATCH_SIZE = 200
+ZDICT_BYTES = 32768  # zlib's preset dictionary window
+LEVEL = 9
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dictionaries (
+    stage INTEGER PRIMARY KEY,
+    zdict BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS responses (
+    stage INTEGER NOT NULL,
+    id TEXT NOT NULL,
+    model TEXT,
+    archived_at REAL NOT NULL,
+    stopped INTEGER NOT NULL DEFAULT 0,
+    raw BLOB NOT NULL,
+    samples BLOB,
+    fields BLOB NOT NULL,
+    PRIMARY KEY (stage, id)
+) WITHOUT ROWID;
+"""
+
+
+def archive_path(args: argparse.Namespace, output: Optional[str]) -> Optional[str]:
+    """--archive, else the side-car next to the queue or output file (None with --no-archive)."""
+    if args.no_archive:
+        return None
+    if args.archive:
+        return args.archive
+    base = args.queue or output
+    return f"{os.path.splitext(base)[0]}.raw.sqlite" if base else None
+
+
+def connect(path: str) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=60.0)
+    conn.execute("PRAGMA busy_timeout=60000")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _zdict(conn: sqlite3.Connection, stage: int) -> bytes:
+    """The stage's preset dictionary, created from its system prompt on first use."""
+    row = conn.execute("SELECT zdict FROM dictionaries WHERE stage = ?", (stage,)).fetchone()
+    if row:
+        return row[0]
+    zdict = read_system_prompt(stage).encode("utf-8")[-ZDICT_BYTES:]
+    with conn:
+        conn.execute("INSERT OR IGNORE INTO dictionaries (stage, zdict) VALUES (?, ?)", (stage, zdict))
+    return conn.execute("SELECT zdict FROM dictionaries WHERE stage = ?", (stage,)).fetchone()[0]
+
+
+def _pack(text: str, zdict: bytes) -> bytes:
+    c = zlib.compressobj(LEVEL, zdict=zdict)
+    return c.compress(text.encode("utf-8")) + c.flush()
+
+
+def _unpack(blob: Optional[bytes], zdict: bytes) -> Optional[str]:
+    if blob is None:
+        return None
+    d = zlib.decompressobj(zdict=zdict)
+    return (d.decompress(blob) + d.flush()).decode("utf-8")
+
+
+class RawArchive:
+    """
+    Batched writer used by the runners (flushed every `batch_size` rows and on close).
+
+        archive = RawArchive(path, 5, model=args.model)
+        archive.add(uid, raw, normalized, stopped=..., samples=...)
+        archive.close()
+    """
+
+    def __init__(self, path: str, stage: int, model: Optional[str] = None, batch_size: int = BATCH_SIZE):
+        self.path = path
+        self.stage = stage
+        self.model = model
+        self.batch_size = max(1, int(batch_size))
+        self.conn = connect(path)
+        self.zdict = _zdict(self.conn, stage)
+        self.rows = 0
+        self.raw_bytes = 0
+        self.packed_bytes = 0
+        self._pending: List[tuple] = []
+
+    def add(
+        self,
+        uid: Any,
+        raw: str,
+        normalized: Dict[str, Any],
+        stopped: bool = False,
+        samples: Optional[List[Optional[str]]] = None,
+    ) -> None:
+        fields = json.dumps({k: clean(v) for k, v in normalized.items()}, ensure_ascii=False, default=json_default)
+        packed_raw = _pack(raw, self.zdict)
+        packed_samples = _pack(json.dumps(samples, ensure_ascii=False), self.zdict) if samples else None
+        self._pending.append((self.stage, str(uid), self.model, time.time(), int(bool(stopped)),
+                              packed_raw, packed_samples, _pack(fields, self.zdict)))
+        self.rows += 1
+        self.raw_bytes += len(raw.encode("utf-8"))
+        self.packed_bytes += len(packed_raw)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO responses (stage, id, model, archived_at, stopped, raw, samples, fields)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                self._pending,
+            )
+        self._pending = []
+
+    def line(self) -> str:
+        ratio = self.raw_bytes / self.packed_bytes if self.packed_bytes else 0.0
+        return (f"[ARCHIVE] {self.rows} raw responses -> {self.path} "
+                f"({self.raw_bytes / 1024:.1f} KB raw, {self.packed_bytes / 1024:.1f} KB stored, {ratio:.1f}x)")
+
+    def close(self) -> None:
+        if self.conn is None:
+            return
+        self.flush()
+        self.conn.close()
+        self.conn = None
+
+
+class Archived(NamedTuple):
+    stage: int
+    id: str
+    model: Optional[str]
+    archived_at: float
+    stopped: bool
+    raw: str
+    samples: Optional[List[Optional[str]]]
+    fields: Dict[str, Any]
+
+
+def iter_archive(conn: sqlite3.Connection, stage: int, ids: Optional[List[str]] = None) -> Iterator[Archived]:
+    zdict = _zdict(conn, stage)
+    sql = "SELECT id, model, archived_at, stopped, raw, samples, fields FROM responses WHERE stage = ?"
+    params: List[Any] = [stage]
+    if ids:
+        sql += f" AND id IN ({','.join('?' * len(ids))})"
+        params += ids
+    for uid, model, at, stopped, raw, samples, fields in conn.execute(sql + " ORDER BY id", params):
+        s = _unpack(samples, zdict)
+        yield Archived(stage, uid, model, at, bool(stopped), _unpack(raw, zdict),
+                       json.loads(s) if s else None, json.loads(_unpack(fields, zdict)))
+
+
+def archived_stages(conn: sqlite3.Connection) -> List[int]:
+    return [r[0] for r in conn.execute("SELECT DISTINCT stage FROM responses ORDER BY stage")]
+
+
+def replay(item: Archived, utils: Any) -> Dict[str, Any]:
+    """The runner's parse + normalize (+ vote) on an archived answer, with today's utils_N."""
+    parsed = truncated_fields(item.raw) if item.stopped else (utils.safe_json_loads(item.raw) or {})
+    normalized = utils.normalize_result(parsed)
+    trigger = item.fields.get(f"sc_trigger_stage{item.stage}")
+    if item.samples and trigger:
+        samples = [normalized] + [utils.normalize_result(utils.safe_json_loads(r) or {}) for r in item.samples]
+        normalized = majority_vote(samples, item.stage, trigger)
+    return normalized
+
+
+def _same(a: Any, b: Any) -> bool:
+    a, b = clean(a), clean(b)
+    if isinstance(a, float) and isinstance(b, float):
+        return abs(a - b) < 1e-9
+    return json.dumps(a, sort_keys=True, default=str) == json.dumps(b, sort_keys=True, default=str)
+
+
+def renormalize(conn: sqlite3.Connection, stage: int) -> pd.DataFrame:
+    """One row per archived id: old and new include, the fields that changed, and the new decision row."""
+    utils = load_utils(stage)
+    inc = f"include_stage{stage}"
+    rows = []
+    for item in iter_archive(conn, stage):
+        new = replay(item, utils)
+        old = item.fields
+        changed = [k for k, v in new.items() if k in old and not _same(old[k], v)]
+        rows.append({
+            "stage": stage, "id": item.id,
+            "old_include": bool(old.get(inc)), "new_include": bool(new.get(inc)),
+            "flipped": bool(old.get(inc)) != bool(new.get(inc)),
+            "changed_fields": ",".join(changed),
+            "old_reason": old.get(f"reason_stage{stage}"), "new_reason": new.get(f"reason_stage{stage}"),
+            "new": dict(old, **new),
+        })
+    return pd.DataFrame(rows, columns=["stage", "id", "old_include", "new_include", "flipped",
+                                       "changed_fields", "old_reason", "new_reason", "new"])
+
+
+def print_report(res: pd.DataFrame, stage: int, seconds: float, show: int) -> None:
+    n = len(res)
+    flips = res[res["flipped"]]
+    t2f = int((flips["old_include"]).sum())
+    counts: Dict[str, int] = {}
+    for fields in res["changed_fields"]:
+        for f in filter(None, fields.split(",")):
+            counts[f] = counts.get(f, 0) + 1
+    other = ", ".join(f"{k} {v}" for k, v in sorted(counts.items(), key=lambda kv: -kv[1]) if k != f"include_stage{stage}")
+    print(f"Stage {stage}: {n} archived responses renormalized in {seconds:.2f}s (0 API calls) | "
+          f"include flips {len(flips)} (true->false {t2f}, false->true {len(flips) - t2f}) | "
+          f"include {int(res['old_include'].sum())} -> {int(res['new_include'].sum())}")
+    if other:
+        print(f"  other fields changed: {other}")
+    for r in flips.head(show).itertuples(index=False):
+        print(f"  {r.id}: {r.old_include} -> {r.new_include} | {str(r.new_reason or '')[:120]}")
+    if len(flips) > show:
+        print(f"  ... {len(flips) - show} more (--flips FILE writes them all)")
+
+
+def rewrite_table(table: pd.DataFrame, res: pd.DataFrame, stage: int, id_col: str = "id") -> pd.DataFrame:
+    """An output table with the renormalized fields of every archived id (other rows unchanged)."""
+    new = {str(uid): row for uid, row in zip(res["id"], res["new"])}
+    out = table.copy()
+    keys = out[id_col].astype(str)
+    hit = keys.isin(new)
+    cols = sorted({k for row in new.values() for k in row if k != "id"})
+    for col in cols:
+        if col not in out.columns:
+            out[col] = None
+        values = [new[k].get(col) if k in new else None for k in keys[hit]]
+        out[col] = out[col].astype(object)
+        out.loc[hit, col] = pd.Series(values, index=out.index[hit], dtype=object)
+    return out
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Raw-response archive: stats, lookups and offline renormalization")
+    parser.add_argument("--archive", required=True, help="Archive written by a runner (<output>.raw.sqlite)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("stats", help="Responses and stored size per stage")
+    p = sub.add_parser("show", help="Print the archived raw response and decision of ids")
+    p.add_argument("--id", action="append", required=True)
+    p.add_argument("--stage", type=int, choices=STAGES, default=None)
+    p = sub.add_parser("renormalize", help="Re-apply the current normalize_result to every archived response")
+    p.add_argument("--stage", type=int, choices=STAGES, default=None, help="Default: every stage in the archive")
+    p.add_argument("--show", type=int, default=20, help="Flipped ids to print per stage")
+    p.add_argument("--flips", default=None, help="Write every changed row (flipped or other fields) to this table")
+    p.add_argument("--table", default=None, help="With --write: the stage output table to update")
+    p.add_argument("--write", default=None, help="Write --table with the renormalized fields")
+    p.add_argument("--id-col", default="id")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.archive):
+        parser.error(f"archive not found: {args.archive}")
+    conn = connect(args.archive)
+    try:
+        stages = [args.stage] if getattr(args, "stage", None) else archived_stages(conn)
+        if args.cmd == "stats":
+            for stage, n, raw, fields, at in conn.execute(
+                    "SELECT stage, COUNT(*), SUM(LENGTH(raw)) + SUM(COALESCE(LENGTH(samples), 0)),"
+                    " SUM(LENGTH(fields)), MAX(archived_at) FROM responses GROUP BY stage ORDER BY stage"):
+                print(f"Stage {stage}: {n} responses, {(raw + fields) / 1024:.1f} KB stored, "
+                      f"last archived {time.strftime('%Y-%m-%d %H:%M', time.localtime(at))}")
+        elif args.cmd == "show":
+            for stage in stages:
+                for item in iter_archive(conn, stage, args.id):
+                    print(f"--- stage {stage} {item.id} (model {item.model}"
+                          + (", stream stopped early" if item.stopped else "") + ")")
+                    print(item.raw)
+                    for k, s in enumerate(item.samples or [], start=2):
+                        print(f"[sample {k}] {s}")
+                    print(json.dumps(item.fields, ensure_ascii=False, indent=2, default=str))
+        else:
+            if args.write and (not args.table or len(stages) != 1):
+                parser.error("--write needs --table and a single --stage")
+            changed = []
+            for stage in stages:
+                started = time.time()
+                res = renormalize(conn, stage)
+                print_report(res, stage, time.time() - started, args.show)
+                changed.append(res[res["changed_fields"] != ""])
+                if args.write:
+                    write_table(rewrite_table(read_table(args.table), res, stage, args.id_col), args.write)
+                    print(f"Wrote: {args.write}")
+            if args.flips:
+                flips = pd.concat(changed, ignore_index=True) if changed else pd.DataFrame()
+                write_table(flips.drop(columns=["new"], errors="ignore"), args.flips)
+                print(f"Wrote {len(flips)} changed rows: {args.flips}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
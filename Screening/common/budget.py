@@ -0,0 +1,248 @@
+# budget.py — Per-stage input projection and token budgets for the user prompt
+#
+# By default every stage ships up to 4,000 characters of abstract. With a policy
+# (runner flag --token-budget) each stage instead sends:
+#   fields          the prompt columns it may use (the others are blanked)
+#   abstract_tokens a cap on the abstract after boilerplate is stripped
+#   prompt_tokens   a hard cap on the whole user prompt (system prompt excluded)
+#
+# Tokens are counted with tiktoken when its encoding is available locally.
+# Otherwise a pre-tokenizer estimate is used that over-counts BPE tokens, so a
+# prompt that fits the estimate also fits the real tokenizer.
+
+import math
+import re
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import pandas as pd
+
+DEFAULT_ENCODING = "o200k_base"
+
+
+# -------------------- Tokenizer --------------------
+
+# Same shape as the GPT pre-tokenizer: words, numbers, single symbols, whitespace runs
+_PIECES = re.compile(r"[^\W\d_]+|\d{1,3}|[^\s\w]|\s+|_", re.UNICODE)
+
+
+class Tokenizer:
+    """Counts and truncates by tokens; `exact` is False when falling back to the estimate."""
+
+    def __init__(self, encoding: str = DEFAULT_ENCODING):
+        self.name = "estimate"
+        self.exact = False
+        self._enc = None
+        try:
+            import tiktoken
+            self._enc = tiktoken.get_encoding(encoding)
+            self.name, self.exact = encoding, True
+        except Exception:  # not installed, or the encoding file cannot be fetched offline
+            self._enc = None
+
+    @staticmethod
+    def _piece_cost(piece: str) -> int:
+        if piece.isspace():
+            return 1
+        if piece.isascii():
+            return max(1, math.ceil(len(piece) / 3))
+        return len(piece)  # non-ASCII: up to one token per character
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._enc is not None:
+            return len(self._enc.encode(text, disallowed_special=()))
+        return sum(self._piece_cost(p) for p in _PIECES.findall(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Longest prefix of `text` that is at most `max_tokens` tokens."""
+        if max_tokens <= 0 or not text:
+            return ""
+        if self._enc is not None:
+            toks = self._enc.encode(text, disallowed_special=())
+            if len(toks) <= max_tokens:
+                return text
+            out = self._enc.decode(toks[:max_tokens])
+            # decode() may end in a partial multi-byte character
+            while out and self.count(out) > max_tokens:
+                out = out[:-1]
+            return out.rstrip("�")
+        used, end = 0, 0
+        for m in _PIECES.finditer(text):
+            cost = self._piece_cost(m.group())
+            if used + cost > max_tokens:
+                break
+            used += cost
+            end = m.end()
+        return text[:end]
+
+
+@lru_cache(maxsize=4)
+def get_tokenizer(encoding: str = DEFAULT_ENCODING) -> Tokenizer:
+    return Tokenizer(encoding)
+
+
+# -------------------- Boilerplate --------------------
+
+# Only the trailing copyright/publisher block is boilerplate: a sentence that
+# opens with "© 2021" / "Copyright 2021" (everything after it goes too), or a run
+# of "Published by ..." / "All rights reserved." sentences, up to the end of the
+# text. Case-sensitive, so "guidance published by NICE" stays.
+_COPYRIGHT = re.compile(
+    r"(?:^|(?<=[.!?]))\s*"
+    r"(?:(?:©|Copyright|COPYRIGHT)\s*(?:©\s*)?(?:19|20)\d{2}\b[^\n]*"
+    r"|(?:(?:Published by|All rights reserved|ALL RIGHTS RESERVED)[^.]*(?:\.(?!\s|$)[^.]*)*\.?\s*)+)"
+    r"\s*\Z"
+)
+_HEADING_WORDS = (
+    r"BACKGROUND|INTRODUCTION|OBJECTIVES?|AIMS?|PURPOSE|METHODS?|METHOD\(S\)|"
+    r"DESIGN|SETTING|PARTICIPANTS|RESULTS?|RESULT\(S\)|FINDINGS|CONCLUSIONS?|CONCLUSION\(S\)|"
+    r"INTERPRETATION|DISCUSSION"
+)
+# A heading opens the text, a line or a sentence, and is either all-caps
+# ("RESULTS." / "RESULTS:") or followed by a colon ("Results:"); a sentence that
+# merely ends in "setting." or "results." keeps its last word.
+_HEADINGS = re.compile(
+    rf"(?:^|(?<=[.!?])\s+)[ \t]*-?[ \t]*(?:(?:{_HEADING_WORDS})\s*[:.]|(?i:{_HEADING_WORDS})\s*:)\s*",
+    re.MULTILINE,
+)
+_SPACES = re.compile(r"\s+")
+
+
+def strip_boilerplate(text: Any, copyright: bool = True) -> str:
+    """Drop copyright/publisher lines, structured-abstract headings and whitespace runs."""
+    if not isinstance(text, str):
+        return ""
+    if copyright:
+        text = _COPYRIGHT.sub("", text)
+    text = _HEADINGS.sub(" ", text)
+    return _SPACES.sub(" ", text).strip()
+
+
+# -------------------- Policies --------------------
+
+class InputPolicy(NamedTuple):
+    fields: Optional[Tuple[str, ...]]   # None = every PROMPT_COLUMNS entry is sent
+    abstract_tokens: int
+    prompt_tokens: int
+    copyright: bool = True              # strip copyright lines (Stage 1 keeps them: they carry the year)
+
+
+STAGE_POLICIES: Dict[int, InputPolicy] = {
+    # language + year only need the opening of the abstract
+    1: InputPolicy(("id", "Year", "Title", "Abstract"), 120, 400, copyright=False),
+    2: InputPolicy(None, 600, 1200),
+    3: InputPolicy(None, 600, 1000),
+    # publication type is mostly visible from the title and the opening sentences
+    4: InputPolicy(("id", "Title", "Abstract"), 300, 600),
+    5: InputPolicy(None, 900, 1600),
+    6: InputPolicy(None, 900, 1300),
+    7: InputPolicy(None, 900, 1500),
+}
+
+
+def stage_policy(stage: int, prompt_tokens: Optional[int] = None) -> InputPolicy:
+    """The stage's default policy, optionally with a different prompt budget."""
+    p = STAGE_POLICIES[stage]
+    if prompt_tokens:
+        p = p._replace(prompt_tokens=prompt_tokens, abstract_tokens=min(p.abstract_tokens, prompt_tokens))
+    return p
+
+
+class BudgetStats:
+    """Running totals for the [BUDGET] line (accumulated across chunks)."""
+
+    def __init__(self, stage: int, policy: InputPolicy, tokenizer: Tokenizer):
+        self.stage = stage
+        self.policy = policy
+        self.tokenizer = tokenizer
+        self.prompts = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self.max_prompt = 0
+        self.trimmed = 0
+
+    def line(self) -> str:
+        saved = self.tokens_before - self.tokens_after
+        pct = 100.0 * saved / self.tokens_before if self.tokens_before else 0.0
+        return (
+            f"[BUDGET] stage {self.stage}: prompts={self.prompts} input tokens {self.tokens_before} -> "
+            f"{self.tokens_after} (saved {saved}, {pct:.1f}%), max prompt={self.max_prompt} "
+            f"<= {self.policy.prompt_tokens}, trimmed to fit={self.trimmed} [tokenizer: {self.tokenizer.name}]"
+        )
+
+
+def project_frame(
+    df: pd.DataFrame,
+    policy: InputPolicy,
+    tokenizer: Tokenizer,
+    prompt_columns: Optional[Tuple[str, ...]] = None,
+    abstract_col: str = "Abstract",
+) -> pd.DataFrame:
+    """
+    Copy of `df` with the prompt columns outside policy.fields blanked and the
+    abstract cleaned and capped. Other columns (upstream stage results) are kept
+    so fingerprints still see them.
+    """
+    out = df.copy()
+    if policy.fields is not None:
+        for col in prompt_columns or ():
+            if col in out.columns and col not in policy.fields:
+                out[col] = None
+    if abstract_col in out.columns:
+        out[abstract_col] = [
+            tokenizer.truncate(strip_boilerplate(a, policy.copyright), policy.abstract_tokens) or None
+            for a in out[abstract_col].tolist()
+        ]
+    return out
+
+
+def fit_prompts(
+    df: pd.DataFrame,
+    build: Callable[[pd.DataFrame], List[str]],
+    policy: InputPolicy,
+    stats: BudgetStats,
+    prompt_columns: Optional[Tuple[str, ...]] = None,
+    title_col: str = "Title",
+    abstract_col: str = "Abstract",
+) -> Tuple[List[str], pd.DataFrame]:
+    """
+    Build the stage's prompts under `policy`.
+    Rows still over prompt_tokens lose abstract, then title tokens until they fit;
+    a prompt that cannot fit (fixed text alone is over budget) raises ValueError.
+    Returns the prompts and the projected frame they were built from.
+    """
+    tok = stats.tokenizer
+    stats.tokens_before += sum(tok.count(p) for p in build(df))
+    proj = project_frame(df, policy, tok, prompt_columns, abstract_col)
+    prompts = build(proj)
+    for i, prompt in enumerate(prompts):
+        n = tok.count(prompt)
+        if n <= policy.prompt_tokens:
+            continue
+        stats.trimmed += 1
+        row = proj.iloc[[i]].copy()
+        for col in (abstract_col, title_col):
+            if col not in row.columns:
+                continue
+            while n > policy.prompt_tokens:
+                text = row[col].iloc[0]
+                text = text if isinstance(text, str) else ""
+                if not text:
+                    break
+                row[col] = tok.truncate(text, max(0, tok.count(text) - (n - policy.prompt_tokens))) or None
+                prompt = build(row)[0]
+                n = tok.count(prompt)
+        if n > policy.prompt_tokens:
+            raise ValueError(
+                f"prompt for row {proj.index[i]} is {n} tokens with no abstract/title left; "
+                f"the budget of {policy.prompt_tokens} is below the stage's fixed prompt text"
+            )
+        proj.iloc[i] = row.iloc[0]
+        prompts[i] = prompt
+    counts = [tok.count(p) for p in prompts]
+    stats.prompts += len(prompts)
+    stats.tokens_after += sum(counts)
+    stats.max_prompt = max([stats.max_prompt] + counts)
+    return prompts, proj
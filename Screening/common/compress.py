@@ -0,0 +1,243 @@
+# compress.py — Cue-anchored extractive abstract compression for Stages 5-7
+#
+# Stages 5-7 decide mostly on the sentences that carry their cues (comparator /
+# outcome and shift tables in common/cues.py; money wording for Stage 7). With
+# --compress the runner sends, instead of the whole abstract:
+#   the first sentence + every cue-bearing sentence ± `window` neighbours
+# (the title is always in the prompt). Dropped stretches are marked with " … ".
+#
+# Low confidence -> the full abstract is sent unchanged:
+#   - the abstract is short (fewer than MIN_SENTENCES sentences)
+#   - one of the stage's cue tables has no hit anywhere in the abstract
+#     (the decision then hinges on text the cues do not see)
+#   - the extract would keep more than MAX_KEEP of the characters anyway
+#
+# Usage (from the Screening/ folder):
+#   python -m common.compress stats --stage 5 --input Stage_5_Comparator_And_Outcomes/data/361_articles_post_stage4_screen.csv
+#   python -m common.compress report --stage 5 --compressed /tmp/stage5_compressed.csv
+
+import argparse
+import re
+import sys
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import pandas as pd
+
+from common.cues import cue_hits
+from common.tables import read_table
+
+STAGE_CUE_TABLES: Dict[int, Tuple[str, ...]] = {
+    5: ("stage5_comparator", "stage5_outcome"),
+    6: ("stage6_shift",),
+    # The STRICT Stage 7 phrases are rare, so sentences are anchored on money
+    # wording (every STRICT phrase contains some) and the strict hits come along.
+    7: ("stage7_money",),
+}
+
+_MONEY = re.compile(
+    r"£|\$|€|\b(cost|costs|saving|savings|saved|budget|expenditure|spend(ing)?|financial|cash|roi|"
+    r"return on investment|net benefit)\b",
+    re.IGNORECASE,
+)
+
+# Bundled full-abstract outputs on the 361-article benchmark (the A/B reference)
+FULL_RUNS: Dict[int, str] = {
+    5: "Stage_5_Comparator_And_Outcomes/data/screen_stage5.csv",
+    6: "Stage_6_NHS_3_Shifts/data/screen_stage6.csv",
+    7: "Stage_7_Cash_Releasing_Benefit/data/screen_stage7.csv",
+}
+
+MIN_SENTENCES = 4
+MAX_KEEP = 0.8
+GAP = " … "
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s for s in (p.strip() for p in _SENTENCE_END.split(text)) if s]
+
+
+def _has_cue(sentence: str, table: str) -> bool:
+    if table == "stage7_money":
+        return _MONEY.search(sentence) is not None
+    return bool(cue_hits(sentence, table))
+
+
+class Compression(NamedTuple):
+    text: str            # what goes into the prompt (extract, or the full abstract)
+    compressed: bool     # False = fell back to the full abstract
+    why: str             # "ok" or the fallback reason
+    kept: int            # sentences kept
+    total: int           # sentences in the abstract
+
+
+def compress_abstract(abstract: Any, stage: int, window: int = 1) -> Compression:
+    """Extract the first sentence and the cue-bearing sentences (± window) for one abstract."""
+    if not isinstance(abstract, str) or not abstract.strip():
+        return Compression("" if not isinstance(abstract, str) else abstract, False, "empty", 0, 0)
+    sentences = split_sentences(abstract)
+    n = len(sentences)
+    if n < MIN_SENTENCES:
+        return Compression(abstract, False, "short", n, n)
+
+    tables = STAGE_CUE_TABLES[stage]
+    keep = {0}
+    seen_tables = set()
+    for i, sentence in enumerate(sentences):
+        for table in tables:
+            if _has_cue(sentence, table):
+                seen_tables.add(table)
+                keep.update(range(max(0, i - window), min(n, i + window + 1)))
+    if len(seen_tables) < len(tables):
+        return Compression(abstract, False, "missing_cues", n, n)
+
+    parts: List[str] = []
+    prev = -1
+    for i in sorted(keep):
+        if parts and i != prev + 1:
+            parts.append(GAP.strip())
+        parts.append(sentences[i])
+        prev = i
+    if prev != n - 1:
+        parts.append(GAP.strip())
+    text = " ".join(parts)
+    if len(text) > MAX_KEEP * len(abstract):
+        return Compression(abstract, False, "little_gain", n, n)
+    return Compression(text, True, "ok", len(keep), n)
+
+
+class CompressionStats:
+    """Running totals for the [COMPRESS] line (accumulated across chunks)."""
+
+    def __init__(self, stage: int):
+        self.stage = stage
+        self.rows = 0
+        self.compressed = 0
+        self.chars_before = 0
+        self.chars_after = 0
+        self.fallbacks: Dict[str, int] = {}
+
+    def add(self, abstract: Any, c: Compression) -> None:
+        self.rows += 1
+        self.chars_before += len(abstract) if isinstance(abstract, str) else 0
+        self.chars_after += len(c.text)
+        if c.compressed:
+            self.compressed += 1
+        else:
+            self.fallbacks[c.why] = self.fallbacks.get(c.why, 0) + 1
+
+    def line(self) -> str:
+        saved = self.chars_before - self.chars_after
+        pct = 100.0 * saved / self.chars_before if self.chars_before else 0.0
+        return (
+            f"[COMPRESS] stage {self.stage}: compressed {self.compressed}/{self.rows} abstracts, "
+            f"chars {self.chars_before} -> {self.chars_after} (saved {pct:.1f}%), full-abstract fallbacks {self.fallbacks}"
+        )
+
+
+def compress_frame(
+    df: pd.DataFrame,
+    stage: int,
+    window: int,
+    stats: CompressionStats,
+    abstract_col: str = "Abstract",
+) -> Tuple[pd.DataFrame, List[bool]]:
+    """Copy of `df` with the abstract replaced by its extract; also returns the per-row compressed flags."""
+    out = df.copy()
+    if abstract_col not in out.columns:
+        return out, [False] * len(out)
+    texts, flags = [], []
+    for a in out[abstract_col].tolist():
+        c = compress_abstract(a, stage, window)
+        stats.add(a, c)
+        texts.append(c.text if isinstance(a, str) else a)
+        flags.append(c.compressed)
+    out[abstract_col] = texts
+    return out, flags
+
+
+# -------------------- A/B report --------------------
+
+def _bools(s: pd.Series) -> pd.Series:
+    return s.map(lambda v: str(v).strip().lower() in ("true", "1", "yes"))
+
+
+def agreement_report(full: pd.DataFrame, comp: pd.DataFrame, stage: int, id_col: str = "id") -> Dict[str, Any]:
+    """Decision agreement of a compressed run against a full-abstract run (joined on id)."""
+    col = f"include_stage{stage}"
+    flag = f"stage{stage}_compressed"
+    keep_comp = [id_col, col] + ([flag] if flag in comp.columns else [])
+    m = full[[id_col, col]].merge(comp[keep_comp], on=id_col, suffixes=("_full", "_comp"))
+    a, b = _bools(m[col + "_full"]), _bools(m[col + "_comp"])
+    n = len(m)
+    tp = int((a & b).sum())
+    tn = int((~a & ~b).sum())
+    fn = int((a & ~b).sum())   # included on the full abstract, excluded compressed
+    fp = int((~a & b).sum())
+    agree = (tp + tn) / n if n else 0.0
+    p_yes = (a.mean() * b.mean() + (1 - a.mean()) * (1 - b.mean())) if n else 0.0
+    kappa = (agree - p_yes) / (1 - p_yes) if n and p_yes < 1 else 1.0
+    out: Dict[str, Any] = {
+        "stage": stage,
+        "rows": n,
+        "agreement": round(agree, 4),
+        "kappa": round(kappa, 4),
+        "both_include": tp,
+        "both_exclude": tn,
+        "lost_includes": fn,
+        "new_includes": fp,
+        "disagreements": m.loc[a != b, id_col].astype(str).tolist(),
+    }
+    if flag in m.columns:
+        c = _bools(m[flag])
+        out["compressed_rows"] = int(c.sum())
+        out["agreement_on_compressed"] = round(float((a[c] == b[c]).mean()), 4) if c.any() else None
+    return out
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Cue-anchored abstract compression (Stages 5-7)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("stats", help="Compression ratio and fallbacks on an input table (no API calls)")
+    p.add_argument("--stage", type=int, choices=sorted(STAGE_CUE_TABLES), required=True)
+    p.add_argument("--input", required=True)
+    p.add_argument("--window", type=int, default=1, help="Neighbouring sentences kept around each cue sentence")
+    p.add_argument("--abstract-col", default="Abstract")
+    p.add_argument("--show", default=None, help="Print the extract for this id")
+
+    p = sub.add_parser("report", help="A/B decision agreement: compressed run vs full-abstract run")
+    p.add_argument("--stage", type=int, choices=sorted(STAGE_CUE_TABLES), required=True)
+    p.add_argument("--compressed", required=True, help="Output table of a --compress run")
+    p.add_argument("--full", default=None, help="Full-abstract output (default: the bundled benchmark run)")
+    p.add_argument("--id-col", default="id")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "stats":
+        df = read_table(args.input)
+        stats = CompressionStats(args.stage)
+        projected, _ = compress_frame(df, args.stage, args.window, stats, args.abstract_col)
+        print(stats.line())
+        if args.show:
+            row = projected[projected["id"].astype(str) == args.show]
+            print(row[args.abstract_col].iloc[0] if len(row) else f"id {args.show} not found")
+        return
+
+    full = read_table(args.full or FULL_RUNS[args.stage])
+    comp = read_table(args.compressed)
+    r = agreement_report(full, comp, args.stage, args.id_col)
+    print(f"Stage {r['stage']} A/B (compressed vs full abstract), {r['rows']} articles")
+    print(f"  agreement {r['agreement']:.1%}  kappa {r['kappa']:.3f}")
+    print(f"  both include {r['both_include']}  both exclude {r['both_exclude']}  "
+          f"lost includes {r['lost_includes']}  new includes {r['new_includes']}")
+    if "compressed_rows" in r:
+        on = r["agreement_on_compressed"]
+        print(f"  compressed rows {r['compressed_rows']}  agreement on them "
+              f"{'n/a' if on is None else format(on, '.1%')}")
+    if r["disagreements"]:
+        print("  disagreements: " + ", ".join(r["disagreements"]))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
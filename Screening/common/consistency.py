@@ -0,0 +1,87 @@
+# consistency.py — Adaptive self-consistency for the low-accuracy stages (5 and 6)
+#
+# Every article gets one sample first. Only when that sample is weak:
+#   low_confidence   confidence_stageN below the threshold (with --logprobs:
+#                    max(p_include, 1 - p_include), the token probability), or
+#   guardrail_flip   normalize_result overrode the model's own `include`
+# does the runner ask for extra samples (one call, the API's `n` parameter) and
+# take a majority vote over all of them. The vote split is recorded per row in
+# votes_include_stageN / votes_total_stageN / sc_trigger_stageN.
+# A failed or unparseable first call is an error row, not a weak sample: it is
+# never sent for extra samples.
+
+from typing import Any, Dict, List, Optional
+
+TRUE_STRINGS = {"true", "1", "yes", "y"}
+
+
+def model_include(parsed: Dict[str, Any]) -> bool:
+    """The model's own include answer, before normalize_result."""
+    v = parsed.get("include", False)
+    return v if isinstance(v, bool) else str(v).strip().lower() in TRUE_STRINGS
+
+
+def sc_trigger(parsed: Dict[str, Any], normalized: Dict[str, Any], stage: int, threshold: float) -> Optional[str]:
+    """Why this first sample needs more samples (None when it can stand alone or is an error row)."""
+    if not parsed:   # call failed (raw None) or the answer was not JSON
+        return None
+    if model_include(parsed) != bool(normalized.get(f"include_stage{stage}")):
+        return "guardrail_flip"
+    p = normalized.get(f"p_include_stage{stage}")
+    certainty = max(p, 1.0 - p) if p is not None else float(normalized.get(f"confidence_stage{stage}") or 0.0)
+    if certainty < threshold:
+        return "low_confidence"
+    return None
+
+
+def single_vote(normalized: Dict[str, Any], stage: int) -> Dict[str, Any]:
+    """Vote columns for a row decided by its first sample alone."""
+    normalized[f"votes_include_stage{stage}"] = int(bool(normalized.get(f"include_stage{stage}")))
+    normalized[f"votes_total_stage{stage}"] = 1
+    normalized[f"sc_trigger_stage{stage}"] = ""
+    return normalized
+
+
+def majority_vote(samples: List[Dict[str, Any]], stage: int, trigger: str) -> Dict[str, Any]:
+    """
+    Majority over normalized samples (first sample first). Ties exclude, as the
+    stage prompts do when a criterion is unclear. The returned row is the most
+    confident sample on the winning side, with the vote split added.
+    """
+    inc, conf = f"include_stage{stage}", f"confidence_stage{stage}"
+    yes = sum(1 for s in samples if s.get(inc))
+    decision = yes * 2 > len(samples)
+    side = [s for s in samples if bool(s.get(inc)) == decision]
+    winner = dict(max(side, key=lambda s: float(s.get(conf) or 0.0)))
+    for k, v in samples[0].items():   # p_include_stageN belongs to the first (logprobs) sample
+        if k.startswith("p_include_"):
+            winner[k] = v
+    winner[f"votes_include_stage{stage}"] = yes
+    winner[f"votes_total_stage{stage}"] = len(samples)
+    winner[f"sc_trigger_stage{stage}"] = trigger
+    return winner
+
+
+class VoteStats:
+    """Running totals for the [SELF-CONSISTENCY] line."""
+
+    def __init__(self, stage: int):
+        self.stage = stage
+        self.rows = 0
+        self.triggered: Dict[str, int] = {}
+        self.extra_samples = 0
+        self.changed = 0
+
+    def add(self, trigger: Optional[str], extra: int, changed: bool) -> None:
+        self.rows += 1
+        if trigger:
+            self.triggered[trigger] = self.triggered.get(trigger, 0) + 1
+            self.extra_samples += extra
+            self.changed += int(changed)
+
+    def line(self) -> str:
+        n = sum(self.triggered.values())
+        return (
+            f"[SELF-CONSISTENCY] stage {self.stage}: {n}/{self.rows} rows re-sampled {self.triggered}, "
+            f"extra samples={self.extra_samples}, decisions changed by the vote={self.changed}"
+        )
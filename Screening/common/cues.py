@@ -0,0 +1,299 @@
+# cues.py — Precompiled cue scanner shared by Stages 5, 6 and 7
+#
+# All stage cue tables are compiled ONCE (at import) into a combined scanner.
+# scan_cues() walks the lower-cased abstract in one pass and returns, per table,
+# the matched cue labels together with their character spans. Results are
+# memoized per text, so Stage 5's comparator + outcome lookups (and any other
+# stage running in the same process) share one scan.
+#
+# Linear-time safety: the old ".*"-joined patterns (e.g. expected … observed)
+# are expressed as Seq(first, then) pairs and resolved from the match positions
+# collected during the pass, instead of letting the regex engine backtrack over
+# a whole abstract.
+
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
+
+
+class Seq(NamedTuple):
+    """`first` followed later on the same line by `then` (within `max_gap` chars if set)."""
+    first: str
+    then: str
+    max_gap: Optional[int] = None
+
+    @property
+    def pattern(self) -> str:
+        """Equivalent single backtracking regex (reference only; never used for scanning)."""
+        if self.max_gap is None:
+            return f"{self.first}.*{self.then}"
+        return f"{self.first}(?:(?:(?!\\n).){{0,{self.max_gap}}}){self.then}"
+
+
+class CueHit(NamedTuple):
+    label: str
+    entry: int               # index of the pattern within its table
+    span: Tuple[int, int]    # (start, end) in the scanned text
+
+
+Spec = Union[str, Seq, Tuple[Union[str, Seq], ...]]
+
+# -------------------- Stage cue tables (ordered: (spec, label)) --------------------
+# NOTE: text is lower-cased before scanning and Stages 5/6 are matched case-sensitively,
+# exactly as before — upper-case alternatives such as "BAU" or "ICER" never fire.
+# Kept unchanged so prompts stay identical to the validated runs.
+
+STAGE5_COMPARATOR: Tuple[Tuple[Spec, str], ...] = (
+    # Explicit
+    (r"\b(control|placebo|comparator|randomi[sz]ed|standard care|usual care|business as usual|BAU)\b", "explicit"),
+    (r"\b(non[- ]inferiority|superiority|head[- ]to[- ]head|versus|vs\.?)\b", "explicit"),
+    # Implicit — time / pre-post with a defined change
+    (r"\b(pre[- ]?intervention|post[- ]?intervention|pre[- ]?implementation|post[- ]?implementation|baseline|before|after)\b", "pre_post"),
+    ((r"\b(increased|decreased|reduced|fell|rose|change(d)? by)\b", Seq(r"\bfrom ", r" to\b")), "delta"),
+    # Implicit — switch/substitution
+    (r"\b(switch(ed|ing)?|transition(ed|ing)?|substitut(e|ion)|replace(d|ment))\b", "switch"),
+    # Implicit — scenario / counterfactual in modelling
+    (r"\b(counterfactual|do[- ]?nothing|status quo|current strategy|baseline scenario|no intervention)\b", "scenario"),
+    # Implicit — benchmark vs observed
+    (Seq(r"\b(expected|forecast(ed)?|predicted)\b", r"\b(actual|observed)\b"), "benchmark_vs_observed"),
+    # Implicit — technique/device head-to-head
+    (r"\b(first[- ]generation|second[- ]generation|technique [AB]|method [AB])\b", "technique"),
+)
+
+STAGE5_OUTCOME: Tuple[Tuple[Spec, str], ...] = (
+    # Economics
+    (r"\b(cost(s)?|saving(s)?|budget|expenditure|tariff|price|ICER|QALY(s)?|ROI|net monetary benefit|NMB)\b", "cost"),
+    (r"\b(QALY|utility|utilities|quality[- ]adjusted)\b", "qaly"),
+    # Service utilisation & time
+    (r"\b(utili[sz]ation|throughput|admission(s)?|readmission(s)?|attendance(s)?|uptake|hospitali[sz]ation(s)?)\b", "utilization"),
+    (r"\b(length of stay|LOS|waiting time(s)?|time to|duration|turnaround time)\b", "time"),
+    # Clinical / detection / effectiveness (broadened)
+    (r"\b(mortality|morbidity|complication(s)?|effectiveness|efficacy|detection rate(s)?|remission|healing|hysterectomy|hba1c|glycated haemoglobin|weight loss|body mass index|bmi|fatigue)\b", "clinical"),
+    # Safety
+    (r"\b(adverse event(s)?|safety|harms?)\b", "safety"),
+    # PROs / HRQoL (QoL only here to avoid overlap with 'clinical')
+    (r"\b(PROs?|PROMs?|HRQoL|EQ-5D|HUI3|quality of life|qol)\b", "pro"),
+    # Workforce/retention
+    (r"\b(retention|turnover)\b", "impact"),
+)
+
+STAGE6_SHIFT: Tuple[Tuple[Spec, str], ...] = (
+    (r"\bcommunity\b", "Community"),
+    (r"\bprimary care\b", "Community"),
+    (r"\bpharmacy\b", "Community"),
+    (r"\bout[- ]of[- ]hospital\b", "Community"),
+    (r"\bneighbourhood\b", "Community"),
+    (r"\bintegrated care\b", "Community"),
+    (r"\bhome[- ]based\b", "Community"),
+    (r"\bambulatory\b", "Community"),
+    (r"\bdigital\b", "Digital"),
+    (r"\bapp\b", "Digital"),
+    (r"\btele(medicine|health)\b", "Digital"),
+    (r"\bremote monitoring\b", "Digital"),
+    (r"\b(virtual ward|e[- ]?health|m[- ]?health)\b", "Digital"),
+    (r"\bAI\b", "Digital"),
+    (r"\bmachine learning\b", "Digital"),
+    (r"\belectronic (record|health record)\b", "Digital"),
+    (r"\bprevent(ion|ive|ing)?\b", "Prevention"),
+    (r"\b(prophylaxis|prophylactic)\b", "Prevention"),
+    (r"\bscreen(ing|ed)\b", "Prevention"),
+    (r"\bvaccin(e|ation|ated)\b", "Prevention"),
+    (r"\brisk reduction\b", "Prevention"),
+    (r"\bearly detection\b", "Prevention"),
+    (Seq(r"\bpre(operative|operative)\b", r"\b(beta[- ]blocker|statin|antibiotic|thromboprophylaxis)\b"), "Prevention"),
+    (r"\bfluoride\b", "Prevention"),
+    (r"\bchemoprevent(ion|ive)\b", "Prevention"),
+    (r"\brelapse prevention\b", "Prevention"),
+    (r"\bre[- ]admission prevention\b", "Prevention"),
+)
+
+# Stage 7 cues are intentionally narrow (see utils_7) and matched case-insensitively.
+_MONEY = r"(?:£|\$|eur|euro|cost|budget|saving|expenditure|financial)"
+
+STAGE7_CASH_SAVING: Tuple[Tuple[Spec, str], ...] = (
+    (r"\bin[- ]year cost saving(s)?\b", "in_year_cost_saving"),
+    (r"\bin[- ]year negative net budget impact\b", "in_year_negative_net_budget_impact"),
+    (r"\bnegative net budget impact\b", "negative_net_budget_impact"),
+    (r"\bnet saving(s)?\b", "net_saving"),
+    (r"\bexpenditure reduction(s)?\b", "expenditure_reduction"),
+    (r"\bcash[- ]releasing saving(s)?\b", "cash_releasing_saving"),
+    (r"\bbudget impact:\s*negative\b", "negative_budget_impact_colon_form"),
+    # "net benefit" only with a money cue within 60 chars on the same line
+    (Seq(r"net\s+benefit(?:s)?\b", _MONEY, max_gap=60), "net_benefit_with_money_cue"),
+    (r"\bnet budget benefit(s)?\b", "net_budget_benefit"),
+)
+
+CUE_TABLES: Dict[str, Tuple[Tuple[Spec, str], ...]] = {
+    "stage5_comparator": STAGE5_COMPARATOR,
+    "stage5_outcome": STAGE5_OUTCOME,
+    "stage6_shift": STAGE6_SHIFT,
+    "stage7_cash_saving": STAGE7_CASH_SAVING,
+}
+
+_TABLE_FLAGS = {"stage7_cash_saving": re.I}
+
+
+# -------------------- Compilation --------------------
+
+def _alternatives(spec: Spec) -> Tuple[Union[str, Seq], ...]:
+    return spec if isinstance(spec, tuple) and not isinstance(spec, Seq) else (spec,)
+
+
+def _compile():
+    """Flatten every table into a list of unique atoms (regex + flags) and compile the scanners."""
+    atoms: List[Tuple[str, int]] = []
+    index: Dict[Tuple[str, int], int] = {}
+
+    def atom_id(pat: str, flags: int) -> int:
+        key = (pat, flags)
+        if key not in index:
+            index[key] = len(atoms)
+            atoms.append(key)
+        return index[key]
+
+    # entries: table -> [(label, [("term", a) | ("seq", a_first, a_then, max_gap)])]
+    entries: Dict[str, List[Tuple[str, List[tuple]]]] = {}
+    for table, rows in CUE_TABLES.items():
+        flags = _TABLE_FLAGS.get(table, 0)
+        compiled_rows = []
+        for spec, label in rows:
+            alts = []
+            for alt in _alternatives(spec):
+                if isinstance(alt, Seq):
+                    alts.append(("seq", atom_id(alt.first, flags), atom_id(alt.then, flags), alt.max_gap))
+                else:
+                    alts.append(("term", atom_id(alt, flags)))
+            compiled_rows.append((label, alts))
+        entries[table] = compiled_rows
+
+    def body(i: int, hoisted: bool = False) -> str:
+        pat, flags = atoms[i]
+        if hoisted:
+            pat = pat[2:]
+        return f"(?i:{pat})" if flags & re.I else f"(?:{pat})"
+
+    # Finder: one non-capturing alternation with the leading \b hoisted out, so the
+    # engine only tries the word-initial atoms at word boundaries. It only locates
+    # candidate positions; atoms are identified at those positions below.
+    bounded = [i for i, (pat, _) in enumerate(atoms) if pat.startswith(r"\b")]
+    unbounded = [i for i in range(len(atoms)) if i not in bounded]
+    parts = [r"\b(?:" + "|".join(body(i, hoisted=True) for i in bounded) + ")"] if bounded else []
+    parts += [body(i) for i in unbounded]
+    finder = re.compile("|".join(parts))
+
+    # Identification: _SUFFIX[k] is an alternation of named atoms with index >= k,
+    # used anchored at a candidate position to list every atom starting there.
+    suffix = [
+        re.compile("|".join(f"(?P<a{i}>{body(i)})" for i in range(k, len(atoms))))
+        for k in range(len(atoms))
+    ]
+    return atoms, entries, finder, suffix
+
+
+_ATOMS, _ENTRIES, _FINDER, _SUFFIX = _compile()
+
+
+# -------------------- Scanning --------------------
+
+def _atom_positions(low: str) -> List[List[Tuple[int, int]]]:
+    """
+    One left-to-right pass collecting (start, end) for every atom occurrence.
+    At each candidate position the atoms are tried anchored via the suffix
+    alternations, so atoms sharing a start position are never shadowed.
+    """
+    found: List[List[Tuple[int, int]]] = [[] for _ in _ATOMS]
+    n_atoms = len(_ATOMS)
+    search = _FINDER.search
+    first = _SUFFIX[0].match
+    pos = 0
+    while True:
+        hit = search(low, pos)
+        if hit is None:
+            break
+        p = hit.start()
+        m = first(low, p)
+        while m is not None:
+            i = int(m.lastgroup[1:])
+            found[i].append((p, m.end()))
+            m = _SUFFIX[i + 1].match(low, p) if i + 1 < n_atoms else None
+        pos = p + 1
+    return found
+
+
+def _seq_span(low: str, firsts, thens, max_gap: Optional[int]) -> Optional[Tuple[int, int]]:
+    """
+    First `then` occurrence that starts after some `first` ends, on the same line.
+    Only the nearest preceding `first` needs checking: if the text between it and
+    `then` breaks the line (or the gap), so does the text from any earlier one.
+    """
+    if not firsts or not thens:
+        return None
+    firsts = sorted(firsts, key=lambda fe: fe[1])
+    j, nearest = 0, None
+    for t_start, t_end in thens:
+        while j < len(firsts) and firsts[j][1] <= t_start:
+            nearest = firsts[j]
+            j += 1
+        if nearest is None:
+            continue
+        f_start, f_end = nearest
+        if max_gap is not None and t_start - f_end > max_gap:
+            continue
+        if low.find("\n", f_end, t_start) == -1:
+            return (f_start, t_end)
+    return None
+
+
+@lru_cache(maxsize=8192)
+def scan_cues(text: str) -> Dict[str, Tuple[CueHit, ...]]:
+    """
+    Scan one article text against every stage cue table in a single pass.
+
+    Returns {table_name: (CueHit, ...)} in table order, one hit per matched
+    pattern (first occurrence). Memoized per text — treat the result as read-only.
+    """
+    low = text.lower()
+    found = _atom_positions(low)
+    out: Dict[str, Tuple[CueHit, ...]] = {}
+    for table, rows in _ENTRIES.items():
+        hits = []
+        for entry, (label, alts) in enumerate(rows):
+            span = None
+            for alt in alts:
+                if alt[0] == "term":
+                    occ = found[alt[1]]
+                    cand = occ[0] if occ else None
+                else:
+                    cand = _seq_span(low, found[alt[1]], found[alt[2]], alt[3])
+                if cand is not None and (span is None or cand[0] < span[0]):
+                    span = cand
+            if span is not None:
+                hits.append(CueHit(label, entry, span))
+        out[table] = tuple(hits)
+    return out
+
+
+def cue_hits(text: Any, table: str) -> Tuple[CueHit, ...]:
+    """Hits for one table; NaN/non-string/empty text gives no hits."""
+    if not isinstance(text, str) or not text:
+        return ()
+    return scan_cues(text)[table]
+
+
+def cue_labels(text: Any, table: str) -> List[str]:
+    """Matched cue labels for one table, deduped, in table order."""
+    out: List[str] = []
+    for hit in cue_hits(text, table):
+        if hit.label not in out:
+            out.append(hit.label)
+    return out
+
+
+def cue_counts(text: Any, table: str, cap: Optional[int] = None) -> Dict[str, int]:
+    """Number of matched patterns per label (optionally capped), in table order."""
+    counts: Dict[str, int] = {}
+    for hit in cue_hits(text, table):
+        counts[hit.label] = counts.get(hit.label, 0) + 1
+    if cap is not None:
+        counts = {k: min(v, cap) for k, v in counts.items()}
+    return counts
@@ -0,0 +1,100 @@
+# decision.py — Decision-only call shape and logprob-based include probability
+#
+# --decision-only appends an instruction asking for the stage's minimal JSON:
+# `include` first, then only the fields normalize_result needs for its
+# guardrails and output columns (no reason text). Fewer output tokens, same
+# columns (reason_stageN is left empty).
+#
+# --logprobs asks the API for token logprobs and reads the probability of the
+# `include` value token itself: p_include_stageN = P(true) / (P(true) + P(false))
+# over the top alternatives at that position. Unlike the self-reported
+# `confidence`, this comes from the model's output distribution.
+
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+# Fields normalize_result needs per stage, in the order the model should emit them
+DECISION_FIELDS: Dict[int, Tuple[str, ...]] = {
+    1: ("include", "detected_language", "publication_year", "confidence"),
+    2: ("include", "detected_setting", "confidence"),
+    3: ("include", "detected_context", "confidence"),
+    4: ("include", "publication_type", "confidence"),
+    5: ("include", "has_comparator", "detected_comparator", "has_primary_outcomes", "detected_outcomes", "confidence"),
+    6: ("include", "main_shift", "shifts_detected", "confidence"),
+    7: ("include", "cash_saving_terms", "confidence"),
+}
+
+# Enough for the longest decision-only object (Stage 5 with a few outcomes)
+DECISION_MAX_TOKENS = 120
+
+
+def decision_only_instruction(stage: int) -> str:
+    fields = ", ".join(f'"{f}"' for f in DECISION_FIELDS[stage])
+    return (
+        "\n\nOUTPUT (decision only): return ONE compact JSON object with exactly these keys, in this order: "
+        f"{fields}. Put \"include\" first. Do NOT include a reason or any other text."
+    )
+
+
+def _get(obj: Any, name: str) -> Any:
+    return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+
+def _bool_token(token: str) -> Optional[bool]:
+    t = token.rsplit(":", 1)[-1].strip().strip('"').lower()
+    if not t:
+        return None
+    if "true".startswith(t) or t.startswith("true"):
+        return True
+    if "false".startswith(t) or t.startswith("false"):
+        return False
+    return None
+
+
+def _value_probability(tok: Any) -> Optional[float]:
+    """P(true) at the token holding the include value."""
+    p_true = p_false = 0.0
+    for alt in _get(tok, "top_logprobs") or [tok]:
+        v = _bool_token(_get(alt, "token") or "")
+        lp = _get(alt, "logprob")
+        if v is None or lp is None:
+            continue
+        if v:
+            p_true += math.exp(lp)
+        else:
+            p_false += math.exp(lp)
+    if p_true > 0.0 and p_false > 0.0:
+        return round(p_true / (p_true + p_false), 6)
+    # Only one side visible: use the chosen token's own probability
+    chosen = _bool_token(_get(tok, "token") or "")
+    lp = _get(tok, "logprob")
+    if chosen is None or lp is None:
+        return None
+    p = math.exp(lp)
+    return round(p if chosen else 1.0 - p, 6)
+
+
+def include_probability(tokens: Optional[List[Any]]) -> Optional[float]:
+    """
+    P(include=true) from chat-completion logprobs (choices[0].logprobs.content).
+    Finds the token carrying the value of the "include" key and compares the
+    probability mass of true-ish and false-ish alternatives there. None when the
+    key or a boolean value token is not found.
+    """
+    text = ""
+    for tok in tokens or []:
+        piece = _get(tok, "token") or ""
+        text += piece
+        k = text.find('"include"')
+        if k < 0:
+            continue
+        rest = text[k + len('"include"'):]
+        colon = rest.find(":")
+        if colon < 0 or not rest[colon + 1:].strip(' "\t\n'):
+            continue
+        # First token that brings in non-blank text after `"include":` holds the value
+        if _bool_token(rest[colon + 1:]) is None:
+            return None
+        return _value_probability(tok)
+    return None
+
@@ -0,0 +1,142 @@
+# early_stop.py — Streaming early-decision mode (--early-stop)
+#
+# The model is asked to emit the stage's JSON keys in a fixed order: include,
+# then the fields normalize_result needs (common/decision.py DECISION_FIELDS),
+# then `reason` LAST. The client streams the answer and the runner re-parses the
+# partial JSON as chunks arrive. The stream is cancelled once every required
+# field is complete and the per-stage policy allows it:
+#   exclude   stop only when the decision is an exclude (reasons for includes
+#             are kept for the reviewers; most articles are excluded at each stage).
+#             With the stage's normalize_result, "exclude" means the normalized
+#             row, so a guardrail that would turn the answer into an include
+#             (Stage 5) lets the stream run to the full reason.
+#   always    stop as soon as the required fields are known
+# normalize_result then sees the same fields it would have seen, and the reason
+# column is marked as truncated.
+
+import json
+from typing import Any, Callable, Dict, Optional
+
+from common.decision import DECISION_FIELDS
+
+TRUNCATED_REASON = "[truncated: stream stopped once the decision was known]"
+
+# Default policy per stage (Stage 1 reasons are only "English, 2021"); --early-stop
+# exclude|always overrides it for the run
+STAGE_POLICIES: Dict[int, str] = {1: "always", 2: "exclude", 3: "exclude", 4: "exclude",
+                                  5: "exclude", 6: "exclude", 7: "exclude"}
+
+_decoder = json.JSONDecoder()
+_WS = " \t\r\n"
+
+
+def key_order_instruction(stage: int) -> str:
+    keys = ", ".join(f'"{k}"' for k in DECISION_FIELDS[stage])
+    return (
+        "\n\nKEY ORDER: emit the JSON keys in this order: "
+        f"{keys}, then any other schema keys, and \"reason\" LAST."
+    )
+
+
+def parse_partial_json(text: str) -> Dict[str, Any]:
+    """
+    Complete top-level key/value pairs of a (possibly cut-off) JSON object.
+    A value counts only once the following ',' or '}' has arrived, so a number
+    such as 0.8 is never taken from a stream that will continue as 0.85.
+    Leading prose or a ```json fence before the object is skipped.
+    """
+    out: Dict[str, Any] = {}
+    i = text.find("{")
+    if i < 0:
+        return out
+    i += 1
+    n = len(text)
+    while True:
+        while i < n and text[i] in _WS:
+            i += 1
+        if i >= n or text[i] != '"':
+            return out
+        try:
+            key, i = _decoder.raw_decode(text, i)
+        except ValueError:
+            return out
+        while i < n and text[i] in _WS:
+            i += 1
+        if i >= n or text[i] != ":":
+            return out
+        i += 1
+        while i < n and text[i] in _WS:
+            i += 1
+        try:
+            value, i = _decoder.raw_decode(text, i)
+        except ValueError:
+            return out
+        while i < n and text[i] in _WS:
+            i += 1
+        if i >= n or text[i] not in ",}":
+            return out
+        out[key] = value
+        if text[i] == "}":
+            return out
+        i += 1
+
+
+def _false(v: Any) -> bool:
+    return v is False or str(v).strip().lower() in {"false", "0", "no", "n"}
+
+
+def ready(
+    fields: Dict[str, Any],
+    stage: int,
+    policy: str,
+    normalize: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+) -> bool:
+    """True when the stream can be cancelled: required fields complete and the policy allows it."""
+    if any(k not in fields for k in DECISION_FIELDS[stage]):
+        return False
+    if "reason" in fields:   # already complete; nothing left worth cancelling
+        return False
+    if policy == "always":
+        return True
+    if normalize is None:
+        return _false(fields.get("include"))
+    # The row the runner would store from this cut: truncated_fields -> normalize_result
+    return not normalize(dict(fields, reason=TRUNCATED_REASON)).get(f"include_stage{stage}")
+
+
+def stopper(
+    stage: int,
+    policy: str,
+    normalize: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+) -> Callable[[str], bool]:
+    """should_stop callback for call_gpt_api_stream (pass normalize_result to decide on the normalized row)."""
+    return lambda text: ready(parse_partial_json(text), stage, policy, normalize)
+
+
+def truncated_fields(text: Optional[str]) -> Dict[str, Any]:
+    """Fields of a cancelled stream for normalize_result, with the reason marked as truncated."""
+    fields = parse_partial_json(text or "")
+    fields["reason"] = TRUNCATED_REASON
+    return fields
+
+
+class StopStats:
+    """Running totals for the [EARLY-STOP] line."""
+
+    def __init__(self, stage: int, policy: str):
+        self.stage = stage
+        self.policy = policy
+        self.calls = 0
+        self.stopped = 0
+        self.chars_received = 0
+
+    def add(self, text: Optional[str], stopped: bool) -> None:
+        self.calls += 1
+        self.stopped += int(stopped)
+        self.chars_received += len(text or "")
+
+    def line(self) -> str:
+        return (
+            f"[EARLY-STOP] stage {self.stage} (policy={self.policy}): stopped {self.stopped}/{self.calls} streams early, "
+            f"{self.chars_received} response chars received"
+        )
@@ -0,0 +1,100 @@
+# fingerprint.py — Stamps that say whether a stored stage decision is still valid
+#
+# A decision is reusable by an --incremental run when all four parts match:
+#   input_fp   the input row the stage saw (article text, hints and upstream stage
+#              columns — so a changed upstream decision re-screens downstream)
+#   prompt_fp  the system prompt text, plus the input settings that reshape the
+#              user prompt (--token-budget policy, --compress window)
+#   code_fp    the utils_N.py source (prompt builder + normalizer + guardrails)
+#              and the shared modules those call into (SHARED_CODE)
+#   model      the model name
+
+import hashlib
+import importlib
+import inspect
+import json
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+import pandas as pd
+
+# Shared helpers that shape the prompt or the decision: cue tables, hint
+# columns, token-budget projection and abstract compression.
+SHARED_CODE = ("common.cues", "common.frames", "common.budget", "common.compress")
+
+
+def text_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def code_digest(*funcs: Any) -> str:
+    """Digest of the source files defining `funcs` (e.g. build_user_prompts, normalize_result; modules too)."""
+    h = hashlib.sha256()
+    for path in sorted({inspect.getsourcefile(f) for f in funcs}):
+        with open(path, "rb") as f:
+            h.update(f.read().replace(b"\r\n", b"\n"))
+    return h.hexdigest()[:16]
+
+
+def _plain(v: Any) -> Any:
+    if hasattr(v, "tolist"):
+        return v.tolist()
+    try:
+        return None if pd.isna(v) else v
+    except (TypeError, ValueError):
+        return v
+
+
+def row_digests(df: pd.DataFrame) -> List[str]:
+    """One digest per row over every column (order-independent, NaN == missing)."""
+    cols = sorted(map(str, df.columns))
+    values = [df[c].tolist() for c in cols]
+    out = []
+    for row in zip(*values) if cols else [()] * len(df):
+        payload = {c: _plain(v) for c, v in zip(cols, row) if _plain(v) is not None}
+        out.append(text_digest(json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)))
+    return out
+
+
+class StageFingerprint(NamedTuple):
+    input_fp: str
+    prompt_fp: str
+    code_fp: str
+    model: str
+
+    @property
+    def digest(self) -> str:
+        return text_digest("|".join(self))
+
+
+def stage_fingerprints(
+    df: pd.DataFrame,
+    system_prompt: str,
+    model: str,
+    code: Callable,
+    *more_code: Callable,
+    settings: Optional[Dict[str, Any]] = None,
+) -> List[StageFingerprint]:
+    """
+    Fingerprint every row of a stage's input frame. `settings` are the run's
+    prompt-shaping options; unset (None) entries leave the prompt_fp as is.
+    """
+    active = {k: v for k, v in (settings or {}).items() if v is not None}
+    if active:
+        system_prompt += "\0" + json.dumps(active, sort_keys=True, default=str)
+    prompt_fp = text_digest(system_prompt)
+    code_fp = code_digest(code, *more_code, *map(importlib.import_module, SHARED_CODE))
+    return [StageFingerprint(fp, prompt_fp, code_fp, str(model)) for fp in row_digests(df)]
+
+
+def summary_line(reused: int, recomputed: int) -> str:
+    return f"[INCREMENTAL] reused={reused} recomputed={recomputed} (total={reused + recomputed})"
+
+
+def reuse_map(stored: Dict[str, Dict[str, Any]], ids: List[Any], fps: List[StageFingerprint]) -> Dict[Any, Dict[str, Any]]:
+    """Keep only stored decisions whose fingerprint still matches this run's row."""
+    out = {}
+    for uid, fp in zip(ids, fps):
+        hit = stored.get(str(uid))
+        if hit is not None and hit["fingerprint"] == fp.digest:
+            out[uid] = hit["fields"]
+    return out
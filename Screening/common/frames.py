@@ -0,0 +1,36 @@
+# frames.py — Column-wise helpers for building prompts from a whole DataFrame
+#
+# The runners used to call row.to_dict() plus a pd.isna comprehension for every
+# row just to hand a few HINT_KEYS to build_user_prompt. These helpers pull the
+# needed columns out once per frame instead.
+
+from typing import Any, Dict, Iterable, List, Optional
+
+import pandas as pd
+
+
+def column_values(df: pd.DataFrame, col: str, default: Any = "") -> List[Any]:
+    """Raw values of one column as a list (NaN kept, like row.get); `default` if missing."""
+    if col in df.columns:
+        return df[col].tolist()
+    return [default] * len(df)
+
+
+def hint_columns(df: pd.DataFrame, keys: Iterable[str]) -> Dict[str, List[Any]]:
+    """
+    Resolve metadata hint columns once per frame.
+    Only keys present as columns are returned; NaN becomes None (as in the per-row metadata dict).
+    """
+    out: Dict[str, List[Any]] = {}
+    for k in keys:
+        if k in df.columns:
+            s = df[k]
+            out[k] = s.astype(object).where(s.notna(), None).tolist()
+    return out
+
+
+def row_metadata(hints: Dict[str, List[Any]], i: int) -> Optional[Dict[str, Any]]:
+    """Per-row metadata holding only the resolved hint columns (None when there are none)."""
+    if not hints:
+        return None
+    return {k: vals[i] for k, vals in hints.items()}
@@ -0,0 +1,340 @@
+# jobqueue.py — Lease-based work queue so several machines can screen one corpus (--queue)
+#
+# One SQLite file (on a shared disk) holds a job per (stage, id) with the input
+# row as JSON. Any number of stage runners started with --queue PATH pull from it:
+#
+#   lease      a runner takes the next --chunk-size pending jobs (default
+#              QUEUE_BATCH) for --lease-seconds; attempts += 1
+#   heartbeat  a background thread extends the runner's leases every third of
+#              the lease time while it works
+#   timeout    a lease that was not extended (crashed or cut-off machine)
+#              expires and the job can be leased again by anyone
+#   complete   result + job state are written in one transaction, and only while
+#              the lease is still ours: a late runner whose lease expired and was
+#              taken over is turned away, so every (stage, id) has exactly one
+#              result
+#   fail       a failed API call (no response after the client's retries) puts
+#              the job back with a delay; after --max-attempts it is dead-lettered
+#
+# The file uses the rollback journal, not WAL: WAL needs shared memory, which
+# network file systems do not provide.
+#
+# Usage (from the Screening/ folder):
+#   python -m common.jobqueue --queue jobs.sqlite enqueue --stage 6 --input Stage_6_NHS_3_Shifts/data/361_articles_post_stage5_screen.csv
+#   (on every machine) cd Stage_6_NHS_3_Shifts && python main_6.py --queue ../jobs.sqlite
+#   python -m common.jobqueue --queue jobs.sqlite status
+#   python -m common.jobqueue --queue jobs.sqlite enqueue --stage 7 --from-stage 6     # the stage 6 includes
+#   python -m common.jobqueue --queue jobs.sqlite export --stage 6 --out screen_stage6.csv
+#   python -m common.jobqueue --queue jobs.sqlite dead --stage 6 [--requeue]
+
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, Optional
+
+import pandas as pd
+
+from common.stages import STAGES
+from common.store import json_default
+from common.tables import read_table, write_table
+
+QUEUE_BATCH = 20
+LEASE_SECONDS = 300.0
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 30.0        # seconds × attempts before a failed job is leased again
+POLL_SECONDS = 5.0        # wait for other runners' leases to finish or expire
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    stage         INTEGER NOT NULL,
+    id            TEXT NOT NULL,
+    seq           INTEGER NOT NULL,
+    payload       TEXT NOT NULL,
+    state         TEXT NOT NULL DEFAULT 'pending',
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    max_attempts  INTEGER NOT NULL,
+    not_before    REAL NOT NULL DEFAULT 0,
+    owner         TEXT,
+    token         TEXT,
+    lease_expires REAL,
+    last_error    TEXT,
+    enqueued_at   REAL NOT NULL,
+    updated_at    REAL NOT NULL,
+    PRIMARY KEY (stage, id)
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_next ON jobs (stage, state, seq);
+CREATE TABLE IF NOT EXISTS results (
+    stage       INTEGER NOT NULL,
+    id          TEXT NOT NULL,
+    fields      TEXT NOT NULL,
+    raw         TEXT,
+    owner       TEXT NOT NULL,
+    attempts    INTEGER NOT NULL,
+    finished_at REAL NOT NULL,
+    PRIMARY KEY (stage, id)
+);
+"""
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """Open (and create if needed) the queue; autocommit, transactions are explicit BEGIN IMMEDIATE."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=60.0, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.execute("PRAGMA busy_timeout=60000")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _dumps(v: Any) -> str:
+    # NaN stays NaN (json allows it), so payload rows come back as read_table gave them
+    return json.dumps(v, default=json_default)
+
+
+def enqueue(conn: sqlite3.Connection, stage: int, df: pd.DataFrame, id_col: str = "id",
+            max_attempts: int = MAX_ATTEMPTS) -> int:
+    """Add one job per row; ids already queued for the stage are left alone. Returns the number added."""
+    if id_col not in df.columns:
+        raise ValueError(f"queue input needs an id column ({id_col!r})")
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM jobs WHERE stage = ?", (stage,)).fetchone()[0]
+        before = conn.total_changes
+        conn.executemany(
+            "INSERT OR IGNORE INTO jobs (stage, id, seq, payload, max_attempts, enqueued_at, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(stage, str(rec[id_col]), seq + n, _dumps(rec), max_attempts, now, now)
+             for n, rec in enumerate(df.to_dict("records"), start=1)],
+        )
+        added = conn.total_changes - before
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return added
+
+
+def promoted(conn: sqlite3.Connection, from_stage: int) -> pd.DataFrame:
+    """Rows included by `from_stage`: its payload plus its result fields (the post_stageN layout)."""
+    out = results_table(conn, from_stage)
+    col = f"include_stage{from_stage}"
+    if out.empty or col not in out.columns:
+        return out.iloc[0:0]
+    return out[out[col].map(lambda v: v is True or v == 1)].reset_index(drop=True)
+
+
+def results_table(conn: sqlite3.Connection, stage: int, done_only: bool = True) -> pd.DataFrame:
+    """Input rows of a stage in enqueue order, merged with their results (as a runner writes its output)."""
+    jobs = conn.execute("SELECT id, payload FROM jobs WHERE stage = ? ORDER BY seq", (stage,)).fetchall()
+    fields = {uid: json.loads(f) for uid, f in conn.execute("SELECT id, fields FROM results WHERE stage = ?", (stage,))}
+    keep = [(uid, json.loads(p)) for uid, p in jobs if not done_only or uid in fields]
+    if not keep:
+        return pd.DataFrame()
+    df = pd.DataFrame([row for _, row in keep])
+    res = pd.DataFrame([fields.get(uid, {"id": row["id"]}) for uid, row in keep])
+    return df.merge(res, on="id", how="left")
+
+
+def status(conn: sqlite3.Connection) -> pd.DataFrame:
+    now = time.time()
+    return pd.read_sql_query(
+        "SELECT stage,"
+        " SUM(state = 'pending') AS pending,"
+        " SUM(state = 'leased' AND lease_expires >= :now) AS leased,"
+        " SUM(state = 'leased' AND lease_expires < :now) AS expired,"
+        " SUM(state = 'done') AS done,"
+        " SUM(state = 'dead') AS dead,"
+        " SUM(attempts > 1) AS retried,"
+        " COUNT(DISTINCT CASE WHEN state = 'leased' AND lease_expires >= :now THEN owner END) AS runners"
+        " FROM jobs GROUP BY stage ORDER BY stage",
+        conn, params={"now": now},
+    )
+
+
+class JobQueue:
+    """A runner's view of the queue for one stage: leased batches in, one result per job out."""
+
+    def __init__(self, path: str, stage: int, lease_seconds: float = LEASE_SECONDS):
+        self.path = path
+        self.stage = stage
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.conn = connect(path)
+        self.tokens: Dict[str, str] = {}
+        self.completed = self.failed = self.dead = self.lost = 0
+        self._stop = threading.Event()
+        self._heartbeat = threading.Thread(target=self._beat, name="queue-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    # ---- leasing ----
+
+    def remaining(self) -> int:
+        """Jobs not done or dead yet (the run's progress total)."""
+        return self.conn.execute("SELECT COUNT(*) FROM jobs WHERE stage = ? AND state IN ('pending', 'leased')",
+                                 (self.stage,)).fetchone()[0]
+
+    def _lease(self, n: int) -> List[Dict[str, Any]]:
+        now = time.time()
+        token = uuid.uuid4().hex
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Expired leases that used up their attempts are dead-lettered, the rest are leasable
+            self.conn.execute(
+                "UPDATE jobs SET state = 'dead', owner = NULL, token = NULL, updated_at = ?,"
+                " last_error = COALESCE(last_error, 'lease expired')"
+                " WHERE stage = ? AND state = 'leased' AND lease_expires < ? AND attempts >= max_attempts",
+                (now, self.stage, now))
+            picked = self.conn.execute(
+                "SELECT id, payload FROM jobs WHERE stage = ? AND not_before <= ?"
+                " AND (state = 'pending' OR (state = 'leased' AND lease_expires < ?))"
+                " ORDER BY seq LIMIT ?", (self.stage, now, now, n)).fetchall()
+            self.conn.executemany(
+                "UPDATE jobs SET state = 'leased', owner = ?, token = ?, lease_expires = ?,"
+                " attempts = attempts + 1, updated_at = ? WHERE stage = ? AND id = ?",
+                [(self.owner, token, now + self.lease_seconds, now, self.stage, uid) for uid, _ in picked])
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        for uid, _ in picked:
+            self.tokens[uid] = token
+        return [json.loads(p) for _, p in picked]
+
+    def _busy(self) -> bool:
+        """Other runners still hold leases, or failed jobs are waiting out their retry delay."""
+        return bool(self.conn.execute(
+            "SELECT 1 FROM jobs WHERE stage = ? AND (state = 'leased' OR (state = 'pending' AND not_before > ?))"
+            " LIMIT 1", (self.stage, time.time())).fetchone())
+
+    def batches(self, size: Optional[int] = None) -> Iterator[pd.DataFrame]:
+        """Leased jobs as input frames until the stage is drained (waits while other leases may still expire)."""
+        while True:
+            rows = self._lease(size or QUEUE_BATCH)
+            if rows:
+                yield pd.DataFrame(rows)
+            elif self._busy():
+                time.sleep(POLL_SECONDS)
+            else:
+                return
+
+    def _beat(self) -> None:
+        conn = None
+        while not self._stop.wait(self.lease_seconds / 3):
+            conn = conn or connect(self.path)
+            conn.execute("UPDATE jobs SET lease_expires = ? WHERE owner = ? AND state = 'leased'",
+                         (time.time() + self.lease_seconds, self.owner))
+        if conn:
+            conn.close()
+
+    # ---- results ----
+
+    def complete(self, uid: Any, normalized: Dict[str, Any], raw: Optional[str] = None, failed: bool = False) -> bool:
+        """Record a job's result (or its failure) if we still hold its lease; False when the lease was lost."""
+        uid = str(uid)
+        token = self.tokens.pop(uid, None)
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute("SELECT attempts, max_attempts FROM jobs WHERE stage = ? AND id = ?"
+                                    " AND state = 'leased' AND token = ?", (self.stage, uid, token)).fetchone()
+            if row is None:
+                self.conn.execute("COMMIT")
+                self.lost += 1
+                return False
+            attempts, max_attempts = row
+            if failed:
+                dead = attempts >= max_attempts
+                self.conn.execute(
+                    "UPDATE jobs SET state = ?, owner = NULL, token = NULL, lease_expires = NULL, not_before = ?,"
+                    " last_error = ?, updated_at = ? WHERE stage = ? AND id = ?",
+                    ("dead" if dead else "pending", now + RETRY_DELAY * attempts, "no response from the API",
+                     now, self.stage, uid))
+                self.dead += dead
+                self.failed += not dead
+            else:
+                self.conn.execute(
+                    "INSERT INTO results (stage, id, fields, raw, owner, attempts, finished_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (self.stage, uid, _dumps(normalized), raw, self.owner, attempts, now))
+                self.conn.execute(
+                    "UPDATE jobs SET state = 'done', owner = NULL, token = NULL, lease_expires = NULL,"
+                    " updated_at = ? WHERE stage = ? AND id = ?", (now, self.stage, uid))
+                self.completed += 1
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return True
+
+    def close(self) -> None:
+        self._stop.set()
+        self._heartbeat.join()
+        self.conn.close()
+
+    def line(self) -> str:
+        return (f"[QUEUE] stage {self.stage} ({self.owner}): completed={self.completed} "
+                f"failed={self.failed} (will retry) dead={self.dead} lost_leases={self.lost}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Shared work queue for screening runs on several machines")
+    parser.add_argument("--queue", required=True, help="Path to the queue SQLite file")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("enqueue", help="Add a table's rows (or another stage's includes) as jobs for a stage")
+    p.add_argument("--stage", type=int, choices=STAGES, required=True)
+    p.add_argument("--input", default=None, help="Table (.csv or .parquet) with an id column")
+    p.add_argument("--from-stage", type=int, choices=STAGES, default=None, help="Enqueue the rows included by this stage's results")
+    p.add_argument("--id-col", default="id")
+    p.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS)
+    sub.add_parser("status", help="Jobs per stage and state")
+    p = sub.add_parser("export", help="Input rows merged with their results, in enqueue order")
+    p.add_argument("--stage", type=int, choices=STAGES, required=True)
+    p.add_argument("--out", required=True)
+    p.add_argument("--all", action="store_true", help="Include rows without a result yet (blank result columns)")
+    p = sub.add_parser("dead", help="List dead-lettered jobs")
+    p.add_argument("--stage", type=int, choices=STAGES, required=True)
+    p.add_argument("--requeue", action="store_true", help="Put them back as pending with fresh attempts")
+    args = parser.parse_args(argv)
+
+    pd.set_option("display.width", 200)
+    conn = connect(args.queue)
+    try:
+        if args.cmd == "enqueue":
+            if (args.input is None) == (args.from_stage is None):
+                parser.error("enqueue needs exactly one of --input or --from-stage")
+            df = read_table(args.input) if args.input else promoted(conn, args.from_stage)
+            if df.empty:
+                print(f"Nothing to enqueue for stage {args.stage}")
+                return
+            added = enqueue(conn, args.stage, df, args.id_col, args.max_attempts)
+            print(f"Enqueued {added} of {len(df)} rows for stage {args.stage} ({len(df) - added} already queued)")
+        elif args.cmd == "status":
+            res = status(conn)
+            print(res.to_string(index=False) if len(res) else "Queue is empty")
+        elif args.cmd == "export":
+            df = results_table(conn, args.stage, done_only=not args.all)
+            write_table(df, args.out)
+            left = conn.execute("SELECT COUNT(*) FROM jobs WHERE stage = ? AND state != 'done'", (args.stage,)).fetchone()[0]
+            print(f"Wrote {len(df)} rows: {args.out}" + (f" ({left} jobs not done)" if left else ""))
+        else:
+            dead = pd.read_sql_query("SELECT id, attempts, last_error, datetime(updated_at, 'unixepoch') AS at"
+                                     " FROM jobs WHERE stage = ? AND state = 'dead' ORDER BY seq",
+                                     conn, params=(args.stage,))
+            print(dead.to_string(index=False) if len(dead) else f"No dead jobs for stage {args.stage}")
+            if args.requeue and len(dead):
+                conn.execute("UPDATE jobs SET state = 'pending', attempts = 0, not_before = 0, last_error = NULL,"
+                             " updated_at = ? WHERE stage = ? AND state = 'dead'", (time.time(), args.stage))
+                print(f"Requeued {len(dead)} jobs")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
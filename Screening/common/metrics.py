@@ -0,0 +1,253 @@
+# metrics.py — Live run metrics: console line, JSON-lines snapshots, Prometheus textfile
+#
+# --metrics prints a compact [METRICS] line every METRICS_INTERVAL seconds:
+#   articles done/total, articles/s, in-flight requests, p50/p95 request latency,
+#   failed attempts (retried) and how many of them were 429s, prompt/completion
+#   tokens per second, cache hit rate (--incremental reuse), include rate, ETA
+# --metrics-jsonl PATH appends the same numbers as one JSON object per snapshot.
+# --metrics-prom PATH rewrites a Prometheus textfile (node_exporter textfile
+# collector) at every snapshot; it is written to PATH.tmp and renamed, so the
+# exporter never reads a half-written file.
+#
+# Request-level numbers come from wrapping the client (instrument): every
+# chat.completions.create attempt is timed, its usage read and its exception
+# (if any) counted, so the stage clients and their retry loops stay unchanged.
+# For streamed calls (--early-stop) the latency is the time to the first byte
+# and no usage is reported.
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+METRICS_INTERVAL = 10.0   # seconds between snapshots
+LATENCY_WINDOW = 2048     # recent requests kept for the percentiles
+
+
+def _percentile(values, q: float) -> Optional[float]:
+    if not values:
+        return None
+    s = sorted(values)
+    return s[min(len(s) - 1, int(round(q * (len(s) - 1))))]
+
+
+def is_rate_limit(e: Exception) -> bool:
+    return getattr(e, "status_code", None) == 429 or type(e).__name__ == "RateLimitError"
+
+
+def _duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "?"
+    seconds = int(seconds)
+    h, rest = divmod(seconds, 3600)
+    m, s = divmod(rest, 60)
+    return f"{h}h{m:02d}m" if h else f"{m}m{s:02d}s"
+
+
+class _Completions:
+    def __init__(self, completions: Any, observer: Any):
+        self._completions = completions
+        self._observer = observer
+
+    def create(self, **kwargs):
+        o = self._observer
+        o.request_started()
+        t0 = time.perf_counter()
+        try:
+            response = self._completions.create(**kwargs)
+        except Exception as e:
+            o.request_finished(time.perf_counter() - t0, error=e)
+            raise
+        o.request_finished(time.perf_counter() - t0, usage=getattr(response, "usage", None))
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._completions, name)
+
+
+class _Chat:
+    def __init__(self, chat: Any, observer: Any):
+        self.completions = _Completions(chat.completions, observer)
+        self._chat = chat
+
+    def __getattr__(self, name):
+        return getattr(self._chat, name)
+
+
+class InstrumentedClient:
+    """
+    The client with every chat.completions.create attempt reported to `observer`
+    (request_started() / request_finished(latency, usage=None, error=None)).
+    Wrappers nest, so --metrics and --trace can both observe one client.
+    """
+
+    def __init__(self, client: Any, observer: Any):
+        self.chat = _Chat(client.chat, observer)
+        self._client = client
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class RunMetrics:
+    """Counters for one stage run; snapshot() emits to the console / JSONL / Prometheus textfile."""
+
+    def __init__(
+        self,
+        stage: int,
+        total: int,
+        console: bool = True,
+        jsonl_path: Optional[str] = None,
+        prom_path: Optional[str] = None,
+        interval: float = METRICS_INTERVAL,
+    ):
+        self.stage = stage
+        self.total = total
+        self.console = console
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path
+        self.interval = interval
+        self.started = time.monotonic()
+        self._last_snapshot = self.started
+        self._lock = threading.Lock()
+        # articles
+        self.done = 0
+        self.cached = 0
+        self.includes = 0
+        # requests
+        self.in_flight = 0
+        self.requests = 0
+        self.failed_attempts = 0
+        self.rate_limited = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latency_sum = 0.0
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    # ---- request hooks (called by the instrumented client) ----
+
+    def instrument(self, client: Any) -> Any:
+        """The same client, with every chat.completions.create attempt recorded here."""
+        return InstrumentedClient(client, self)
+
+    def request_started(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+
+    def request_finished(self, latency: float, usage: Any = None, error: Optional[Exception] = None) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.requests += 1
+            self.latency_sum += latency
+            self._latencies.append(latency)
+            if error is not None:
+                self.failed_attempts += 1
+                self.rate_limited += int(is_rate_limit(error))
+            elif usage is not None:
+                self.prompt_tokens += int(getattr(usage, "prompt_tokens", 0) or 0)
+                self.completion_tokens += int(getattr(usage, "completion_tokens", 0) or 0)
+
+    # ---- article hook (called by the runner per row) ----
+
+    def row(self, include: Any, cached: bool = False) -> None:
+        """Record one finished article; emits a snapshot when the interval has passed."""
+        with self._lock:
+            self.done += 1
+            self.cached += int(cached)
+            self.includes += int(bool(include))
+        if time.monotonic() - self._last_snapshot >= self.interval:
+            self.snapshot()
+
+    # ---- output ----
+
+    def values(self) -> Dict[str, Any]:
+        with self._lock:
+            elapsed = max(time.monotonic() - self.started, 1e-9)
+            latencies = list(self._latencies)
+            rate = self.done / elapsed
+            remaining = max(self.total - self.done, 0)
+            return {
+                "ts": round(time.time(), 3),
+                "stage": self.stage,
+                "elapsed_s": round(elapsed, 3),
+                "done": self.done,
+                "total": self.total,
+                "articles_per_s": round(rate, 4),
+                "in_flight": self.in_flight,
+                "requests": self.requests,
+                "latency_p50_s": _percentile(latencies, 0.50),
+                "latency_p95_s": _percentile(latencies, 0.95),
+                "latency_sum_s": round(self.latency_sum, 6),
+                "failed_attempts": self.failed_attempts,
+                "rate_limited": self.rate_limited,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "prompt_tokens_per_s": round(self.prompt_tokens / elapsed, 2),
+                "completion_tokens_per_s": round(self.completion_tokens / elapsed, 2),
+                "cache_hits": self.cached,
+                "cache_hit_rate": round(self.cached / self.done, 4) if self.done else 0.0,
+                "includes": self.includes,
+                "include_rate": round(self.includes / self.done, 4) if self.done else 0.0,
+                "eta_s": round(remaining / rate, 1) if rate > 0 else None,
+            }
+
+    def line(self, v: Optional[Dict[str, Any]] = None) -> str:
+        v = v or self.values()
+        p50 = "?" if v["latency_p50_s"] is None else f"{v['latency_p50_s']:.2f}s"
+        p95 = "?" if v["latency_p95_s"] is None else f"{v['latency_p95_s']:.2f}s"
+        return (
+            f"[METRICS] stage {v['stage']} {v['done']}/{v['total']} {v['articles_per_s']:.2f} art/s | "
+            f"in-flight {v['in_flight']} | p50 {p50} p95 {p95} | "
+            f"retries {v['failed_attempts']} (429: {v['rate_limited']}) | "
+            f"tok/s in {v['prompt_tokens_per_s']:.0f} out {v['completion_tokens_per_s']:.0f} | "
+            f"cache {v['cache_hit_rate']:.1%} | include {v['include_rate']:.1%} | ETA {_duration(v['eta_s'])}"
+        )
+
+    def prometheus(self, v: Optional[Dict[str, Any]] = None) -> str:
+        v = v or self.values()
+        label = f'{{stage="{v["stage"]}"}}'
+        out = []
+
+        def metric(name: str, kind: str, help_text: str, value: Any, labels: str = label) -> None:
+            if not any(line.startswith(f"# TYPE {name} ") for line in out):
+                out.append(f"# HELP {name} {help_text}")
+                out.append(f"# TYPE {name} {kind}")
+            if value is not None:   # unknown yet (no requests / no rate): leave the sample out
+                out.append(f"{name}{labels} {value}")
+
+        metric("screening_articles_done", "gauge", "Articles finished in this run", v["done"])
+        metric("screening_articles_total", "gauge", "Articles in this run", v["total"])
+        metric("screening_articles_per_second", "gauge", "Articles finished per second", v["articles_per_s"])
+        metric("screening_in_flight_requests", "gauge", "API requests currently open", v["in_flight"])
+        for q in ("0.5", "0.95"):
+            key = "latency_p50_s" if q == "0.5" else "latency_p95_s"
+            metric("screening_request_latency_seconds", "summary", "API request latency (recent window)",
+                   v[key], f'{{stage="{v["stage"]}",quantile="{q}"}}')
+        out.append(f"screening_request_latency_seconds_sum{label} {v['latency_sum_s']}")
+        out.append(f"screening_request_latency_seconds_count{label} {v['requests']}")
+        metric("screening_failed_attempts_total", "counter", "API attempts that raised (retried)", v["failed_attempts"])
+        metric("screening_rate_limited_total", "counter", "API attempts rejected with 429", v["rate_limited"])
+        metric("screening_prompt_tokens_total", "counter", "Prompt tokens reported by the API", v["prompt_tokens"])
+        metric("screening_completion_tokens_total", "counter", "Completion tokens reported by the API", v["completion_tokens"])
+        metric("screening_cache_hits_total", "counter", "Articles reused from the store (--incremental)", v["cache_hits"])
+        metric("screening_includes_total", "counter", "Articles included by this stage", v["includes"])
+        metric("screening_eta_seconds", "gauge", "Estimated seconds to finish the run", v["eta_s"])
+        return "\n".join(out) + "\n"
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Emit one snapshot to every configured sink."""
+        self._last_snapshot = time.monotonic()
+        v = self.values()
+        if self.console:
+            print(self.line(v), flush=True)
+        if self.jsonl_path:
+            with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(v) + "\n")
+        if self.prom_path:
+            tmp = self.prom_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(self.prometheus(v))
+            os.replace(tmp, self.prom_path)
+        return v
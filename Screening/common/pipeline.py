@@ -0,0 +1,223 @@
+# pipeline.py — In-process stage chain with warm clients and a response cache
+#
+# The runners screen one stage per process. Long-lived tools (the watch-folder
+# daemon, the HTTP service) instead keep one StageScreener per stage: its
+# utils_N module, system prompt and API client are loaded once and reused for
+# every article. A screener does what the runner's inner loop does with its
+# default flags:
+#   build_user_prompts -> call_gpt_api -> safe_json_loads -> normalize_result
+# so a decision made here is the decision a plain runner call would have made.
+# The runner-only options (--token-budget, --compress, --self-consistency,
+# --decision-only, --logprobs, --early-stop, --triage) do not apply here.
+#
+# ResponseCache keys the raw model answer by (model, system prompt, user prompt):
+# the same article text at the same stage is never sent twice, across files,
+# requests and (with a path) restarts. normalize_result is re-run on a hit, so a
+# guardrail change applies without new calls. Failed calls are not cached.
+#
+# Pipeline.run chains the stages: only articles included at stage N go on to
+# stage N+1, and they carry the stage N columns along (later stages read them
+# as prompt hints, as they do from the upstream output files).
+
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+from common.stages import STAGES, load_client, load_utils, read_system_prompt
+
+DEFAULT_MODEL = "gpt-4o"
+MEMORY_ENTRIES = 20000
+
+
+class ResponseCache:
+    """
+    Raw responses keyed by sha256(model, system prompt, user prompt). An LRU dict
+    in memory, in front of a SQLite table when `path` is given. Thread-safe.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_memory: int = MEMORY_ENTRIES):
+        self.path = path
+        self.max_memory = max_memory
+        self.hits = 0
+        self.misses = 0
+        self._mem: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        if path:
+            self._conn = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, stage INTEGER, model TEXT, raw TEXT NOT NULL, created_at REAL)"
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def key(model: str, system_prompt: str, user_prompt: str) -> str:
+        h = hashlib.sha256()
+        for part in (model, system_prompt, user_prompt):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _remember(self, key: str, raw: str) -> None:
+        self._mem[key] = raw
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_memory:
+            self._mem.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            raw = self._mem.get(key)
+            if raw is None and self._conn is not None:
+                row = self._conn.execute("SELECT raw FROM responses WHERE key = ?", (key,)).fetchone()
+                if row:
+                    raw = row[0]
+                    self._remember(key, raw)
+            elif raw is not None:
+                self._mem.move_to_end(key)
+            if raw is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return raw
+
+    def put(self, key: str, raw: str, stage: Optional[int] = None, model: Optional[str] = None) -> None:
+        with self._lock:
+            self._remember(key, raw)
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO responses (key, stage, model, raw, created_at) VALUES (?, ?, ?, ?, ?)",
+                        (key, stage, model, raw, time.time()),
+                    )
+
+    def line(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return f"[CACHE] hits={self.hits} misses={self.misses} hit_rate={rate:.1%}"
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class StageScreener:
+    """One stage, loaded once: its prompt builder, normalizer, system prompt and a warm client."""
+
+    def __init__(
+        self,
+        stage: int,
+        model: str = DEFAULT_MODEL,
+        cache: Optional[ResponseCache] = None,
+        client: Any = None,
+    ):
+        self.stage = stage
+        self.model = model
+        self.cache = cache
+        self.utils = load_utils(stage)
+        self.api = load_client(stage)
+        self.system_prompt = read_system_prompt(stage)
+        self.client = client if client is not None else self.api.create_openai_client()
+        self.include_col = f"include_stage{stage}"
+
+    def prompts(self, df: pd.DataFrame) -> List[str]:
+        return self.utils.build_user_prompts(df)
+
+    def respond(self, prompt: str) -> Tuple[Optional[str], bool]:
+        """(raw response, served from cache); raw is None when every retry failed."""
+        key = ResponseCache.key(self.model, self.system_prompt, prompt) if self.cache else None
+        if key:
+            raw = self.cache.get(key)
+            if raw is not None:
+                return raw, True
+        raw = self.api.call_gpt_api(self.client, self.system_prompt, prompt, model=self.model)
+        if key and raw is not None:
+            self.cache.put(key, raw, self.stage, self.model)
+        return raw, False
+
+    def decide(self, raw: Optional[str]) -> Dict[str, Any]:
+        return self.utils.normalize_result(self.utils.safe_json_loads(raw) or {})
+
+    def screen(self, df: pd.DataFrame, concurrency: int = 1) -> Tuple[List[Dict[str, Any]], List[Optional[str]]]:
+        """normalize_result rows (with id) for every row of df, and the raw responses (None = call failed)."""
+        prompts = self.prompts(df)
+        if concurrency > 1 and len(prompts) > 1:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                answers = list(pool.map(self.respond, prompts))
+        else:
+            answers = [self.respond(p) for p in prompts]
+        rows, raws = [], []
+        for uid, (raw, _) in zip(df["id"].tolist(), answers):
+            normalized = self.decide(raw)
+            normalized["id"] = uid
+            rows.append(normalized)
+            raws.append(raw)
+        return rows, raws
+
+
+class Pipeline:
+    """Warm screeners for a chain of stages."""
+
+    def __init__(
+        self,
+        stages: Iterable[int],
+        model: str = DEFAULT_MODEL,
+        cache: Optional[ResponseCache] = None,
+        wrap_client: Any = None,
+    ):
+        self.stages = [s for s in STAGES if s in set(stages)]
+        self.cache = cache
+        self.screeners: Dict[int, StageScreener] = {}
+        for s in self.stages:
+            screener = StageScreener(s, model, cache)
+            if wrap_client is not None:
+                screener.client = wrap_client(screener.client)
+            self.screeners[s] = screener
+
+    def run(
+        self,
+        df: pd.DataFrame,
+        concurrency: int = 1,
+        record: Optional[Callable[[int, pd.DataFrame, List[Dict[str, Any]], List[Optional[str]]], None]] = None,
+    ) -> Tuple[pd.DataFrame, List[Any]]:
+        """
+        Screen df through the chain. Returns the input rows with every stage's
+        columns (empty from the stage an article was excluded at) and the ids
+        whose API call failed at some stage (they stop there, undecided).
+        record(stage, stage input, rows, raws) is called after each stage.
+        """
+        out = df.copy()
+        alive = df
+        failed: List[Any] = []
+        for s in self.stages:
+            if alive.empty:
+                break
+            rows, raws = self.screeners[s].screen(alive, concurrency)
+            if record is not None:
+                record(s, alive, rows, raws)
+            bad = [r["id"] for r, raw in zip(rows, raws) if raw is None]
+            res = pd.DataFrame(rows)
+            stale = [c for c in res.columns if c != "id"]
+            out = out.drop(columns=stale, errors="ignore").merge(res, on="id", how="left")
+            alive = alive.drop(columns=stale, errors="ignore").merge(res, on="id", how="left")
+            failed.extend(bad)
+            keep = alive[f"include_stage{s}"].astype(bool) & ~alive["id"].isin(bad)
+            alive = alive[keep.to_numpy()].reset_index(drop=True)
+        return out, failed
+
+    def included(self, out: pd.DataFrame) -> pd.Series:
+        """Rows included by every stage of the chain."""
+        mask = pd.Series(True, index=out.index)
+        for s in self.stages:
+            col = f"include_stage{s}"
+            mask &= out[col].eq(True) if col in out.columns else False
+        return mask
@@ -0,0 +1,198 @@
+# plan.py — Pre-run cost and duration planner for a corpus (no API calls)
+#
+# Builds every stage's prompts for the corpus with the stage's own
+# build_user_prompts, counts tokens locally (common/budget.py tokenizer) and
+# projects the run through the stage chain:
+#   articles reaching stage N = corpus × pass-through rates of stages 1..N-1
+#   (the README validation funnel by default, or the include rates of the
+#   bundled per-stage outputs with --pass-rates runs)
+# Per stage it reports calls, input/output tokens, cost and wall time under the
+# rate limits and concurrency, plus the prompt-length outliers (p95, max, and the
+# prompts over the stage's --token-budget cap).
+#
+# Prompts are built on the corpus columns alone; upstream stage columns used as
+# hints by later stages do not exist yet, so those prompts can be a little longer
+# in a real run. Self-consistency re-samples are not included.
+#
+# Usage (from the Screening/ folder):
+#   python -m common.plan --input Stage_1_2019_2025_english/Data/361_articles.csv
+#   python -m common.plan --input refs_20k.csv --rpm 5000 --tpm 800000 --concurrency 8 --json plan.json
+
+import argparse
+import glob
+import json
+import math
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from common.budget import STAGE_POLICIES, get_tokenizer
+from common.stages import STAGES, build_prompts, parse_stages, read_system_prompt, stage_dir
+from common.tables import read_table
+
+# README "Pipeline Overview" validation funnel (out / in per stage)
+README_PASS_RATES: Dict[int, float] = {
+    1: 358 / 361, 2: 295 / 358, 3: 270 / 295, 4: 236 / 270, 5: 166 / 236, 6: 71 / 166, 7: 16 / 71,
+}
+
+# Full-schema answer length per stage (mean JSON length of the bundled benchmark
+# outputs at ~4 characters per token)
+OUTPUT_TOKENS: Dict[int, int] = {1: 40, 2: 35, 3: 40, 4: 35, 5: 65, 6: 45, 7: 45}
+
+# Chat-format overhead per request (role markers for the system and user messages)
+MESSAGE_OVERHEAD = 7
+
+# USD per million tokens (input, output)
+PRICES: Dict[str, tuple] = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+}
+
+
+def run_pass_rates() -> Dict[int, float]:
+    """Include rate per stage from the bundled outputs (README funnel where none is bundled)."""
+    rates = dict(README_PASS_RATES)
+    for stage in STAGES:
+        files = sorted(glob.glob(os.path.join(stage_dir(stage), "[dD]ata", f"screen_stage{stage}*.csv")))
+        full = [f for f in files if f.endswith(f"screen_stage{stage}.csv") or "full" in os.path.basename(f)]
+        if not (full or files):
+            continue
+        df = pd.read_csv((full or files)[0])
+        col = f"include_stage{stage}"
+        if col in df.columns and len(df):
+            rates[stage] = float(df[col].astype(str).str.strip().str.lower().isin(("true", "1", "yes")).mean())
+    return rates
+
+
+def _pct(values: List[int], q: float) -> int:
+    s = sorted(values)
+    return s[min(len(s) - 1, int(math.ceil(q * len(s))) - 1)] if s else 0
+
+
+def plan_stage(
+    stage: int,
+    corpus: pd.DataFrame,
+    reaching: float,
+    model: str,
+    rpm: float,
+    tpm: float,
+    concurrency: int,
+    latency: float,
+) -> Dict[str, Any]:
+    tok = get_tokenizer()
+    system_tokens = tok.count(read_system_prompt(stage))
+    user = [tok.count(p) for p in build_prompts(stage, corpus)]
+    per_call = [system_tokens + u + MESSAGE_OVERHEAD for u in user]
+    mean_in = sum(per_call) / len(per_call)
+    cap = STAGE_POLICIES[stage].prompt_tokens
+    calls = reaching
+    tokens_in = calls * mean_in
+    tokens_out = calls * OUTPUT_TOKENS[stage]
+    price_in, price_out = PRICES.get(model, PRICES["gpt-4o"])
+    # The slowest of the three limits sets the pace
+    minutes = max(
+        calls / rpm if rpm else 0.0,
+        (tokens_in + tokens_out) / tpm if tpm else 0.0,
+        calls * latency / concurrency / 60.0,
+    )
+    return {
+        "stage": stage,
+        "articles_in": round(reaching, 1),
+        "calls": math.ceil(calls),
+        "system_tokens": system_tokens,
+        "prompt_tokens_mean": round(mean_in, 1),
+        "prompt_tokens_p95": _pct(per_call, 0.95),
+        "prompt_tokens_max": max(per_call),
+        "user_prompts_over_budget": sum(1 for u in user if u > cap),
+        "budget_cap": cap,
+        "input_tokens": round(tokens_in),
+        "output_tokens": round(tokens_out),
+        "cost_usd": round(tokens_in / 1e6 * price_in + tokens_out / 1e6 * price_out, 2),
+        "minutes": round(minutes, 1),
+    }
+
+
+def plan(
+    corpus: pd.DataFrame,
+    stages: List[int],
+    rates: Dict[int, float],
+    model: str = "gpt-4o",
+    rpm: float = 500,
+    tpm: float = 30000,
+    concurrency: int = 1,
+    latency: float = 2.0,
+) -> List[Dict[str, Any]]:
+    rows = []
+    reaching = float(len(corpus))
+    for stage in STAGES:
+        if stage in stages:
+            rows.append(plan_stage(stage, corpus, reaching, model, rpm, tpm, concurrency, latency))
+        reaching *= rates[stage]
+    return rows
+
+
+def _duration(minutes: float) -> str:
+    h, m = divmod(int(round(minutes)), 60)
+    return f"{h}h{m:02d}m" if h else f"{m}m"
+
+
+def print_plan(rows: List[Dict[str, Any]], n: int, model: str, rates: Dict[int, float]) -> None:
+    tok = get_tokenizer()
+    print(f"Plan for {n} articles, model {model}, tokenizer {tok.name}"
+          + ("" if tok.exact else " (over-counts; install tiktoken with its o200k_base file for exact counts)"))
+    print(f"{'stage':>5} {'in':>9} {'pass':>6} {'calls':>7} {'tok/call':>9} {'p95':>6} {'max':>6} "
+          f"{'over cap':>8} {'input tok':>11} {'output tok':>11} {'cost $':>9} {'time':>8}")
+    for r in rows:
+        print(f"{r['stage']:>5} {r['articles_in']:>9,.0f} {rates[r['stage']]:>6.1%} {r['calls']:>7,} "
+              f"{r['prompt_tokens_mean']:>9,.0f} {r['prompt_tokens_p95']:>6,} {r['prompt_tokens_max']:>6,} "
+              f"{r['user_prompts_over_budget']:>8,} {r['input_tokens']:>11,} {r['output_tokens']:>11,} "
+              f"{r['cost_usd']:>9,.2f} {_duration(r['minutes']):>8}")
+    print(f"{'total':>5} {'':>9} {'':>6} {sum(r['calls'] for r in rows):>7,} {'':>9} {'':>6} {'':>6} {'':>8} "
+          f"{sum(r['input_tokens'] for r in rows):>11,} {sum(r['output_tokens'] for r in rows):>11,} "
+          f"{sum(r['cost_usd'] for r in rows):>9,.2f} {_duration(sum(r['minutes'] for r in rows)):>8}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Estimate calls, tokens, cost and duration of a screening run (no API calls)")
+    parser.add_argument("--input", required=True, help="Corpus table (.csv or .parquet) with id/Title/Abstract (and Year)")
+    parser.add_argument("--stages", default="1-7", help="Stages to plan, e.g. 1-7 or 5,6,7")
+    parser.add_argument("--model", default="gpt-4o")
+    parser.add_argument("--pass-rates", choices=["readme", "runs"], default="readme",
+                        help="Pass-through per stage: the README validation funnel, or the bundled per-stage outputs")
+    parser.add_argument("--pass-rate", action="append", default=[], metavar="STAGE=RATE",
+                        help="Override one stage's pass-through rate (repeatable)")
+    parser.add_argument("--rpm", type=float, default=500, help="Requests per minute limit")
+    parser.add_argument("--tpm", type=float, default=30000, help="Tokens per minute limit")
+    parser.add_argument("--concurrency", type=int, default=1, help="Requests in flight (the runners send one at a time)")
+    parser.add_argument("--latency", type=float, default=2.0, help="Seconds per request")
+    parser.add_argument("--price-in", type=float, default=None, help="USD per 1M input tokens (default: by model)")
+    parser.add_argument("--price-out", type=float, default=None, help="USD per 1M output tokens (default: by model)")
+    parser.add_argument("--json", default=None, help="Also write the plan as JSON")
+    args = parser.parse_args(argv)
+
+    rates = run_pass_rates() if args.pass_rates == "runs" else dict(README_PASS_RATES)
+    for item in args.pass_rate:
+        stage, _, rate = item.partition("=")
+        rates[int(stage)] = float(rate)
+    if args.price_in is not None or args.price_out is not None:
+        base = PRICES.get(args.model, PRICES["gpt-4o"])
+        PRICES[args.model] = (args.price_in if args.price_in is not None else base[0],
+                              args.price_out if args.price_out is not None else base[1])
+
+    corpus = read_table(args.input)
+    if corpus.empty:
+        parser.error(f"no rows in {args.input}")
+    rows = plan(corpus, parse_stages(args.stages), rates, args.model, args.rpm, args.tpm,
+                args.concurrency, args.latency)
+    print_plan(rows, len(corpus), args.model, rates)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"articles": len(corpus), "model": args.model, "pass_rates": rates, "stages": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
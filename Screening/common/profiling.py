@@ -0,0 +1,140 @@
+# profiling.py — --profile: where the wall-clock time of a stage run goes
+#
+# The runner calls prof.lap(phase) at the end of each phase; the time since the
+# previous lap is charged to that phase (one perf_counter call per lap, so the
+# timers stay on for whole runs). Phases used by the runners:
+#   setup      system prompt, row count, client and store set-up
+#   load       reading the next input chunk
+#   store      recording the articles in --db
+#   build      compression, prompt build, fingerprints and reuse lookup
+#   api        waiting on the API (including the client's retries)
+#   parse      safe_json_loads
+#   normalize  normalize_result (+ p_include)
+#   self_consistency  extra samples and the vote (Stages 5-6)
+#   record     per-row bookkeeping (store decision, metrics)
+#   sleep      --sleep between calls
+#   progress   progress lines
+#   merge      joining the results back onto the input chunk
+#   write      output table(s)
+#
+# --profile MODE adds one optional collector:
+#   timers       phase timers only (default)
+#   sample       a sampling thread that records the main thread's Python stack
+#                every SAMPLE_INTERVAL s
+#   cprofile     cProfile for the whole run; stats written to PREFIX.prof
+#   tracemalloc  allocation tracking; peak and the top allocation sites
+#
+# At the end the runner prints a summary table and writes PREFIX.folded in the
+# folded-stack format of flamegraph.pl / speedscope / inferno ("a;b;c <value>"):
+# sampled Python stacks with `sample`, otherwise one line per phase in µs.
+
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+PROFILE_MODES = ("timers", "sample", "cprofile", "tracemalloc")
+SAMPLE_INTERVAL = 0.005
+
+
+class Profiler:
+    """Phase timers for one stage run, plus the optional collector."""
+
+    def __init__(self, stage: int, mode: Optional[str] = "timers", prefix: Optional[str] = None):
+        self.stage = stage
+        self.mode = mode
+        self.enabled = mode is not None
+        self.prefix = prefix or f"profile_stage{stage}"
+        self.totals: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self.started = self._last = time.perf_counter()
+        self._samples: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._cprofile = None
+        if not self.enabled:
+            return
+        if mode == "sample":
+            self._main_ident = threading.get_ident()
+            self._sampler = threading.Thread(target=self._sample_loop, name="profile-sampler", daemon=True)
+            self._sampler.start()
+        elif mode == "cprofile":
+            import cProfile
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        elif mode == "tracemalloc":
+            import tracemalloc
+            tracemalloc.start(10)
+
+    def lap(self, phase: str) -> None:
+        """Charge the time since the previous lap to `phase`."""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.totals[phase] = self.totals.get(phase, 0.0) + (now - self._last)
+        self.counts[phase] = self.counts.get(phase, 0) + 1
+        self._last = now
+
+    # ---- sampler ----
+
+    def _sample_loop(self) -> None:
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self._main_ident)
+            if frame is None:
+                continue
+            names: List[str] = []
+            while frame is not None:
+                code = frame.f_code
+                module = frame.f_globals.get("__name__", "?")
+                names.append(f"{module}:{code.co_name}")
+                frame = frame.f_back
+            stack = ";".join([f"stage{self.stage}"] + names[::-1])
+            self._samples[stack] = self._samples.get(stack, 0) + 1
+
+    # ---- output ----
+
+    def table(self) -> str:
+        wall = time.perf_counter() - self.started
+        width = max([len(p) for p in self.totals] + [len("unattributed")])
+        lines = [
+            f"[PROFILE] stage {self.stage}: wall {wall:.3f}s (mode={self.mode})",
+            f"  {'phase':<{width}}  {'calls':>8}  {'total s':>10}  {'mean ms':>10}  {'% wall':>7}",
+        ]
+        for phase, total in sorted(self.totals.items(), key=lambda kv: -kv[1]):
+            n = self.counts[phase]
+            lines.append(f"  {phase:<{width}}  {n:>8}  {total:>10.3f}  {1000 * total / n:>10.3f}  {100 * total / wall:>6.1f}%")
+        rest = wall - sum(self.totals.values())
+        lines.append(f"  {'unattributed':<{width}}  {'':>8}  {rest:>10.3f}  {'':>10}  {100 * rest / wall:>6.1f}%")
+        return "\n".join(lines)
+
+    def folded(self) -> List[str]:
+        if self._samples:
+            return [f"{stack} {n}" for stack, n in sorted(self._samples.items())]
+        return [f"stage{self.stage};{phase} {int(round(total * 1e6))}" for phase, total in sorted(self.totals.items())]
+
+    def finish(self) -> None:
+        """Stop the collector, print the summary and write PREFIX.folded (and PREFIX.prof)."""
+        if not self.enabled:
+            return
+        if self._sampler:
+            self._stop.set()
+            self._sampler.join()
+        if self._cprofile:
+            self._cprofile.disable()
+        with open(self.prefix + ".folded", "w", encoding="utf-8") as f:
+            f.write("\n".join(self.folded()) + "\n")
+        print(self.table(), flush=True)
+        if self._cprofile:
+            import pstats
+            self._cprofile.dump_stats(self.prefix + ".prof")
+            print(f"  cProfile stats: {self.prefix}.prof; top functions by cumulative time:", flush=True)
+            pstats.Stats(self._cprofile, stream=sys.stdout).sort_stats("cumulative").print_stats(15)
+        if self.mode == "tracemalloc":
+            import tracemalloc
+            current, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics("lineno")[:10]
+            tracemalloc.stop()
+            print(f"  tracemalloc: current {current / 1024:.0f} KiB, peak {peak / 1024:.0f} KiB; top allocation sites:")
+            for stat in top:
+                print(f"    {stat.size / 1024:>9.1f} KiB  {stat.count:>7} blocks  {stat.traceback[0]}")
+        print(f"  folded stacks: {self.prefix}.folded", flush=True)
@@ -0,0 +1,152 @@
+# references.py — Read reference exports into the runners' id/Year/Title/Abstract frame
+#
+# Supported:
+#   .csv / .parquet   tables (column names matched case-insensitively; common
+#                     database export headers such as "Publication Year" or
+#                     "Abstract Note" are mapped)
+#   .ris              RIS (EndNote, Zotero, Scopus, Web of Science, Ovid)
+#   .nbib / .txt      PubMed MEDLINE format
+#
+# Only a PubMed id (or a table's own "id" column, as the runners write it) is
+# taken as the record id. An export's record numbers (RIS ID/AN, "Key", "Record
+# ID", ...) restart in every export, so they are kept as `source_id` only.
+# Records without an id get a stable one from their DOI (else title + year):
+# "R" + 12 hex digits of sha256, so the same reference exported twice, or from
+# two databases, gets the same id.
+
+import hashlib
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from common.stages import load_dedup_utils
+from common.tables import read_table
+
+COLUMNS = ("id", "Year", "Title", "Abstract", "DOI")
+EXTENSIONS = (".csv", ".parquet", ".ris", ".nbib", ".txt")
+
+# Table headers (lower-case) -> our column
+_HEADER_ALIASES: Dict[str, str] = {
+    "id": "id", "pmid": "id",
+    "key": "source_id", "record id": "source_id", "accession number": "source_id",
+    "year": "Year", "publication year": "Year", "py": "Year", "pubyear": "Year",
+    "title": "Title", "article title": "Title", "ti": "Title", "primary title": "Title",
+    "abstract": "Abstract", "abstract note": "Abstract", "ab": "Abstract",
+    "doi": "DOI", "di": "DOI",
+}
+
+# RIS tag -> our column (first tag present wins, in this order)
+_RIS_TAGS = (("source_id", ("ID", "AN")), ("Title", ("TI", "T1")), ("Abstract", ("AB", "N2")),
+             ("Year", ("PY", "Y1", "DA")), ("DOI", ("DO",)))
+_RIS_LINE = re.compile(r"^([A-Z][A-Z0-9])  -\s?(.*)$")
+
+# MEDLINE tag -> our column
+_NBIB_TAGS = {"PMID": "id", "TI": "Title", "AB": "Abstract", "DP": "Year", "LID": "DOI", "AID": "DOI"}
+_NBIB_LINE = re.compile(r"^([A-Z]{2,4})\s*- (.*)$")
+
+_YEAR = re.compile(r"(1[89]\d\d|2\d\d\d)")
+
+
+def reference_id(doi: Any, title: Any, year: Any) -> str:
+    """Stable id for a record without one (DOI first, else normalized title + year)."""
+    utils_0 = load_dedup_utils()
+    key = utils_0.normalize_doi(doi)
+    if not key:
+        key = f"{utils_0.normalize_title(title)}|{_year(year) or ''}"
+    return "R" + hashlib.sha256(key.encode("utf-8")).hexdigest()[:12]
+
+
+def _year(v: Any) -> Optional[int]:
+    m = _YEAR.search(str(v)) if v is not None else None
+    return int(m.group(1)) if m else None
+
+
+def _parse_ris(text: str) -> List[Dict[str, Any]]:
+    records, tags = [], {}
+    for line in text.splitlines():
+        m = _RIS_LINE.match(line.rstrip())
+        if not m:
+            continue
+        tag, value = m.group(1), m.group(2).strip()
+        if tag == "TY":
+            tags = {}
+        elif tag == "ER":
+            records.append(tags)
+            tags = {}
+        elif value:
+            # Repeated AB/N2 lines are continuation paragraphs
+            tags[tag] = f"{tags[tag]} {value}" if tag in tags and tag in ("AB", "N2") else tags.get(tag, value)
+    if tags:
+        records.append(tags)
+    out = []
+    for tags in records:
+        rec = {}
+        for col, names in _RIS_TAGS:
+            rec[col] = next((tags[t] for t in names if t in tags), None)
+        out.append(rec)
+    return out
+
+
+def _parse_nbib(text: str) -> List[Dict[str, Any]]:
+    out, rec, last = [], {}, None
+    for line in text.splitlines():
+        if not line.strip():
+            if rec:
+                out.append(rec)
+            rec, last = {}, None
+            continue
+        m = _NBIB_LINE.match(line)
+        if m:
+            tag, value = m.group(1), m.group(2).strip()
+            col = _NBIB_TAGS.get(tag)
+            if col == "DOI":
+                # LID/AID carry several identifiers; keep the one tagged [doi]
+                col = col if value.endswith("[doi]") else None
+                value = value.replace("[doi]", "").strip()
+            last = col if col and col not in rec else None
+            if last:
+                rec[last] = value
+        elif last and line.startswith(" "):
+            rec[last] += " " + line.strip()
+    if rec:
+        out.append(rec)
+    return out
+
+
+def _from_table(path: str) -> pd.DataFrame:
+    df = read_table(path)
+    renames = {}
+    for col in df.columns:
+        target = _HEADER_ALIASES.get(str(col).strip().lower())
+        if target and target not in renames.values() and target not in df.columns:
+            renames[col] = target
+    return df.rename(columns=renames)
+
+
+def read_references(path: str) -> pd.DataFrame:
+    """One frame per export with at least id/Year/Title/Abstract/DOI (other table columns kept)."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".csv", ".parquet"):
+        df = _from_table(path)
+    else:
+        with open(path, "r", encoding="utf-8-sig", errors="replace") as f:
+            text = f.read()
+        if ext == ".ris" or re.search(r"^TY  -", text, re.M):
+            df = pd.DataFrame(_parse_ris(text))
+        elif re.search(r"^PMID- ", text, re.M):
+            df = pd.DataFrame(_parse_nbib(text))
+        else:
+            raise ValueError(f"{path}: not a RIS or PubMed (MEDLINE) export")
+    for col in COLUMNS:
+        if col not in df.columns:
+            df[col] = None
+    df["Year"] = pd.Series([_year(v) if v is not None and not pd.isna(v) else None for v in df["Year"]],
+                           index=df.index, dtype=object)
+    missing = df["id"].isna() | (df["id"].astype(str).str.strip() == "")
+    if missing.any():
+        df.loc[missing, "id"] = [reference_id(d, t, y) for d, t, y in
+                                 zip(df.loc[missing, "DOI"], df.loc[missing, "Title"], df.loc[missing, "Year"])]
+    df["id"] = df["id"].astype(str).str.strip()
+    return df.reset_index(drop=True)
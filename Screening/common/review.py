@@ -0,0 +1,427 @@
+# review.py — Uncertainty-ranked review queue for Stage 8 (manual review)
+#
+# Ranks every article in a multi-stage table (a post_stageN table, several
+# screen_stageN tables merged on id, or `--db` for the store) by how likely its
+# final decision is wrong, so reviewers see the shakiest decisions first.
+#
+# Per stage decision the signals are:
+#   confidence   1 - certainty, where certainty is max(p, 1 - p) of
+#                p_include_stageN (--logprobs) or else confidence_stageN
+#   votes        2 × minority share of votes_include_stageN / votes_total_stageN
+#                (a 2-1 split scores 0.67, a unanimous vote 0)
+#   guardrail    normalize_result overrode the model's own include: from
+#                sc_trigger_stageN, the raw responses in --db, or a --trace file
+#   shortcut     the decision skipped the full model answer: a local --triage
+#                decision (certainty from p_triage_stageN), or an --early-stop /
+#                --decision-only row with no reason to read
+# stage score = max(confidence, votes) + the guardrail and shortcut weights.
+#
+# Only decisions that can change the final outcome count: every stage for an
+# article that came through all its stages, only the excluding stage for an
+# excluded one (an earlier include cannot change an exclusion). The article's
+# priority is its highest stage score.
+#
+# The workbook has one row per article in priority order with empty
+# review_include / review_comment columns. `ingest` reads the filled-in rows into
+# a verdicts CSV (one row per id, later verdicts win); `report` walks the
+# verdicts in queue order and estimates the error rate left in the unreviewed
+# tail from the error rate of the most recent --window reviews.
+#
+# Usage (from the Screening/ folder):
+#   python -m common.review build --input Stage_7_Cash_Releasing_Benefit/data/screen_stage7.csv --out review_queue.xlsx
+#   python -m common.review build --db screening.sqlite --trace /tmp/trace.jsonl --out review_queue.xlsx
+#   python -m common.review ingest --queue review_queue.xlsx --verdicts Stage_8_Manual_Review/review_verdicts.csv
+#   python -m common.review report --queue review_queue.xlsx --verdicts Stage_8_Manual_Review/review_verdicts.csv --target-error 0.02
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import pandas as pd
+
+from common.consistency import model_include
+from common.early_stop import TRUNCATED_REASON
+from common.stages import STAGES, SCREENING, load_utils
+from common.tables import read_table
+
+VERDICTS_PATH = os.path.join(SCREENING, "Stage_8_Manual_Review", "review_verdicts.csv")
+
+# Added to a stage score
+GUARDRAIL_WEIGHT = 0.5
+TRIAGE_WEIGHT = 0.1
+NO_REASON_WEIGHT = 0.05
+
+# Certainty assumed for a stage decision without confidence or p_include
+DEFAULT_CERTAINTY = 0.8
+
+WINDOW = 20
+TARGET_ERROR = 0.02
+
+REVIEW_COLUMNS = ["review_include", "review_comment"]
+TRUE_STRINGS = {"true", "1", "yes", "y", "include", "included", "in"}
+FALSE_STRINGS = {"false", "0", "no", "n", "exclude", "excluded", "out"}
+
+
+def _num(v: Any) -> Optional[float]:
+    try:
+        f = float(v)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(f) else f
+
+
+def _flag(v: Any) -> Optional[bool]:
+    """include_stageN / reviewer verdict -> True/False (None when blank or unreadable)."""
+    if isinstance(v, bool):
+        return v
+    if v is None or (isinstance(v, float) and math.isnan(v)):
+        return None
+    s = str(v).strip().lower()
+    if s in TRUE_STRINGS:
+        return True
+    if s in FALSE_STRINGS:
+        return False
+    return None
+
+
+# -------------------- Inputs --------------------
+
+def load_tables(sources: List[Any]) -> pd.DataFrame:
+    """Merge several stage tables (paths or frames) on id; columns from later tables win."""
+    out: Optional[pd.DataFrame] = None
+    for src in sources:
+        df = read_table(src) if isinstance(src, str) else src.copy()
+        df["id"] = df["id"].astype(str)
+        df = df.drop_duplicates("id", keep="last").set_index("id")
+        out = df if out is None else df.combine_first(out)[list(dict.fromkeys(list(out.columns) + list(df.columns)))]
+    return out.reset_index()
+
+
+def flips_from_trace(path: str) -> Set[Tuple[int, str]]:
+    """(stage, id) pairs whose trace root has guardrail.include_flip."""
+    from common.trace import read_spans
+    flips: Dict[Tuple[int, str], bool] = {}
+    for s in read_spans(path):
+        if s["name"].endswith(".article"):
+            a = s["attrs"]
+            flips[(int(a["screening.stage"]), str(a["article.id"]))] = bool(a.get("guardrail.include_flip"))
+    return {k for k, v in flips.items() if v}
+
+
+def flips_from_store(conn: Any) -> Set[Tuple[int, str]]:
+    """(stage, id) pairs whose latest stored raw response asked for a different include."""
+    from common.store import latest_decisions
+    latest = latest_decisions(conn)
+    raws = {(int(r[0]), str(r[1]), int(r[2])): r[3]
+            for r in conn.execute("SELECT stage, id, run_id, raw FROM raw_responses WHERE raw IS NOT NULL")}
+    flips = set()
+    for stage in sorted(latest["stage"].unique()):
+        parse = load_utils(int(stage)).safe_json_loads
+        for rec in latest[latest["stage"] == stage].itertuples():
+            raw = raws.get((int(stage), str(rec.id), int(rec.run_id)))
+            parsed = parse(raw) if raw else None
+            if parsed and rec.include is not None and model_include(parsed) != bool(rec.include):
+                flips.add((int(stage), str(rec.id)))
+    return flips
+
+
+# -------------------- Scoring --------------------
+
+def stage_signals(row: Dict[str, Any], stage: int, flipped: bool) -> Dict[str, Any]:
+    """Uncertainty signals of one stage decision and its score."""
+    p = _num(row.get(f"p_include_stage{stage}"))
+    conf = _num(row.get(f"confidence_stage{stage}"))
+    reason = row.get(f"reason_stage{stage}")
+    reason = "" if reason is None or (isinstance(reason, float) and math.isnan(reason)) else str(reason)
+    notes = []
+
+    triaged = reason.startswith("triage:")
+    if triaged and _num(row.get(f"p_triage_stage{stage}")) is not None:
+        p = _num(row.get(f"p_triage_stage{stage}"))
+    if p is not None:
+        certainty = max(p, 1.0 - p)
+    elif conf is not None:
+        certainty = conf
+    else:
+        certainty = DEFAULT_CERTAINTY
+        notes.append("no confidence")
+    score = 1.0 - certainty
+
+    votes = _num(row.get(f"votes_include_stage{stage}"))
+    total = _num(row.get(f"votes_total_stage{stage}"))
+    vote_split = 0.0
+    if votes is not None and total and total > 1:
+        vote_split = 2.0 * min(votes, total - votes) / total
+        if vote_split:
+            notes.append(f"votes {int(votes)}/{int(total)}")
+    score = max(score, vote_split)
+
+    flipped = flipped or row.get(f"sc_trigger_stage{stage}") == "guardrail_flip"
+    if flipped:
+        score += GUARDRAIL_WEIGHT
+        notes.append("guardrail flip")
+    shortcut = ""
+    if triaged:
+        shortcut = "triage"
+        score += TRIAGE_WEIGHT
+    elif reason == TRUNCATED_REASON or not reason:
+        shortcut = "early-stop" if reason else "no reason"
+        score += NO_REASON_WEIGHT
+    if shortcut:
+        notes.append(shortcut)
+    if certainty < DEFAULT_CERTAINTY and "no confidence" not in notes:
+        notes.insert(0, f"certainty {certainty:.2f}")
+    return {
+        "stage": stage,
+        "certainty": round(certainty, 4),
+        "vote_split": round(vote_split, 4),
+        "guardrail_flip": flipped,
+        "shortcut": shortcut,
+        "score": round(score, 4),
+        "notes": ", ".join(notes),
+    }
+
+
+def build_queue(df: pd.DataFrame, flips: Optional[Set[Tuple[int, str]]] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """(queue, signals): one row per article in priority order, one row per counted stage decision."""
+    flips = flips or set()
+    stages = [s for s in STAGES if f"include_stage{s}" in df.columns]
+    queue, signals = [], []
+    for row in df.to_dict("records"):
+        uid = str(row["id"])
+        decisions = [(s, _flag(row.get(f"include_stage{s}"))) for s in stages]
+        decisions = [(s, inc) for s, inc in decisions if inc is not None]
+        if not decisions:
+            continue
+        excluded = [s for s, inc in decisions if not inc]
+        counted = excluded[:1] or [s for s, _ in decisions]
+        rows = [stage_signals(row, s, (s, uid) in flips) for s in counted]
+        top = max(rows, key=lambda r: r["score"])
+        for r in rows:
+            signals.append({"id": uid, **r})
+        queue.append({
+            "id": uid,
+            "priority": top["score"],
+            "pipeline_include": not excluded,
+            "deciding_stage": top["stage"],
+            "why": "; ".join(f"stage {r['stage']}: {r['notes']}" for r in rows if r["notes"]),
+            **{c: None for c in REVIEW_COLUMNS},
+            **{c: row.get(c) for c in ("Year", "Title", "Abstract") if c in row},
+            **{f"include_stage{s}": inc for s, inc in decisions},
+            **{f"reason_stage{s}": row.get(f"reason_stage{s}") for s, _ in decisions},
+        })
+    out = pd.DataFrame(queue)
+    if out.empty:
+        return out, pd.DataFrame(signals)
+    # Ties (e.g. equal confidence) keep the input order
+    out = out.sort_values("priority", ascending=False, kind="stable").reset_index(drop=True)
+    out.insert(0, "rank", range(1, len(out) + 1))
+    return out, pd.DataFrame(signals)
+
+
+INSTRUCTIONS = [
+    "Review from the top: rows are ranked by how likely the pipeline decision is wrong.",
+    "Fill review_include with include / exclude (or True / False) and, optionally, review_comment.",
+    "pipeline_include is the decision you are checking; why lists the signals behind the priority.",
+    "Leave rows you have not reviewed blank, then run: python -m common.review ingest --queue <this file>",
+    "Signals sheet: every stage decision that was scored (certainty, vote split, guardrail flip, shortcut).",
+]
+
+
+def write_workbook(queue: pd.DataFrame, signals: pd.DataFrame, path: str) -> None:
+    from openpyxl.styles import Font
+    with pd.ExcelWriter(path, engine="openpyxl") as xw:
+        queue.to_excel(xw, sheet_name="Queue", index=False)
+        signals.to_excel(xw, sheet_name="Signals", index=False)
+        pd.DataFrame({"How to review": INSTRUCTIONS}).to_excel(xw, sheet_name="Instructions", index=False)
+        ws = xw.sheets["Queue"]
+        ws.freeze_panes = "C2"
+        ws.auto_filter.ref = ws.dimensions
+        widths = {"why": 50, "Title": 60, "Abstract": 80, "review_comment": 40}
+        for i, col in enumerate(queue.columns, start=1):
+            ws.cell(row=1, column=i).font = Font(bold=True)
+            ws.column_dimensions[ws.cell(row=1, column=i).column_letter].width = widths.get(
+                col, 40 if col.startswith("reason_") else max(10, len(col) + 2))
+        xw.sheets["Instructions"].column_dimensions["A"].width = 110
+
+
+# -------------------- Verdicts --------------------
+
+def read_queue(path: str) -> pd.DataFrame:
+    q = pd.read_excel(path, sheet_name="Queue", dtype={"id": str})
+    q["id"] = q["id"].astype(str)
+    return q
+
+
+def read_verdicts(path: str) -> pd.DataFrame:
+    v = pd.read_csv(path, dtype={"id": str, "review_comment": str, "reviewer": str})
+    v["review_comment"] = v["review_comment"].fillna("")
+    v["review_include"] = v["review_include"].map(_flag)
+    return v
+
+
+def ingest(queue_path: str, verdicts_path: str, reviewer: str = "") -> Tuple[int, int]:
+    """Add the filled-in review_include rows to the verdicts CSV; returns (new or changed, unreadable)."""
+    q = read_queue(queue_path)
+    q["verdict"] = q["review_include"].map(_flag)
+    unreadable = int((q["review_include"].notna() & q["verdict"].isna()).sum())
+    done = q[q["verdict"].notna()]
+    new = pd.DataFrame({
+        "id": done["id"],
+        "review_include": done["verdict"].astype(bool),
+        "review_comment": done["review_comment"].fillna("").astype(str),
+        "pipeline_include": done["pipeline_include"].map(_flag),
+        "priority": done["priority"],
+        "reviewer": reviewer,
+        "reviewed_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    })
+    changed = len(new)
+    if os.path.exists(verdicts_path):
+        old = read_verdicts(verdicts_path)
+        same = old.merge(new[["id", "review_include", "review_comment"]], on=["id", "review_include", "review_comment"])
+        changed -= len(same)
+        new = new[~new["id"].isin(same["id"])]
+        new = pd.concat([old[~old["id"].isin(new["id"])], new], ignore_index=True)
+    os.makedirs(os.path.dirname(os.path.abspath(verdicts_path)), exist_ok=True)
+    new.to_csv(verdicts_path, index=False)
+    return changed, unreadable
+
+
+def wilson_upper(errors: int, n: int, z: float = 1.96) -> float:
+    if n == 0:
+        return 1.0
+    p = errors / n
+    centre = p + z * z / (2 * n)
+    spread = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n))
+    return min(1.0, (centre + spread) / (1 + z * z / n))
+
+
+def progress(queue: pd.DataFrame, verdicts: pd.DataFrame, window: int = WINDOW) -> pd.DataFrame:
+    """
+    One row per review, in queue order: errors found so far and the estimated
+    error rate left in the whole set. The unreviewed tail is assumed to be no
+    worse than the last `window` reviews (it ranks lower), smoothed as
+    (errors + 0.5) / (n + 1) so a clean window never estimates zero.
+    """
+    n_total = len(queue)
+    v = queue[["rank", "id", "pipeline_include"]].merge(verdicts[["id", "review_include"]], on="id")
+    v = v.sort_values("rank").reset_index(drop=True)
+    wrong = (v["pipeline_include"].map(_flag) != v["review_include"].map(_flag)).tolist()
+    rows = []
+    for k in range(1, len(v) + 1):
+        recent = wrong[max(0, k - window):k]
+        rate = (sum(recent) + 0.5) / (len(recent) + 1)
+        rows.append({
+            "reviewed": k,
+            "rank": int(v.loc[k - 1, "rank"]),
+            "errors_found": sum(wrong[:k]),
+            "window_error_rate": round(rate, 4),
+            "window_upper": round(wilson_upper(sum(recent), len(recent)), 4),
+            "residual_error": round(rate * (n_total - k) / n_total, 4),
+        })
+    return pd.DataFrame(rows)
+
+
+def report(queue_path: str, verdicts_path: str, target: float = TARGET_ERROR, window: int = WINDOW,
+           step: int = 10) -> Optional[int]:
+    """Print review progress; returns the number of reviews that reached the target (None if not yet)."""
+    queue = read_queue(queue_path)
+    verdicts = read_verdicts(verdicts_path)
+    prog = progress(queue, verdicts, window)
+    n = len(queue)
+    print(f"Review queue: {n} articles, {len(prog)} reviewed; target residual error {target:.1%} (window {window})")
+    if prog.empty:
+        return None
+    gaps = int(prog["rank"].iloc[-1]) - len(prog)
+    if gaps:
+        print(f"  note: {gaps} higher-ranked rows are still unreviewed; the estimate assumes queue order")
+    print(f"  {'reviewed':>8} {'rank':>6} {'errors':>7} {'window rate':>12} {'95% upper':>10} {'residual':>9}")
+    shown = prog[(prog["reviewed"] % step == 0) | (prog.index == len(prog) - 1)]
+    for r in shown.itertuples():
+        print(f"  {r.reviewed:>8} {r.rank:>6} {r.errors_found:>7} {r.window_error_rate:>12.1%} "
+              f"{r.window_upper:>10.1%} {r.residual_error:>9.1%}")
+    errors = int(prog["errors_found"].iloc[-1])
+    print(f"  errors found: {errors} ({errors / len(prog):.1%} of reviews)")
+    reached = prog[(prog["reviewed"] >= min(window, n)) & (prog["residual_error"] <= target)]
+    if reached.empty:
+        print(f"  target not reached yet: estimated residual error {prog['residual_error'].iloc[-1]:.1%}")
+        return None
+    k = int(reached["reviewed"].iloc[0])
+    print(f"  target reached after {k} reviews ({k / n:.0%} of the queue)")
+    return k
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Uncertainty-ranked Stage 8 review queue")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("build", help="Rank articles by decision uncertainty and write the review workbook")
+    p.add_argument("--input", action="append", default=[], help="Stage table with include_stageN columns (repeatable, merged on id)")
+    p.add_argument("--db", default=None, help="Use the latest decisions in the SQLite store (and its raw responses)")
+    p.add_argument("--trace", action="append", default=[], help="--trace file(s) with guardrail flips (repeatable)")
+    p.add_argument("--out", required=True, help="Workbook to write (.xlsx)")
+    p.add_argument("--included-only", action="store_true", help="Only articles the pipeline included")
+    p.add_argument("--top", type=int, default=None, help="Keep the first N rows")
+
+    p = sub.add_parser("ingest", help="Record the filled-in review_include rows of a queue workbook")
+    p.add_argument("--queue", required=True)
+    p.add_argument("--verdicts", default=VERDICTS_PATH)
+    p.add_argument("--reviewer", default="")
+
+    p = sub.add_parser("report", help="Reviews needed to reach a target residual error")
+    p.add_argument("--queue", required=True)
+    p.add_argument("--verdicts", default=VERDICTS_PATH)
+    p.add_argument("--target-error", type=float, default=TARGET_ERROR)
+    p.add_argument("--window", type=int, default=WINDOW)
+    p.add_argument("--step", type=int, default=10, help="Print every Nth review")
+    p.add_argument("--json", default=None, help="Also write the per-review progress as JSON")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "build":
+        if not args.input and not args.db:
+            parser.error("build needs --input or --db")
+        flips: Set[Tuple[int, str]] = set()
+        if args.db:
+            from common.store import connect, wide_table
+            conn = connect(args.db)
+            try:
+                df = wide_table(conn)
+                flips |= flips_from_store(conn)
+            finally:
+                conn.close()
+            df = load_tables([df] + args.input)
+        else:
+            df = load_tables(args.input)
+        for path in args.trace:
+            flips |= flips_from_trace(path)
+        queue, signals = build_queue(df, flips)
+        if args.included_only and not queue.empty:
+            queue = queue[queue["pipeline_include"]].reset_index(drop=True)
+            queue["rank"] = range(1, len(queue) + 1)
+        if args.top:
+            queue = queue.head(args.top)
+        signals = signals[signals["id"].isin(queue["id"])] if not signals.empty else signals
+        write_workbook(queue, signals, args.out)
+        print(f"Wrote {len(queue)} articles to {args.out} "
+              f"({int(queue['pipeline_include'].sum()) if len(queue) else 0} included; "
+              f"{len(flips)} guardrail flips; top priority {queue['priority'].max() if len(queue) else 0:.2f})")
+    elif args.cmd == "ingest":
+        changed, unreadable = ingest(args.queue, args.verdicts, args.reviewer)
+        print(f"{changed} new or changed verdicts -> {args.verdicts}"
+              + (f"; {unreadable} review_include values not understood (use include/exclude)" if unreadable else ""))
+    else:
+        if not os.path.exists(args.verdicts):
+            parser.error(f"no verdicts yet: {args.verdicts} (run ingest first)")
+        report(args.queue, args.verdicts, args.target_error, args.window, args.step)
+        if args.json:
+            prog = progress(read_queue(args.queue), read_verdicts(args.verdicts), args.window)
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(prog.to_dict("records"), f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,365 @@
+# service.py — Local HTTP screening service for single articles
+#
+#   POST /screen   {"title": ..., "abstract": ..., "year": 2021, "id": "J500",
+#                   "stages": "1-7", "all": false, "timeout": 30}
+#   GET  /health   loaded stages, cache and coalescing counters
+#
+# Each stage uses the same StageScreener as the watch-folder daemon
+# (common/pipeline.py): the stage's build_user_prompts, its openai_client and its
+# normalize_result, loaded once with a warm client. By default the chain stops at
+# the first stage that excludes (as the batch pipeline does); "all": true runs
+# every requested stage. Later stages see the earlier stages' columns as hints.
+#
+# Per stage call:
+#   1) the response cache (--cache, else memory only) answers repeated articles
+#   2) identical calls already in flight are coalesced: the second request waits
+#      on the first one's answer instead of sending its own
+#   3) otherwise the call runs on a pool of --concurrency threads
+# The request as a whole has a deadline ("timeout" in the body, else --timeout).
+# When it passes, the reply is 504 with the stages finished so far; the call in
+# flight still completes and lands in the cache. A stage that raises (prompt
+# builder, client or normalizer) ends the request with a 500 JSON reply.
+#
+# Load testing without the API: start the benchmarks' fake OpenAI endpoint and
+# point the client at it (the openai package reads OPENAI_BASE_URL):
+#   python benchmarks/fake_openai.py --port 8001 --latency-ms 800 --jitter-ms 200
+#   OPENAI_BASE_URL=http://127.0.0.1:8001/v1 python -m common.service serve --port 8765
+#   python -m common.service loadtest --url http://127.0.0.1:8765 \
+#          --input Stage_1_2019_2025_english/Data/361_articles.csv --requests 500 --concurrency 32
+#
+# Usage (from the Screening/ folder):
+#   python -m common.service serve --port 8765 --stages 1-7 --cache service_cache.sqlite
+#   curl -s localhost:8765/screen -d '{"title": "...", "abstract": "...", "year": 2022, "stages": "1-3"}'
+
+import argparse
+import json
+import signal
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from common.pipeline import DEFAULT_MODEL, ResponseCache, StageScreener
+from common.references import reference_id
+from common.stages import parse_stages
+from common.store import json_default
+from common.tables import read_table
+from common.workers import RateBudget
+
+DEFAULT_PORT = 8765
+DEFAULT_TIMEOUT = 60.0
+DEFAULT_CONCURRENCY = 16
+MAX_BODY = 1 << 20
+
+
+class Coalescer:
+    """Runs one call per key at a time; callers asking for a key already in flight share its Future."""
+
+    def __init__(self, pool: ThreadPoolExecutor):
+        self.pool = pool
+        self.coalesced = 0
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key: str, fn: Callable[[], Any]) -> Tuple[Future, bool]:
+        """(future, True when it is another caller's call already in flight)."""
+        with self._lock:
+            fut = self._inflight.get(key)
+            if fut is not None:
+                self.coalesced += 1
+                return fut, True
+            fut = self.pool.submit(fn)
+            self._inflight[key] = fut
+        fut.add_done_callback(lambda _: self._done(key))
+        return fut, False
+
+    def _done(self, key: str) -> None:
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    @property
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # the default 5 drops connections under concurrent load
+
+
+class RequestError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class ScreeningService:
+    def __init__(
+        self,
+        stages: List[int],
+        model: str = DEFAULT_MODEL,
+        cache_path: Optional[str] = None,
+        timeout: float = DEFAULT_TIMEOUT,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        rpm: Optional[float] = None,
+    ):
+        self.stages = stages
+        self.model = model
+        self.timeout = timeout
+        self.cache = ResponseCache(cache_path)
+        budget = RateBudget(rpm)
+        self.screeners: Dict[int, StageScreener] = {}
+        for s in stages:
+            screener = StageScreener(s, model, self.cache)
+            screener.client = budget.instrument(screener.client)
+            self.screeners[s] = screener
+        self.pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="model")
+        self.coalescer = Coalescer(self.pool)
+        self._lock = threading.Lock()
+        self.counts = {"requests": 0, "ok": 0, "timeouts": 0, "errors": 0, "model_calls": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] += 1
+
+    def _call(self, screener: StageScreener, prompt: str) -> Optional[str]:
+        self._count("model_calls")
+        raw = screener.api.call_gpt_api(screener.client, screener.system_prompt, prompt, model=screener.model)
+        if raw is not None:
+            self.cache.put(ResponseCache.key(screener.model, screener.system_prompt, prompt), raw,
+                           screener.stage, screener.model)
+        return raw
+
+    def _respond(self, screener: StageScreener, prompt: str, deadline: float) -> Tuple[Optional[str], str]:
+        """(raw, source) where source is cache / coalesced / model."""
+        key = ResponseCache.key(screener.model, screener.system_prompt, prompt)
+        raw = self.cache.get(key)
+        if raw is not None:
+            return raw, "cache"
+        fut, coalesced = self.coalescer.submit(key, lambda: self._call(screener, prompt))
+        return fut.result(timeout=max(0.0, deadline - time.monotonic())), "coalesced" if coalesced else "model"
+
+    def _article(self, body: Dict[str, Any]) -> pd.DataFrame:
+        title, abstract = body.get("title") or "", body.get("abstract") or ""
+        if not str(title).strip() and not str(abstract).strip():
+            raise RequestError(400, "title or abstract is required")
+        year = body.get("year")
+        uid = body.get("id") or reference_id(body.get("doi"), title, year)
+        return pd.DataFrame({"id": [str(uid)], "Year": pd.Series([year], dtype=object),
+                             "Title": [title], "Abstract": [abstract]})
+
+    def _stages(self, body: Dict[str, Any]) -> List[int]:
+        value = body.get("stages")
+        if value is None:
+            return self.stages
+        stages = parse_stages(",".join(map(str, value)) if isinstance(value, list) else value)
+        missing = [s for s in stages if s not in self.screeners]
+        if not stages or missing:
+            raise RequestError(400, f"stages must be a subset of the loaded stages {self.stages}")
+        return stages
+
+    def screen(self, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        started = time.monotonic()
+        self._count("requests")
+        try:
+            article = self._article(body)
+            stages = self._stages(body)
+            timeout = float(body.get("timeout") or self.timeout)
+        except (RequestError, ValueError, TypeError) as e:
+            self._count("errors")
+            return getattr(e, "status", 400), {"error": str(e)}
+        deadline = started + timeout
+        run_all = bool(body.get("all", False))
+        results: Dict[str, Dict[str, Any]] = {}
+        included = True
+        status, error = 200, None
+        for s in stages:
+            screener = self.screeners[s]
+            t0 = time.monotonic()
+            try:
+                raw, source = self._respond(screener, screener.prompts(article)[0], deadline)
+                normalized = screener.decide(raw) if raw is not None else None
+            except FutureTimeout:
+                status, error = 504, f"timed out after {timeout:g}s at stage {s}"
+                break
+            except Exception as e:  # a stage bug answers this request, not the connection
+                status, error = 500, f"stage {s} failed: {type(e).__name__}: {e}"
+                break
+            if normalized is None:
+                status, error = 502, f"model call failed at stage {s}"
+                break
+            for k, v in normalized.items():
+                article[k] = pd.Series([v], dtype=object)
+            results[str(s)] = dict(normalized, source=source, ms=round((time.monotonic() - t0) * 1000, 1))
+            if not normalized.get(screener.include_col, False):
+                included = False
+                if not run_all:
+                    break
+        self._count({200: "ok", 504: "timeouts"}.get(status, "errors"))
+        reply: Dict[str, Any] = {
+            "id": article["id"].iat[0],
+            "included": included if status == 200 else None,
+            "stopped_at": next((int(s) for s, r in results.items() if not r.get(f"include_stage{s}")), None),
+            "stages": results,
+            "elapsed_ms": round((time.monotonic() - started) * 1000, 1),
+        }
+        if error:
+            reply["error"] = error
+        return status, reply
+
+    def health(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self.counts)
+        return dict(counts, stages=self.stages, model=self.model, inflight=self.coalescer.inflight,
+                    coalesced=self.coalescer.coalesced, cache_hits=self.cache.hits, cache_misses=self.cache.misses)
+
+    def close(self) -> None:
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.cache.close()
+
+
+def _handler(service: ScreeningService, access_log: bool) -> type:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self, status: int, payload: Dict[str, Any]) -> None:
+            data = json.dumps(payload, ensure_ascii=False, default=json_default).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self) -> None:
+            if self.path.rstrip("/") == "/health":
+                self._reply(200, service.health())
+            else:
+                self._reply(404, {"error": "not found"})
+
+        def do_POST(self) -> None:
+            if self.path.rstrip("/") != "/screen":
+                self._reply(404, {"error": "not found"})
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_BODY:
+                self._reply(413, {"error": "request body too large"})
+                return
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if not isinstance(body, dict):
+                    raise ValueError("body must be a JSON object")
+            except ValueError as e:
+                self._reply(400, {"error": f"invalid JSON: {e}"})
+                return
+            self._reply(*service.screen(body))
+
+        def log_message(self, fmt: str, *args: Any) -> None:
+            if access_log:
+                super().log_message(fmt, *args)
+
+    return Handler
+
+
+def serve(args: argparse.Namespace) -> None:
+    started = time.time()
+    service = ScreeningService(parse_stages(args.stages), args.model, args.cache, args.timeout,
+                               args.concurrency, args.rpm)
+    server = _Server((args.host, args.port), _handler(service, args.access_log))
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown, daemon=True).start())
+    print(f"[SERVICE] stages {service.stages} loaded in {time.time() - started:.1f}s; "
+          f"listening on http://{args.host}:{server.server_port}/screen", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        print(f"[SERVICE] stopped | {json.dumps(service.health())}", flush=True)
+
+
+# -------------------- Load test --------------------
+
+def _post(url: str, body: Dict[str, Any], timeout: float) -> Tuple[int, float]:
+    data = json.dumps(body, default=json_default).encode("utf-8")
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    t0 = time.monotonic()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = 0
+    return status, time.monotonic() - t0
+
+
+def _pct(values: List[float], q: float) -> float:
+    s = sorted(values)
+    return s[min(len(s) - 1, int(q * len(s)))] if s else 0.0
+
+
+def loadtest(args: argparse.Namespace) -> None:
+    df = read_table(args.input).head(args.articles) if args.articles else read_table(args.input)
+    records = [{"id": str(r.get("id")), "title": r.get("Title"), "abstract": r.get("Abstract"),
+                "year": r.get("Year"), "stages": args.stages}
+               for r in df.astype(object).where(df.notna(), None).to_dict("records")]
+    bodies = [records[i % len(records)] for i in range(args.requests)]
+    url = args.url.rstrip("/") + "/screen"
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(lambda b: _post(url, b, args.timeout), bodies))
+    wall = time.monotonic() - started
+    latencies = [lat for _, lat in results]
+    statuses: Dict[int, int] = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    print(f"[LOAD] {len(results)} requests ({len(records)} distinct articles) at concurrency {args.concurrency} "
+          f"in {wall:.1f}s = {len(results) / wall:.1f} req/s")
+    print(f"[LOAD] latency p50 {_pct(latencies, .5) * 1000:.0f}ms  p95 {_pct(latencies, .95) * 1000:.0f}ms  "
+          f"p99 {_pct(latencies, .99) * 1000:.0f}ms  max {max(latencies) * 1000:.0f}ms")
+    print(f"[LOAD] status {dict(sorted(statuses.items()))}")
+    try:
+        with urllib.request.urlopen(args.url.rstrip("/") + "/health", timeout=10) as resp:
+            print(f"[LOAD] service {resp.read().decode('utf-8')}")
+    except Exception:
+        pass
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Local HTTP screening service for single articles")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("serve", help="Serve POST /screen")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=DEFAULT_PORT)
+    p.add_argument("--stages", default="1-7", help="Stages to load; requests may select any subset")
+    p.add_argument("--model", default=DEFAULT_MODEL)
+    p.add_argument("--cache", default=None, help="SQLite response cache that survives restarts (default: memory only)")
+    p.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="Default per-request deadline in seconds")
+    p.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Model calls in flight")
+    p.add_argument("--rpm", type=float, default=None, help="Cap model requests per minute")
+    p.add_argument("--access-log", action="store_true", help="Log every HTTP request")
+
+    p = sub.add_parser("loadtest", help="Fire concurrent /screen requests and report throughput and latency")
+    p.add_argument("--url", default=f"http://127.0.0.1:{DEFAULT_PORT}")
+    p.add_argument("--input", required=True, help="Articles table (id/Year/Title/Abstract)")
+    p.add_argument("--articles", type=int, default=None, help="Use only the first N articles (more repeats)")
+    p.add_argument("--requests", type=int, default=200)
+    p.add_argument("--concurrency", type=int, default=16)
+    p.add_argument("--stages", default="1-7")
+    p.add_argument("--timeout", type=float, default=120.0, help="Client-side timeout per request")
+
+    args = parser.parse_args(argv)
+    {"serve": serve, "loadtest": loadtest}[args.cmd](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
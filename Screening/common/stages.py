@@ -0,0 +1,82 @@
+# stages.py — Where each stage lives, and loading its utils / system prompt
+#
+# The stage runners import their own utils_N.py with a flat import (the stage
+# folder is the working directory). Tools that work across stages (plan, the
+# review queue, the service) load them through here instead.
+
+import importlib
+import importlib.util
+import os
+import sys
+from types import ModuleType
+from typing import Dict, List
+
+import pandas as pd
+
+SCREENING = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+STAGE_DIRS: Dict[int, str] = {
+    1: "Stage_1_2019_2025_english",
+    2: "Stage_2_UK_Based_Study",
+    3: "Stage_3_Occur_In_NHS",
+    4: "Stage_4_Exclude_PEC_NonPeerReviewed",
+    5: "Stage_5_Comparator_And_Outcomes",
+    6: "Stage_6_NHS_3_Shifts",
+    7: "Stage_7_Cash_Releasing_Benefit",
+}
+STAGES = tuple(sorted(STAGE_DIRS))
+DEDUP_DIR = "Stage_0_Deduplication"
+
+
+def parse_stages(text: str) -> List[int]:
+    """'1-7' / '5,6,7' / '2-4,7' -> known stages in pipeline order."""
+    out: List[int] = []
+    for part in str(text).split(","):
+        if not part.strip():
+            continue
+        a, _, b = part.partition("-")
+        out.extend(range(int(a), int(b or a) + 1))
+    return [s for s in STAGES if s in out]
+
+
+def stage_dir(stage: int) -> str:
+    return os.path.join(SCREENING, STAGE_DIRS[stage])
+
+
+def load_utils(stage: int) -> ModuleType:
+    """The stage's utils_N module (build_user_prompts, normalize_result, safe_json_loads, PROMPT_COLUMNS)."""
+    path = stage_dir(stage)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    return importlib.import_module(f"utils_{stage}")
+
+
+def load_dedup_utils() -> ModuleType:
+    """Stage 0's utils_0 module (normalize_doi, normalize_title, cluster_references)."""
+    path = os.path.join(SCREENING, DEDUP_DIR)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    return importlib.import_module("utils_0")
+
+
+def load_client(stage: int) -> ModuleType:
+    """The stage's own openai_client module (each stage folder has a copy)."""
+    path = os.path.join(stage_dir(stage), "openai_client.py")
+    spec = importlib.util.spec_from_file_location(f"openai_client_stage{stage}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def system_prompt_path(stage: int) -> str:
+    return os.path.join(stage_dir(stage), f"system_prompt_{stage}.txt")
+
+
+def read_system_prompt(stage: int) -> str:
+    with open(system_prompt_path(stage), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def build_prompts(stage: int, df: pd.DataFrame) -> List[str]:
+    """User prompts for `df` (id/Title/Abstract columns) with the stage's own builder."""
+    return load_utils(stage).build_user_prompts(df)
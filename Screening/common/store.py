@@ -0,0 +1,437 @@
+# store.py — One SQLite store for articles, stage decisions, raw model responses and runs
+#
+# Runners write into it with --db (see ScreeningStore); everything else is a query:
+#   python -m common.store --db screening.sqlite why J500
+#   python -m common.store --db screening.sqlite runs
+#   python -m common.store --db screening.sqlite export --out all_stages.parquet
+#   python -m common.store --db screening.sqlite survivors --stage 4 --out ../Stage_5_Comparator_And_Outcomes/data/in.csv
+#   python -m common.store --db screening.sqlite import --stage 7 ../Stage_7_Cash_Releasing_Benefit/data/screen_stage7.csv
+#
+# "Latest" always means the decision from the highest run_id for that (stage, id).
+
+import json
+import os
+import sqlite3
+import sys
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from common.fingerprint import StageFingerprint
+from common.tables import LIST_COLUMNS, parse_list, read_table, write_table
+
+BATCH_SIZE = 200
+
+# Columns each stage's normalize_result adds to the merged table
+STAGE_FIELDS: Dict[int, tuple] = {
+    1: ("include_stage1", "reason_stage1", "detected_language", "publication_year", "confidence_stage1"),
+    2: ("include_stage2", "reason_stage2", "detected_setting", "confidence_stage2"),
+    3: ("include_stage3", "reason_stage3", "detected_context", "confidence_stage3"),
+    4: ("include_stage4", "reason_stage4", "publication_type", "confidence_stage4"),
+    5: ("include_stage5", "reason_stage5", "has_comparator", "detected_comparator",
+        "has_primary_outcomes", "detected_outcomes", "confidence_stage5"),
+    6: ("include_stage6", "reason_stage6", "main_shift", "shifts_detected", "confidence_stage6"),
+    7: ("include_stage7", "reason_stage7", "cash_saving_terms", "confidence_stage7"),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    stage         INTEGER NOT NULL,
+    model         TEXT,
+    system_prompt TEXT,
+    input_path    TEXT,
+    output_path   TEXT,
+    argv          TEXT,
+    started_at    REAL NOT NULL,
+    finished_at   REAL,
+    n_rows        INTEGER,
+    n_reused      INTEGER,
+    n_recomputed  INTEGER
+);
+CREATE TABLE IF NOT EXISTS articles (
+    id         TEXT PRIMARY KEY,
+    year       TEXT,
+    title      TEXT,
+    abstract   TEXT,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS decisions (
+    run_id     INTEGER NOT NULL REFERENCES runs(run_id),
+    stage      INTEGER NOT NULL,
+    id         TEXT NOT NULL,
+    include    INTEGER,
+    confidence REAL,
+    reason     TEXT,
+    fields     TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    fingerprint TEXT,
+    input_fp   TEXT,
+    prompt_fp  TEXT,
+    code_fp    TEXT,
+    reused     INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (run_id, stage, id)
+);
+CREATE INDEX IF NOT EXISTS ix_decisions_id_stage ON decisions (id, stage, run_id);
+CREATE INDEX IF NOT EXISTS ix_decisions_stage_run ON decisions (stage, run_id);
+CREATE TABLE IF NOT EXISTS raw_responses (
+    run_id     INTEGER NOT NULL REFERENCES runs(run_id),
+    stage      INTEGER NOT NULL,
+    id         TEXT NOT NULL,
+    raw        TEXT,
+    prompt     TEXT,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (run_id, stage, id)
+);
+CREATE INDEX IF NOT EXISTS ix_raw_id_stage ON raw_responses (id, stage);
+"""
+
+# Columns added after the first release of the store (ALTER TABLE on older files)
+_MIGRATIONS = {
+    "runs": (("n_reused", "INTEGER"), ("n_recomputed", "INTEGER")),
+    "decisions": (("fingerprint", "TEXT"), ("input_fp", "TEXT"), ("prompt_fp", "TEXT"),
+                  ("code_fp", "TEXT"), ("reused", "INTEGER NOT NULL DEFAULT 0")),
+}
+
+# Latest decision per (stage, id)
+_LATEST = """
+SELECT d.* FROM decisions d
+JOIN (SELECT stage, id, MAX(run_id) AS run_id FROM decisions {where} GROUP BY stage, id) m
+  ON d.stage = m.stage AND d.id = m.id AND d.run_id = m.run_id
+"""
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """Open (and create if needed) the store in WAL mode so readers never block the writer."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30.0)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    for table, cols in _MIGRATIONS.items():
+        if conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone():
+            have = {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+            for name, decl in cols:
+                if name not in have:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def json_default(v: Any) -> Any:
+    """json.dumps default= for numpy/pandas values (shared by every module that writes JSON rows)."""
+    if hasattr(v, "tolist"):
+        return v.tolist()
+    if hasattr(v, "item"):
+        return v.item()
+    return str(v)
+
+
+def clean(v: Any) -> Any:
+    """NaN/NA -> None so JSON and SQLite get NULL."""
+    if v is None or isinstance(v, (list, tuple, dict)):
+        return v
+    try:
+        return None if pd.isna(v) else v
+    except (TypeError, ValueError):
+        return v
+
+
+def _text(v: Any) -> Optional[str]:
+    v = clean(v)
+    return None if v is None else str(v)
+
+
+class ScreeningStore:
+    """
+    Batched writer used by the runners. Decisions and raw responses are buffered
+    and flushed every `batch_size` rows in one transaction (and on close).
+
+        with ScreeningStore(args.db) as store:
+            run_id = store.start_run(5, model=args.model, input_path=args.input)
+            store.add_articles(df)
+            store.add_decision(run_id, 5, uid, normalized, raw=raw)
+            store.finish_run(run_id, n_rows=total)
+    """
+
+    def __init__(self, path: str, batch_size: int = BATCH_SIZE):
+        self.path = path
+        self.batch_size = max(1, int(batch_size))
+        self.conn = connect(path)
+        self._decisions: List[tuple] = []
+        self._raw: List[tuple] = []
+
+    def __enter__(self) -> "ScreeningStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def start_run(
+        self,
+        stage: int,
+        model: Optional[str] = None,
+        system_prompt: Optional[str] = None,
+        input_path: Optional[str] = None,
+        output_path: Optional[str] = None,
+        argv: Optional[Iterable[str]] = None,
+    ) -> int:
+        args = json.dumps(list(argv if argv is not None else sys.argv[1:]))
+        with self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO runs (stage, model, system_prompt, input_path, output_path, argv, started_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (int(stage), model, system_prompt, input_path, output_path, args, time.time()),
+            )
+        return int(cur.lastrowid)
+
+    def finish_run(
+        self,
+        run_id: int,
+        n_rows: Optional[int] = None,
+        n_reused: Optional[int] = None,
+        n_recomputed: Optional[int] = None,
+    ) -> None:
+        self.flush()
+        with self.conn:
+            self.conn.execute(
+                "UPDATE runs SET finished_at = ?, n_rows = ?, n_reused = ?, n_recomputed = ? WHERE run_id = ?",
+                (time.time(), n_rows, n_reused, n_recomputed, int(run_id)),
+            )
+
+    def add_articles(
+        self,
+        df: pd.DataFrame,
+        id_col: str = "id",
+        title_col: str = "Title",
+        abstract_col: str = "Abstract",
+        year_col: str = "Year",
+    ) -> None:
+        """Upsert the article text (one executemany per frame)."""
+        if id_col not in df.columns:
+            return
+        n = len(df)
+
+        def col(c: str) -> List[Any]:
+            return df[c].tolist() if c in df.columns else [None] * n
+
+        now = time.time()
+        rows = [
+            (str(uid), _text(y), _text(t), _text(a), now)
+            for uid, y, t, a in zip(col(id_col), col(year_col), col(title_col), col(abstract_col))
+        ]
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO articles (id, year, title, abstract, updated_at) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT(id) DO UPDATE SET"
+                "  year = COALESCE(excluded.year, articles.year),"
+                "  title = COALESCE(excluded.title, articles.title),"
+                "  abstract = COALESCE(excluded.abstract, articles.abstract),"
+                "  updated_at = excluded.updated_at",
+                rows,
+            )
+
+    def add_decision(
+        self,
+        run_id: int,
+        stage: int,
+        uid: Any,
+        normalized: Dict[str, Any],
+        raw: Optional[str] = None,
+        prompt: Optional[str] = None,
+        fingerprint: Optional[StageFingerprint] = None,
+        reused: bool = False,
+    ) -> None:
+        """Buffer one normalize_result() dict (plus the raw response, its user prompt and fingerprint) for this run."""
+        sfx = f"_stage{int(stage)}"
+        fields = {k: clean(v) for k, v in normalized.items() if k != "id"}
+        include = fields.get("include" + sfx)
+        now = time.time()
+        self._decisions.append((
+            int(run_id), int(stage), str(uid),
+            None if include is None else int(bool(include)),
+            fields.get("confidence" + sfx),
+            fields.get("reason" + sfx),
+            json.dumps(fields, ensure_ascii=False, default=json_default),
+            now,
+            fingerprint.digest if fingerprint else None,
+            fingerprint.input_fp if fingerprint else None,
+            fingerprint.prompt_fp if fingerprint else None,
+            fingerprint.code_fp if fingerprint else None,
+            int(bool(reused)),
+        ))
+        if raw is not None:
+            self._raw.append((int(run_id), int(stage), str(uid), raw, prompt, now))
+        if len(self._decisions) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._decisions and not self._raw:
+            return
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO decisions"
+                " (run_id, stage, id, include, confidence, reason, fields, created_at,"
+                "  fingerprint, input_fp, prompt_fp, code_fp, reused)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                self._decisions,
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO raw_responses (run_id, stage, id, raw, prompt, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                self._raw,
+            )
+        self._decisions, self._raw = [], []
+
+    def previous_decisions(self, stage: int, ids: Iterable[Any]) -> Dict[str, Dict[str, Any]]:
+        """Latest stored fingerprint + fields per id for this stage (for --incremental reuse)."""
+        self.flush()
+        out: Dict[str, Dict[str, Any]] = {}
+        ids = [str(i) for i in ids]
+        for k in range(0, len(ids), 500):
+            chunk = ids[k:k + 500]
+            marks = ",".join("?" * len(chunk))
+            sql = _LATEST.format(where=f"WHERE stage = ? AND id IN ({marks})")
+            for uid, fp, fields in self.conn.execute(
+                f"SELECT d.id, d.fingerprint, d.fields FROM ({sql}) d", (int(stage), *chunk)
+            ):
+                out[uid] = {"fingerprint": fp, "fields": json.loads(fields)}
+        return out
+
+    def close(self) -> None:
+        if self.conn is None:
+            return
+        self.flush()
+        self.conn.close()
+        self.conn = None
+
+
+# -------------------- Queries --------------------
+
+def latest_decisions(conn: sqlite3.Connection, stage: Optional[int] = None) -> pd.DataFrame:
+    """Latest decision row per (stage, id), optionally for one stage."""
+    where, params = ("WHERE stage = ?", (int(stage),)) if stage is not None else ("", ())
+    return pd.read_sql_query(_LATEST.format(where=where) + " ORDER BY d.stage, d.id", conn, params=params)
+
+
+def why(conn: sqlite3.Connection, uid: str) -> pd.DataFrame:
+    """Every stage decision recorded for one article, newest run first within each stage."""
+    return pd.read_sql_query(
+        "SELECT d.stage, d.run_id, r.model, d.include, d.confidence, d.reason,"
+        " datetime(d.created_at, 'unixepoch') AS created"
+        " FROM decisions d JOIN runs r USING (run_id)"
+        " WHERE d.id = ? ORDER BY d.stage, d.run_id DESC",
+        conn, params=(str(uid),),
+    )
+
+
+def list_runs(conn: sqlite3.Connection) -> pd.DataFrame:
+    return pd.read_sql_query(
+        "SELECT r.run_id, r.stage, r.model, r.input_path, r.n_rows, r.n_reused, r.n_recomputed,"
+        " SUM(d.include = 1) AS included,"
+        " datetime(r.started_at, 'unixepoch') AS started,"
+        " ROUND(r.finished_at - r.started_at, 1) AS seconds"
+        " FROM runs r LEFT JOIN decisions d USING (run_id)"
+        " GROUP BY r.run_id ORDER BY r.run_id",
+        conn,
+    )
+
+
+def wide_table(conn: sqlite3.Connection, max_stage: Optional[int] = None) -> pd.DataFrame:
+    """Articles with the latest fields of every stage as columns (the post_stageN layout)."""
+    out = pd.read_sql_query("SELECT id, year AS Year, title AS Title, abstract AS Abstract FROM articles", conn)
+    latest = latest_decisions(conn)
+    for stage in sorted(latest["stage"].unique()):
+        if max_stage is not None and stage > max_stage:
+            continue
+        part = latest[latest["stage"] == stage]
+        fields = pd.DataFrame([json.loads(f) for f in part["fields"]], index=part.index)
+        fields.insert(0, "id", part["id"].values)
+        out = out.merge(fields, on="id", how="left")
+    return out
+
+
+def export_table(conn: sqlite3.Connection, path: str, max_stage: Optional[int] = None) -> pd.DataFrame:
+    """Write articles + latest stage columns (CSV or Parquet, by extension)."""
+    df = wide_table(conn, max_stage)
+    write_table(df, path)
+    return df
+
+
+def survivors(conn: sqlite3.Connection, stage: int) -> pd.DataFrame:
+    """Articles whose latest decision at every stage up to `stage` is include (next stage's input)."""
+    df = wide_table(conn, max_stage=stage)
+    keep = pd.Series(True, index=df.index)
+    for s in range(1, int(stage) + 1):
+        col = f"include_stage{s}"
+        if col in df.columns:
+            keep &= df[col].map(lambda v: v is True or v == 1).astype(bool)
+    return df[keep].reset_index(drop=True)
+
+
+def import_stage_table(store: ScreeningStore, path: str, stage: int, id_col: str = "id") -> int:
+    """Backfill one existing screen_stageN table as a run, so old results are queryable too."""
+    df = read_table(path)
+    cols = [c for c in STAGE_FIELDS[int(stage)] if c in df.columns]
+    run_id = store.start_run(stage, input_path=path, argv=["import", path])
+    store.add_articles(df, id_col=id_col)
+    for rec in df[[id_col] + cols].to_dict("records"):
+        uid = rec.pop(id_col)
+        for c in LIST_COLUMNS:
+            if c in rec and c != "shifts_detected":
+                rec[c] = parse_list(rec[c]) or []
+        store.add_decision(run_id, stage, uid, rec)
+    store.finish_run(run_id, n_rows=len(df))
+    return run_id
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import argparse
+    parser = argparse.ArgumentParser(description="Query and export the screening SQLite store")
+    parser.add_argument("--db", default="screening.sqlite", help="Path to the SQLite store")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("why", help="Show every stage decision for one article id")
+    p.add_argument("id")
+    sub.add_parser("runs", help="List runs")
+    p = sub.add_parser("export", help="Articles + latest stage columns")
+    p.add_argument("--out", required=True)
+    p.add_argument("--max-stage", type=int, default=None)
+    p = sub.add_parser("survivors", help="Articles included by every stage up to --stage")
+    p.add_argument("--stage", type=int, required=True)
+    p.add_argument("--out", required=True)
+    p = sub.add_parser("import", help="Load an existing stage output table as a run")
+    p.add_argument("--stage", type=int, required=True)
+    p.add_argument("--id-col", default="id")
+    p.add_argument("path")
+    args = parser.parse_args(argv)
+
+    pd.set_option("display.width", 200)
+    pd.set_option("display.max_colwidth", 90)
+
+    if args.cmd == "import":
+        with ScreeningStore(args.db) as store:
+            run_id = import_stage_table(store, args.path, args.stage, id_col=args.id_col)
+        print(f"Imported {args.path} as run {run_id} (stage {args.stage})", flush=True)
+        return
+
+    conn = connect(args.db)
+    try:
+        if args.cmd == "why":
+            res = why(conn, args.id)
+            print(res.to_string(index=False) if len(res) else f"No decisions for {args.id}", flush=True)
+        elif args.cmd == "runs":
+            print(list_runs(conn).to_string(index=False), flush=True)
+        elif args.cmd == "export":
+            df = export_table(conn, args.out, args.max_stage)
+            print(f"Wrote {len(df)} articles: {args.out}", flush=True)
+        elif args.cmd == "survivors":
+            df = survivors(conn, args.stage)
+            write_table(df, args.out)
+            print(f"{len(df)} articles included through stage {args.stage}. Wrote: {args.out}", flush=True)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
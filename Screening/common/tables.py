@@ -0,0 +1,331 @@
+# tables.py — Read/write stage tables as CSV or Parquet/Arrow (chosen by file extension)
+#
+# CSV flattens list fields (detected_outcomes, shifts_detected, cash_saving_terms)
+# to Python-repr strings and loses bool dtypes once a merge introduces NaN.
+# Parquet keeps real list/bool/categorical columns, is zstd-compressed and lets a
+# stage read only the columns its prompts need. CSV stays available for reviewers:
+#   python -m common.tables data/screen_stage7.parquet data/screen_stage7.csv
+
+import ast
+import os
+import sys
+from typing import Any, Iterable, Iterator, List, Optional
+
+import pandas as pd
+
+PARQUET_EXTS = (".parquet", ".pq")
+ARROW_EXTS = (".arrow", ".feather", ".ipc")
+
+# Stage output columns that hold lists of short labels
+LIST_COLUMNS = ("detected_outcomes", "shifts_detected", "cash_saving_terms")
+
+# How each list column has always been flattened in CSV (repr unless listed here)
+CSV_LIST_SEPARATORS = {"shifts_detected": "; "}
+
+# Low-cardinality label columns written by normalize_result
+CATEGORICAL_COLUMNS = (
+    "detected_language", "detected_setting", "detected_context",
+    "publication_type", "detected_comparator", "main_shift",
+)
+
+BOOL_PREFIXES = ("include_stage", "has_")
+
+COMPRESSION = "zstd"
+
+
+def table_format(path: str) -> str:
+    """'parquet', 'arrow' or 'csv' from the file extension."""
+    ext = os.path.splitext(str(path))[1].lower()
+    if ext in PARQUET_EXTS:
+        return "parquet"
+    if ext in ARROW_EXTS:
+        return "arrow"
+    return "csv"
+
+
+def _require_pyarrow() -> None:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError as e:
+        raise ImportError(
+            "Parquet/Arrow files need pyarrow (pip install pyarrow); use a .csv path otherwise"
+        ) from e
+
+
+def parse_list(v: Any) -> Any:
+    """"['a', 'b']" (CSV repr) -> ['a', 'b']; real lists pass through; blanks -> None."""
+    if isinstance(v, (list, tuple)):
+        return list(v)
+    if hasattr(v, "tolist") and not isinstance(v, str):   # numpy array from Arrow
+        return list(v.tolist())
+    if not isinstance(v, str):
+        return None
+    s = v.strip()
+    if not s:
+        return None
+    if s.startswith("["):
+        try:
+            out = ast.literal_eval(s)
+            return [str(x) for x in out] if isinstance(out, (list, tuple)) else None
+        except Exception:
+            pass
+    return [p.strip() for p in s.split(";") if p.strip()]
+
+
+def _to_bool(v: Any) -> Any:
+    if v is None or (isinstance(v, float) and pd.isna(v)):
+        return pd.NA
+    if isinstance(v, str):
+        s = v.strip().lower()
+        if s in ("true", "1", "yes"):
+            return True
+        if s in ("false", "0", "no"):
+            return False
+        return pd.NA
+    return bool(v)
+
+
+def _is_bool_col(name: str) -> bool:
+    return any(str(name).startswith(p) for p in BOOL_PREFIXES)
+
+
+def restore_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Give known stage columns their proper dtypes (lists, nullable bools, categories)."""
+    out = df.copy()
+    for col in out.columns:
+        if col in LIST_COLUMNS:
+            out[col] = [parse_list(v) for v in out[col].tolist()]
+        elif _is_bool_col(col) and out[col].dtype != "boolean":
+            out[col] = pd.array([_to_bool(v) for v in out[col].tolist()], dtype="boolean")
+        elif col in CATEGORICAL_COLUMNS and not isinstance(out[col].dtype, pd.CategoricalDtype):
+            out[col] = out[col].astype("category")
+    return out
+
+
+def _existing(path: str, fmt: str, columns: Iterable[str]) -> List[str]:
+    """Requested columns that exist in the file, in file order (missing ones are skipped)."""
+    wanted = set(columns)
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        names = pq.read_schema(path).names
+    elif fmt == "arrow":
+        import pyarrow as pa
+        names = pa.ipc.open_file(pa.memory_map(path)).schema.names
+    else:
+        names = pd.read_csv(path, nrows=0).columns.tolist()
+    return [c for c in names if c in wanted]
+
+
+def read_table(path: str, columns: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """
+    Load a stage table. `columns` projects the read to just those columns
+    (any that the file lacks are ignored, so optional hint columns can be listed).
+    """
+    fmt = table_format(path)
+    if fmt != "csv":
+        _require_pyarrow()
+    cols = _existing(path, fmt, columns) if columns is not None else None
+    if fmt == "parquet":
+        return pd.read_parquet(path, columns=cols, engine="pyarrow")
+    if fmt == "arrow":
+        return pd.read_feather(path, columns=cols)
+    return pd.read_csv(path, usecols=cols)
+
+
+def count_rows(path: str, limit: Optional[int] = None) -> int:
+    """Row count without loading the table (CSV: one streamed column; Parquet/Arrow: metadata)."""
+    fmt = table_format(path)
+    if fmt == "parquet":
+        _require_pyarrow()
+        import pyarrow.parquet as pq
+        n = pq.ParquetFile(path).metadata.num_rows
+    elif fmt == "arrow":
+        _require_pyarrow()
+        import pyarrow as pa
+        reader = pa.ipc.open_file(pa.memory_map(path))
+        n = sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+    else:
+        n = sum(len(c) for c in pd.read_csv(path, usecols=[0], chunksize=100_000))
+    return min(n, limit) if limit else n
+
+
+def iter_table(
+    path: str,
+    chunk_size: Optional[int] = None,
+    columns: Optional[Iterable[str]] = None,
+    limit: Optional[int] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Yield the table in frames of at most `chunk_size` rows (the whole table when None),
+    stopping after `limit` rows. Row index labels run on across chunks, as in read_csv.
+    """
+    if not chunk_size:
+        df = read_table(path, columns=columns)
+        yield df.head(limit).copy() if limit else df
+        return
+    fmt = table_format(path)
+    if fmt != "csv":
+        _require_pyarrow()
+    cols = _existing(path, fmt, columns) if columns is not None else None
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        batches = (b.to_pandas() for b in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=cols))
+    elif fmt == "arrow":
+        import pyarrow as pa
+        table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+        if cols is not None:
+            table = table.select(cols)
+        batches = (b.to_pandas() for b in table.to_batches(max_chunksize=chunk_size))
+    else:
+        batches = pd.read_csv(path, usecols=cols, chunksize=chunk_size)
+    seen = 0
+    for df in batches:
+        if limit:
+            df = df.head(limit - seen)
+        df.index = pd.RangeIndex(seen, seen + len(df))
+        if len(df):
+            yield df
+        seen += len(df)
+        if limit and seen >= limit:
+            break
+
+
+def _flatten_list(v: Any, sep: Optional[str]) -> Any:
+    if isinstance(v, str) or v is None:
+        return v
+    if hasattr(v, "tolist"):
+        v = v.tolist()
+    if not isinstance(v, (list, tuple)):
+        return v
+    items = [str(x) for x in v]
+    return sep.join(items) if sep else str(items)
+
+
+def flatten_for_csv(df: pd.DataFrame) -> pd.DataFrame:
+    """List columns back to their CSV text form (repr, or '; '-joined for shifts_detected)."""
+    out = df
+    for col in LIST_COLUMNS:
+        if col in out.columns and out[col].dtype == object:
+            if out is df:
+                out = df.copy()
+            sep = CSV_LIST_SEPARATORS.get(col)
+            out[col] = [_flatten_list(v, sep) for v in out[col].tolist()]
+    return out
+
+
+def write_table(df: pd.DataFrame, path: str) -> None:
+    """Write a stage table; Parquet/Arrow outputs get list/bool/categorical dtypes and zstd."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fmt = table_format(path)
+    if fmt == "csv":
+        flatten_for_csv(df).to_csv(path, index=False)
+        return
+    _require_pyarrow()
+    typed = restore_dtypes(df).reset_index(drop=True)
+    if fmt == "parquet":
+        typed.to_parquet(path, engine="pyarrow", compression=COMPRESSION, index=False)
+    else:
+        typed.to_feather(path, compression=COMPRESSION)
+
+
+class TableWriter:
+    """
+    Append frames to one output table, chunk by chunk (CSV: header once;
+    Parquet: one row group per chunk; Arrow: one record batch per chunk).
+    The first chunk fixes the columns (and the Parquet/Arrow schema): later
+    chunks are lined up to them, missing columns filled with NA, and a column
+    the first chunk did not have is an error.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.fmt = table_format(path)
+        self.rows = 0
+        self._writer = None
+        self._sink = None
+        self._schema = None
+        self._columns: Optional[List[str]] = None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if self.fmt != "csv":
+            _require_pyarrow()
+
+    def __enter__(self) -> "TableWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _arrow_table(self, df: pd.DataFrame):
+        import pyarrow as pa
+        table = pa.Table.from_pandas(restore_dtypes(df).reset_index(drop=True), preserve_index=False)
+        if self._schema is None:
+            # Columns that are all-missing in the first chunk would otherwise be typed null for good
+            fields = []
+            for f in table.schema:
+                if pa.types.is_null(f.type):
+                    f = f.with_type(pa.list_(pa.string()) if f.name in LIST_COLUMNS else pa.string())
+                fields.append(f)
+            self._schema = pa.schema(fields)
+        for f in self._schema:
+            if f.name not in table.column_names:
+                table = table.append_column(f.name, pa.nulls(len(table), type=f.type))
+        return table.select(self._schema.names).cast(self._schema)
+
+    def _align(self, df: pd.DataFrame) -> pd.DataFrame:
+        """The chunk in the first chunk's column order; CSV fills missing columns here, Arrow in _arrow_table."""
+        if self._columns is None:
+            self._columns = list(df.columns)
+            return df
+        extra = [c for c in df.columns if c not in self._columns]
+        if extra:
+            raise ValueError(f"{self.path}: chunk has column(s) {extra} that the first chunk did not have")
+        if list(df.columns) == self._columns:
+            return df
+        if self.fmt == "csv":
+            return df.reindex(columns=self._columns)
+        return df[[c for c in self._columns if c in df.columns]]
+
+    def append(self, df: pd.DataFrame) -> None:
+        df = self._align(df)
+        if self.fmt == "csv":
+            flatten_for_csv(df).to_csv(self.path, mode="a" if self.rows else "w", header=not self.rows, index=False)
+        else:
+            table = self._arrow_table(df)
+            if self._writer is None:
+                if self.fmt == "parquet":
+                    import pyarrow.parquet as pq
+                    self._writer = pq.ParquetWriter(self.path, self._schema, compression=COMPRESSION)
+                else:
+                    import pyarrow as pa
+                    self._sink = pa.OSFile(self.path, "wb")
+                    self._writer = pa.ipc.new_file(
+                        self._sink, self._schema, options=pa.ipc.IpcWriteOptions(compression=COMPRESSION)
+                    )
+            self._writer.write_table(table)
+        self.rows += len(df)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._sink is not None:
+            self._sink.close()
+            self._sink = None
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Convert between formats: python -m common.tables IN OUT [--columns a,b,c]"""
+    import argparse
+    parser = argparse.ArgumentParser(description="Convert stage tables between CSV and Parquet/Arrow")
+    parser.add_argument("src")
+    parser.add_argument("dst")
+    parser.add_argument("--columns", default=None, help="Comma-separated columns to keep")
+    args = parser.parse_args(argv)
+    cols = [c.strip() for c in args.columns.split(",")] if args.columns else None
+    df = read_table(args.src, columns=cols)
+    write_table(df, args.dst)
+    print(f"Wrote {len(df)} rows x {len(df.columns)} columns: {args.dst}", flush=True)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
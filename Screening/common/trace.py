@@ -0,0 +1,317 @@
+# trace.py — Per-article trace flight recorder (--trace) and its CLI
+#
+# With --trace PATH every article a stage screens gets one trace, written as one
+# line of OTLP/JSON (the OpenTelemetry file-exporter format: an
+# ExportTraceServiceRequest per line), so any OTel collector or viewer can read it.
+# The trace id is derived from the article id, so one article's spans from all
+# seven stages (appended to the same file) share a trace.
+#
+# Spans per article per stage:
+#   stageN.article           root: include, reused, guardrail flip, id
+#     queue_wait             from its chunk being ready until the row started
+#     api                    the call (including the client's retry sleeps)
+#       rate_limit.wait      --rpm limiter wait before an attempt (common/workers.py)
+#       attempt              one per chat.completions.create: latency, tokens,
+#                            error type / http.status_code (429 = rate limited)
+#     parse                  safe_json_loads: parse.ok, response length
+#     normalize              normalize_result: fields it changed; include flip
+#     self_consistency       Stages 5-6 extra samples and the vote
+#     rate_limit.sleep       --sleep after the call
+#
+# Usage (from the Screening/ folder):
+#   python -m common.trace slowest --trace /tmp/trace.jsonl --top 20 [--stage 5]
+#   python -m common.trace timeline --trace /tmp/trace.jsonl --id J502
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from common.metrics import InstrumentedClient, is_rate_limit
+
+SERVICE_NAME = "ai-assisted-evidence-screening"
+SCOPE_NAME = "screening.trace"
+
+
+def trace_id(article_id: Any) -> str:
+    return hashlib.sha256(str(article_id).encode("utf-8")).hexdigest()[:32]
+
+
+def _attr(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        v = {"boolValue": value}
+    elif isinstance(value, int):
+        v = {"intValue": str(value)}
+    elif isinstance(value, float):
+        v = {"doubleValue": value}
+    else:
+        v = {"stringValue": str(value)}
+    return {"key": key, "value": v}
+
+
+def _plain(value: Dict[str, Any]) -> Any:
+    (kind, v), = value.items()
+    if kind == "intValue":
+        return int(v)
+    return v
+
+
+def _scalar(v: Any) -> str:
+    if isinstance(v, bool):
+        return str(v).lower()
+    if isinstance(v, (int, float)):
+        return repr(round(float(v), 6))
+    return str(v).strip().lower()
+
+
+def guardrail_changes(parsed: Dict[str, Any], normalized: Dict[str, Any], stage: int) -> List[str]:
+    """Scalar fields whose normalized value differs from what the model returned (lists are skipped)."""
+    changed = []
+    for key, value in parsed.items():
+        if key == "reason" or isinstance(value, (list, dict)):
+            continue
+        col = f"{key}_stage{stage}" if f"{key}_stage{stage}" in normalized else key
+        if col not in normalized or isinstance(normalized[col], (list, dict)):
+            continue
+        if _scalar(value) != _scalar(normalized[col]):
+            changed.append(key)
+    return changed
+
+
+class TraceRecorder:
+    """
+    Spans for the article currently being screened; one OTLP/JSON line per
+    article on end(). Disabled (every method returns at once) when path is None.
+    """
+
+    def __init__(self, stage: int, path: Optional[str], model: str = ""):
+        self.stage = stage
+        self.enabled = path is not None
+        self.model = model
+        self._f = open(path, "a", encoding="utf-8") if path else None
+        self._seq = 0
+        self._chunk_ready = self._mark = time.time_ns()
+        self._article: Any = None
+        self._trace = ""
+        self._root = ""
+        self._start = 0
+        self._spans: List[Dict[str, Any]] = []
+        self._attempts: List[Dict[str, Any]] = []
+        self._attempt_start = 0
+        self._n_attempts = 0
+
+    def _span_id(self) -> str:
+        self._seq += 1
+        return hashlib.sha256(f"{self._trace}:{self.stage}:{self._seq}".encode()).hexdigest()[:16]
+
+    def _span(self, name: str, start: int, end: int, parent: str, attrs: Dict[str, Any]) -> Dict[str, Any]:
+        span = {
+            "traceId": self._trace,
+            "spanId": self._span_id(),
+            "parentSpanId": parent,
+            "name": name,
+            "kind": 1,
+            "startTimeUnixNano": str(start),
+            "endTimeUnixNano": str(end),
+            "attributes": [_attr(k, v) for k, v in attrs.items() if v is not None],
+        }
+        self._spans.append(span)
+        return span
+
+    # ---- runner hooks ----
+
+    def instrument(self, client: Any) -> Any:
+        return InstrumentedClient(client, self) if self.enabled else client
+
+    def chunk_ready(self) -> None:
+        """Prompts for the current chunk are built; its rows start queueing now."""
+        if self.enabled:
+            self._chunk_ready = time.time_ns()
+
+    def begin(self, article_id: Any) -> None:
+        if not self.enabled:
+            return
+        self._article = article_id
+        self._trace = trace_id(article_id)
+        self._root = self._span_id()
+        self._spans, self._attempts = [], []
+        self._n_attempts = 0
+        self._start = self._mark = time.time_ns()
+        self._span("queue_wait", self._chunk_ready, self._start, self._root, {})
+
+    def lap(self, name: str, **attrs: Any) -> None:
+        """Close a span from the previous lap (or begin) until now; pending attempts become its children."""
+        if not self.enabled or self._article is None:
+            return
+        now = time.time_ns()
+        span = self._span(name, self._mark, now, self._root, attrs)
+        for attempt in self._attempts:
+            attempt["parentSpanId"] = span["spanId"]
+        self._attempts = []
+        self._mark = now
+
+    def parsed(self, raw: Optional[str], parsed: Dict[str, Any]) -> None:
+        """Lap for safe_json_loads."""
+        if self.enabled:
+            self.lap("parse", **{"parse.ok": bool(parsed), "response.chars": len(raw or "")})
+
+    def normalized(self, parsed: Dict[str, Any], normalized: Dict[str, Any]) -> None:
+        """Lap for normalize_result, with the fields its guardrails changed."""
+        if not self.enabled:
+            return
+        changed = guardrail_changes(parsed, normalized, self.stage)
+        self.lap("normalize", **{"normalize.changed": ",".join(changed),
+                                 "guardrail.include_flip": "include" in changed})
+
+    def end(self, normalized: Dict[str, Any], reused: bool = False) -> None:
+        if not self.enabled or self._article is None:
+            return
+        flip = any(_plain(a["value"]) is True for s in self._spans for a in s["attributes"]
+                   if a["key"] == "guardrail.include_flip")
+        root = {
+            "traceId": self._trace,
+            "spanId": self._root,
+            "parentSpanId": "",
+            "name": f"stage{self.stage}.article",
+            "kind": 1,
+            "startTimeUnixNano": str(self._chunk_ready),
+            "endTimeUnixNano": str(time.time_ns()),
+            "attributes": [
+                _attr("article.id", str(self._article)),
+                _attr("screening.stage", self.stage),
+                _attr("screening.include", bool(normalized.get(f"include_stage{self.stage}"))),
+                _attr("screening.reused", bool(reused)),
+                _attr("guardrail.include_flip", flip),
+                _attr("llm.model", self.model),
+            ],
+        }
+        record = {"resourceSpans": [{
+            "resource": {"attributes": [_attr("service.name", SERVICE_NAME)]},
+            "scopeSpans": [{"scope": {"name": SCOPE_NAME}, "spans": [root] + self._spans}],
+        }]}
+        self._f.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._article = None
+
+    def close(self) -> None:
+        if self._f:
+            self._f.close()
+
+    # ---- request hooks (InstrumentedClient, RateBudget) ----
+
+    def rate_wait(self, start: int, end: int) -> None:
+        """A --rpm wait before the next attempt; like attempts, a child of the next lap."""
+        if self.enabled and self._article is not None:
+            self._attempts.append(self._span("rate_limit.wait", start, end, self._root,
+                                             {"wait_ms": round((end - start) / 1e6, 3)}))
+
+    def request_started(self) -> None:
+        self._attempt_start = time.time_ns()
+
+    def request_finished(self, latency: float, usage: Any = None, error: Optional[Exception] = None) -> None:
+        if self._article is None:
+            return
+        self._n_attempts += 1
+        attrs: Dict[str, Any] = {"http.latency_ms": round(latency * 1000, 3), "attempt": self._n_attempts}
+        if error is not None:
+            attrs["error.type"] = type(error).__name__
+            attrs["http.status_code"] = getattr(error, "status_code", None) or (429 if is_rate_limit(error) else None)
+        elif usage is not None:
+            attrs["llm.prompt_tokens"] = int(getattr(usage, "prompt_tokens", 0) or 0)
+            attrs["llm.completion_tokens"] = int(getattr(usage, "completion_tokens", 0) or 0)
+        span = self._span("attempt", self._attempt_start, time.time_ns(), self._root, attrs)
+        self._attempts.append(span)
+
+
+# -------------------- CLI --------------------
+
+def read_spans(path: str) -> Iterator[Dict[str, Any]]:
+    """Every span in a trace file, with attributes flattened to a dict."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            for rs in json.loads(line)["resourceSpans"]:
+                for ss in rs["scopeSpans"]:
+                    for span in ss["spans"]:
+                        span = dict(span)
+                        span["attrs"] = {a["key"]: _plain(a["value"]) for a in span.get("attributes", [])}
+                        span["start"] = int(span["startTimeUnixNano"])
+                        span["end"] = int(span["endTimeUnixNano"])
+                        yield span
+
+
+def _ms(ns: int) -> str:
+    return f"{ns / 1e6:,.1f} ms"
+
+
+def slowest(path: str, top: int = 20, stage: Optional[int] = None) -> None:
+    roots = [s for s in read_spans(path)
+             if s["name"].endswith(".article") and (stage is None or s["attrs"].get("screening.stage") == stage)]
+    children: Dict[str, Dict[str, int]] = {}
+    for s in read_spans(path):
+        if s["parentSpanId"] and s["name"] != "attempt":
+            d = children.setdefault(s["parentSpanId"], {})
+            d[s["name"]] = d.get(s["name"], 0) + s["end"] - s["start"]
+
+    def active(s: Dict[str, Any]) -> int:   # the root also covers its queue wait
+        return s["end"] - s["start"] - children.get(s["spanId"], {}).get("queue_wait", 0)
+
+    roots.sort(key=active, reverse=True)
+    print(f"{'id':<12} {'stage':>5} {'active':>12} {'queue':>12} {'api':>12}  include  flip  note")
+    for s in roots[:top]:
+        a, c = s["attrs"], children.get(s["spanId"], {})
+        note = "reused" if a.get("screening.reused") else ""
+        print(f"{a.get('article.id', ''):<12} {a.get('screening.stage', ''):>5} {_ms(active(s)):>12} "
+              f"{_ms(c.get('queue_wait', 0)):>12} {_ms(c.get('api', 0)):>12}  "
+              f"{str(a.get('screening.include')):<7}  {str(a.get('guardrail.include_flip')):<5} {note}")
+
+
+def timeline(path: str, article_id: str) -> None:
+    tid = trace_id(article_id)
+    spans = [s for s in read_spans(path) if s["traceId"] == tid]
+    if not spans:
+        print(f"No spans for id {article_id} in {path}")
+        return
+    by_parent: Dict[str, List[Dict[str, Any]]] = {}
+    for s in spans:
+        by_parent.setdefault(s["parentSpanId"], []).append(s)
+    t0 = min(s["start"] for s in spans)
+
+    def show(span: Dict[str, Any], depth: int) -> None:
+        attrs = " ".join(f"{k}={v}" for k, v in span["attrs"].items() if k not in ("article.id",) and v != "")
+        print(f"{_ms(span['start'] - t0):>12} +{_ms(span['end'] - span['start']):>11}  {'  ' * depth}{span['name']}  {attrs}")
+        for child in sorted(by_parent.get(span["spanId"], []), key=lambda s: s["start"]):
+            show(child, depth + 1)
+
+    print(f"Trace {tid} (article {article_id})")
+    for root in sorted(by_parent.get("", []), key=lambda s: s["start"]):
+        show(root, 0)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Per-article screening traces (--trace files)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("slowest", help="Articles with the longest stage spans (excluding queue wait)")
+    p.add_argument("--trace", required=True)
+    p.add_argument("--top", type=int, default=20)
+    p.add_argument("--stage", type=int, default=None)
+
+    p = sub.add_parser("timeline", help="Span timeline of one article across the stages in the file")
+    p.add_argument("--trace", required=True)
+    p.add_argument("--id", required=True)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.trace):
+        parser.error(f"trace file not found: {args.trace}")
+    if args.cmd == "slowest":
+        slowest(args.trace, args.top, args.stage)
+    else:
+        timeline(args.trace, args.id)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
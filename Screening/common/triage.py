@@ -0,0 +1,356 @@
+# triage.py — Local TF-IDF + logistic-regression triage per stage (--triage)
+#
+# Trained on the decisions we already have for a stage:
+#   - the bundled/accumulated outputs screen_stageN*.csv (include_stageN), and any
+#     extra output tables passed with --labels
+#   - the human labels in Validation/stage_N_validation_workbook_full.xlsx
+#     ("FF screen"), which win over the model decision for the same id
+# Text = Title + Abstract; word 1-2-grams, sublinear TF; class-balanced logistic
+# regression wrapped in sigmoid calibration (5-fold).
+#
+# Thresholds come from out-of-fold calibrated probabilities:
+#   t_exclude  p < t_exclude is excluded locally; set so that at least
+#              RECALL_FLOOR of the labelled includes stay above it (hard floor)
+#   t_include  p >= t_include is included locally; the lowest threshold whose
+#              out-of-fold precision is at least INCLUDE_PRECISION (else off)
+# Everything in between goes to the LLM. With fewer than MIN_PER_CLASS labels of
+# either class no band is set and every article goes to the LLM.
+#
+# Locally decided rows get include_stageN, reason_stageN ("triage: ...") and
+# confidence_stageN; every row gets p_triage_stageN. normalize_result is not run
+# for them (there is no model output), so the stage's detail columns stay empty.
+#
+# Usage (from the Screening/ folder; needs scikit-learn):
+#   python -m common.triage train --stage 5
+#   python -m common.triage retrain --max-age-days 7          # all stages, only if stale
+#   python -m common.triage report --stage 5                   # thresholds + calibration curve
+#   python -m common.triage score --stage 5 --input Stage_5_Comparator_And_Outcomes/data/361_articles_post_stage4_screen.csv
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from common.stages import STAGES, SCREENING, stage_dir
+from common.tables import read_table
+
+MODEL_DIR = os.path.join(SCREENING, "triage_models")
+RECALL_FLOOR = 0.99
+INCLUDE_PRECISION = 0.99
+MIN_PER_CLASS = 20
+CALIBRATION_BINS = 10
+
+TRUE_STRINGS = {"true", "1", "yes", "y", "include"}
+
+
+def _require_sklearn():
+    try:
+        import sklearn  # noqa: F401
+    except ImportError:
+        raise SystemExit("--triage needs scikit-learn: pip install scikit-learn")
+
+
+def _bool(v: Any) -> bool:
+    return str(v).strip().lower() in TRUE_STRINGS
+
+
+def _text(df: pd.DataFrame, title_col: str = "Title", abstract_col: str = "Abstract") -> List[str]:
+    title = df[title_col].fillna("").astype(str) if title_col in df.columns else pd.Series([""] * len(df), index=df.index)
+    abstract = df[abstract_col].fillna("").astype(str) if abstract_col in df.columns else pd.Series([""] * len(df), index=df.index)
+    return (title + " . " + abstract).tolist()
+
+
+# -------------------- labels --------------------
+
+def collect_labels(stage: int, extra: Sequence[str] = ()) -> pd.DataFrame:
+    """id, Title, Abstract, label, source for every labelled article of `stage` (human labels win)."""
+    col = f"include_stage{stage}"
+    frames = []
+    paths = sorted(glob.glob(os.path.join(stage_dir(stage), "[dD]ata", f"screen_stage{stage}*.csv"))) + list(extra)
+    for path in paths:
+        df = read_table(path)
+        if col in df.columns and "id" in df.columns:
+            frames.append(pd.DataFrame({"id": df["id"].astype(str), "Title": df.get("Title"), "Abstract": df.get("Abstract"),
+                                        "label": df[col].map(_bool), "source": "model"}))
+    for path in glob.glob(os.path.join(stage_dir(stage), "Validation", "*.xlsx")):
+        df = pd.read_excel(path, sheet_name="Merged results table")
+        # The workbook must be this stage's (it carries include_stageN next to the FF screen)
+        if "FF screen" in df.columns and col in df.columns:
+            frames.append(pd.DataFrame({"id": df["id"].astype(str), "Title": df.get("Title"), "Abstract": df.get("Abstract"),
+                                        "label": df["FF screen"].map(_bool), "source": "human"}))
+    if not frames:
+        return pd.DataFrame(columns=["id", "Title", "Abstract", "label", "source"])
+    labels = pd.concat(frames, ignore_index=True)
+    labels["_rank"] = (labels["source"] == "human").astype(int)
+    labels = labels.sort_values("_rank", kind="stable").drop_duplicates("id", keep="last")
+    return labels.drop(columns="_rank").reset_index(drop=True)
+
+
+# -------------------- thresholds --------------------
+
+def exclude_threshold(p: np.ndarray, y: np.ndarray, floor: float) -> float:
+    """Largest threshold that keeps at least `floor` of the positives at p >= threshold."""
+    pos = np.sort(p[y])
+    misses = int(np.floor((1.0 - floor) * len(pos)))
+    return float(pos[misses]) if len(pos) else 0.0
+
+
+def include_threshold(p: np.ndarray, y: np.ndarray, precision: float) -> float:
+    """Lowest threshold whose precision at p >= threshold is at least `precision` (inf when none)."""
+    ok = [t for t in np.unique(p) if y[p >= t].mean() >= precision]
+    return float(min(ok)) if ok else float("inf")
+
+
+def calibration(p: np.ndarray, y: np.ndarray, bins: int = CALIBRATION_BINS) -> List[Dict[str, Any]]:
+    edges = np.linspace(0.0, 1.0, bins + 1)
+    out = []
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        m = (p >= lo) & ((p < hi) if hi < 1.0 else (p <= hi))
+        if m.any():
+            out.append({"bin": f"{lo:.1f}-{hi:.1f}", "n": int(m.sum()),
+                        "mean_p": round(float(p[m].mean()), 4), "include_rate": round(float(y[m].mean()), 4)})
+    return out
+
+
+# -------------------- model --------------------
+
+class Triage(NamedTuple):
+    local: Dict[str, Dict[str, Any]]   # id -> output row for the locally decided articles
+    p: Dict[str, float]                # id -> p_triage for every article
+
+
+class TriageModel:
+    def __init__(self, stage: int, pipeline: Any, meta: Dict[str, Any]):
+        self.stage = stage
+        self.pipeline = pipeline
+        self.meta = meta
+        self.t_exclude = float(meta["t_exclude"])
+        self.t_include = float(meta["t_include"])
+
+    @classmethod
+    def train(cls, stage: int, labels: pd.DataFrame, floor: float = RECALL_FLOOR,
+              precision: float = INCLUDE_PRECISION) -> "TriageModel":
+        _require_sklearn()
+        from sklearn.calibration import CalibratedClassifierCV
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.model_selection import StratifiedKFold, cross_val_predict
+        from sklearn.pipeline import make_pipeline
+
+        X = _text(labels)
+        y = labels["label"].astype(bool).to_numpy()
+        n_pos, n_neg = int(y.sum()), int((~y).sum())
+        folds = max(2, min(5, n_pos, n_neg))
+
+        def pipeline():
+            return make_pipeline(
+                TfidfVectorizer(ngram_range=(1, 2), min_df=2, sublinear_tf=True, strip_accents="unicode"),
+                CalibratedClassifierCV(LogisticRegression(class_weight="balanced", max_iter=2000, C=4.0),
+                                       method="sigmoid", cv=folds),
+            )
+
+        meta: Dict[str, Any] = {"stage": stage, "trained_at": time.time(), "n_labels": len(y), "n_include": n_pos,
+                                "n_exclude": n_neg, "n_human": int((labels["source"] == "human").sum()),
+                                "recall_floor": floor, "include_precision": precision,
+                                "t_exclude": 0.0, "t_include": float("inf"), "calibration": [], "oof": {}}
+        if min(n_pos, n_neg) < MIN_PER_CLASS:
+            meta["note"] = f"fewer than {MIN_PER_CLASS} labels in a class; triage bands disabled"
+            model = pipeline().fit(X, y) if min(n_pos, n_neg) >= 2 else None
+            return cls(stage, model, meta)
+
+        cv = StratifiedKFold(n_splits=folds, shuffle=True, random_state=0)
+        p = cross_val_predict(pipeline(), X, y, cv=cv, method="predict_proba")[:, 1]
+        t_ex = exclude_threshold(p, y, floor)
+        t_in = max(include_threshold(p, y, precision), t_ex)
+        local_ex, local_in = p < t_ex, p >= t_in
+        meta.update({
+            "t_exclude": t_ex,
+            "t_include": t_in,
+            "calibration": calibration(p, y),
+            "oof": {
+                "recall": round(float((~local_ex[y]).mean()), 4),
+                "local_exclude_share": round(float(local_ex.mean()), 4),
+                "local_include_share": round(float(local_in.mean()), 4),
+                "includes_lost": int((local_ex & y).sum()),
+                "excludes_included": int((local_in & ~y).sum()),
+            },
+        })
+        return cls(stage, pipeline().fit(X, y), meta)
+
+    # ---- persistence ----
+
+    @staticmethod
+    def paths(stage: int, model_dir: str = MODEL_DIR) -> tuple:
+        return os.path.join(model_dir, f"stage{stage}.joblib"), os.path.join(model_dir, f"stage{stage}.json")
+
+    def save(self, model_dir: str = MODEL_DIR) -> None:
+        import joblib
+        os.makedirs(model_dir, exist_ok=True)
+        model_path, meta_path = self.paths(self.stage, model_dir)
+        joblib.dump(self.pipeline, model_path)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, indent=2)
+
+    @classmethod
+    def load(cls, stage: int, model_dir: str = MODEL_DIR) -> "TriageModel":
+        _require_sklearn()
+        import joblib
+        model_path, meta_path = cls.paths(stage, model_dir)
+        if not os.path.exists(meta_path):
+            raise SystemExit(f"No triage model for stage {stage} in {model_dir}: python -m common.triage train --stage {stage}")
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        pipeline = joblib.load(model_path) if os.path.exists(model_path) else None
+        return cls(stage, pipeline, meta)
+
+    # ---- scoring ----
+
+    def scores(self, df: pd.DataFrame, title_col: str = "Title", abstract_col: str = "Abstract") -> np.ndarray:
+        if self.pipeline is None or df.empty:
+            return np.full(len(df), np.nan)
+        return self.pipeline.predict_proba(_text(df, title_col, abstract_col))[:, 1]
+
+    def decide(self, df: pd.DataFrame, ids: List[Any], title_col: str = "Title",
+               abstract_col: str = "Abstract") -> Triage:
+        s = self.stage
+        p = self.scores(df, title_col, abstract_col)
+        local: Dict[str, Dict[str, Any]] = {}
+        probs: Dict[str, float] = {}
+        for uid, pi in zip(ids, p):
+            pi = None if np.isnan(pi) else round(float(pi), 6)
+            probs[uid] = pi
+            if pi is None:
+                continue
+            if pi < self.t_exclude:
+                include, why = False, f"p={pi:.3f} < t_exclude={self.t_exclude:.3f}"
+            elif pi >= self.t_include:
+                include, why = True, f"p={pi:.3f} >= t_include={self.t_include:.3f}"
+            else:
+                continue
+            local[uid] = {f"include_stage{s}": include, f"reason_stage{s}": f"triage: {why}",
+                          f"confidence_stage{s}": round(pi if include else 1.0 - pi, 4), f"p_triage_stage{s}": pi}
+        return Triage(local, probs)
+
+
+class TriageStats:
+    """Running totals for the [TRIAGE] line."""
+
+    def __init__(self, model: TriageModel):
+        self.model = model
+        self.rows = 0
+        self.excluded = 0
+        self.included = 0
+
+    def add(self, t: Triage) -> None:
+        self.rows += len(t.p)
+        for row in t.local.values():
+            if row[f"include_stage{self.model.stage}"]:
+                self.included += 1
+            else:
+                self.excluded += 1
+
+    def line(self) -> str:
+        m = self.model
+        sent = self.rows - self.excluded - self.included
+        return (
+            f"[TRIAGE] stage {m.stage}: excluded locally {self.excluded}, included locally {self.included}, "
+            f"sent to the LLM {sent}/{self.rows} (t_exclude={m.t_exclude:.3f}, t_include={m.t_include:.3f}, "
+            f"trained on {m.meta['n_labels']} labels)"
+        )
+
+
+# -------------------- CLI --------------------
+
+def _train_and_save(stage: int, extra: Sequence[str], model_dir: str, floor: float, precision: float) -> None:
+    labels = collect_labels(stage, extra)
+    if labels.empty:
+        print(f"Stage {stage}: no labelled decisions found; skipped")
+        return
+    model = TriageModel.train(stage, labels, floor, precision)
+    model.save(model_dir)
+    _print_report(model.meta)
+
+
+def _print_report(meta: Dict[str, Any]) -> None:
+    print(f"Stage {meta['stage']}: {meta['n_labels']} labels ({meta['n_include']} include / {meta['n_exclude']} exclude, "
+          f"{meta['n_human']} human), trained {time.strftime('%Y-%m-%d %H:%M', time.localtime(meta['trained_at']))}")
+    if meta.get("note"):
+        print(f"  {meta['note']}")
+        return
+    o = meta["oof"]
+    print(f"  t_exclude {meta['t_exclude']:.3f}  t_include {meta['t_include']:.3f}  "
+          f"(recall floor {meta['recall_floor']:.0%}, include precision {meta['include_precision']:.0%})")
+    print(f"  out-of-fold: recall {o['recall']:.1%}, decided locally {o['local_exclude_share']:.1%} exclude / "
+          f"{o['local_include_share']:.1%} include, includes lost {o['includes_lost']}, "
+          f"excludes included {o['excludes_included']}")
+    print("  calibration (out-of-fold): bin, n, mean p, include rate")
+    for b in meta["calibration"]:
+        print(f"    {b['bin']}  {b['n']:>5}  {b['mean_p']:.3f}  {b['include_rate']:.3f}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Local triage classifier per stage (TF-IDF + logistic regression)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    for name, help_text in (("train", "Train one stage (or all) from the labelled decisions"),
+                            ("retrain", "Retrain stages whose model is missing, older than --max-age-days or has new labels")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--stage", type=int, choices=STAGES, default=None, help="Default: every stage")
+        p.add_argument("--labels", action="append", default=[], help="Extra output table with include_stageN (repeatable)")
+        p.add_argument("--model-dir", default=MODEL_DIR)
+        p.add_argument("--recall-floor", type=float, default=RECALL_FLOOR)
+        p.add_argument("--include-precision", type=float, default=INCLUDE_PRECISION)
+        if name == "retrain":
+            p.add_argument("--max-age-days", type=float, default=7.0)
+            p.add_argument("--min-new-labels", type=float, default=0.1, help="Retrain when labels grew by this fraction")
+    p = sub.add_parser("report", help="Thresholds and calibration curve of a trained stage")
+    p.add_argument("--stage", type=int, choices=STAGES, required=True)
+    p.add_argument("--model-dir", default=MODEL_DIR)
+    p = sub.add_parser("score", help="Score a table and show how it would be split (no API calls)")
+    p.add_argument("--stage", type=int, choices=STAGES, required=True)
+    p.add_argument("--input", required=True)
+    p.add_argument("--output", default=None, help="Write the table with p_triage_stageN and triage_stageN")
+    p.add_argument("--model-dir", default=MODEL_DIR)
+    args = parser.parse_args(argv)
+
+    if args.cmd in ("train", "retrain"):
+        for stage in ([args.stage] if args.stage else STAGES):
+            if args.cmd == "retrain":
+                _, meta_path = TriageModel.paths(stage, args.model_dir)
+                if os.path.exists(meta_path):
+                    with open(meta_path, encoding="utf-8") as f:
+                        meta = json.load(f)
+                    age = (time.time() - meta["trained_at"]) / 86400
+                    grown = len(collect_labels(stage, args.labels)) >= meta["n_labels"] * (1 + args.min_new_labels)
+                    if age < args.max_age_days and not grown:
+                        print(f"Stage {stage}: up to date ({age:.1f} days old, {meta['n_labels']} labels)")
+                        continue
+            _train_and_save(stage, args.labels, args.model_dir, args.recall_floor, args.include_precision)
+        return
+
+    model = TriageModel.load(args.stage, args.model_dir)
+    if args.cmd == "report":
+        _print_report(model.meta)
+        return
+    df = read_table(args.input)
+    ids = df["id"].astype(str).tolist()
+    t = model.decide(df, ids)
+    stats = TriageStats(model)
+    stats.add(t)
+    print(stats.line())
+    if args.output:
+        out = df.copy()
+        out[f"p_triage_stage{args.stage}"] = [t.p[i] for i in ids]
+        out[f"triage_stage{args.stage}"] = [
+            ("include" if t.local[i][f"include_stage{args.stage}"] else "exclude") if i in t.local else "llm" for i in ids
+        ]
+        out.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
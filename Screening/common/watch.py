@@ -0,0 +1,390 @@
+# watch.py — Watch-folder daemon: screen new references as exports land in an inbox
+#
+# Stays resident with one warm StageScreener per stage (common/pipeline.py) and
+# polls the inbox every --interval seconds. For each new export
+# (.csv / .parquet / .ris / .nbib, see common/references.py) that has not been
+# written to for --settle seconds:
+#   1) read it into id/Year/Title/Abstract(/DOI) records
+#   2) drop records already screened: same DOI or same long title (Stage 0
+#      normalization) as anything in the ledger, or the same id when its DOI or
+#      title also agrees (with the ledger, or with --db's Stage 1 articles);
+#      duplicates inside the file keep their first record. A record whose id is
+#      taken by a different paper is screened under its reference_id instead.
+#   3) run the new records through --stages; only articles included at a
+#      stage go on to the next
+#   4) record each record in the ledger, and publish (write + rename, so a
+#      reader never sees a half-written file) into --out:
+#        included.csv      every article included by all stages so far
+#        screened.csv      every article screened so far, with all stage columns
+#        batches/<time>_<file>.csv   this file's new records
+#   5) move the export to inbox/processed/ (inbox/failed/ if it can't be read)
+#
+# Records whose API call failed at some stage are kept in the ledger as failed
+# and retried on the next poll (up to MAX_ATTEMPTS times).
+# Raw responses are cached in --out/responses.sqlite, so a record seen again
+# (e.g. after deleting the ledger) costs no API calls.
+#
+# Usage (from the Screening/ folder):
+#   python -m common.watch --inbox ../horizon/inbox --out ../horizon/published
+#   python -m common.watch --inbox ../horizon/inbox --out ../horizon/published --stages 1-4 --once
+#   python -m common.watch --inbox ../horizon/inbox --out ../horizon/published --db screening.sqlite --rpm 300
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import signal
+import sqlite3
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from common.pipeline import DEFAULT_MODEL, Pipeline, ResponseCache
+from common.references import EXTENSIONS, read_references, reference_id
+from common.stages import load_dedup_utils, parse_stages, system_prompt_path
+from common.store import ScreeningStore, json_default, latest_decisions
+from common.tables import write_table
+from common.workers import RateBudget
+
+DEFAULT_INTERVAL = 60.0
+DEFAULT_SETTLE = 5.0
+MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    sha256 TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    processed_at REAL,
+    n_records INTEGER,
+    n_new INTEGER,
+    status TEXT NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS screened (
+    id TEXT PRIMARY KEY,
+    doi_key TEXT,
+    title_key TEXT,
+    source TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    included INTEGER,
+    row TEXT NOT NULL,
+    screened_at REAL
+);
+CREATE INDEX IF NOT EXISTS screened_doi ON screened (doi_key);
+CREATE INDEX IF NOT EXISTS screened_title ON screened (title_key);
+"""
+
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _publish(df: pd.DataFrame, path: str) -> None:
+    """Write next to `path`, then rename over it (atomic on one filesystem)."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    root, ext = os.path.splitext(path)
+    tmp = f"{root}.tmp{ext}"
+    write_table(df, tmp)
+    os.replace(tmp, path)
+
+
+class Ledger:
+    """Files seen and records screened by the daemon (SQLite in --out)."""
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path, timeout=30.0)
+        self.conn.executescript(SCHEMA)
+        self.utils_0 = load_dedup_utils()
+
+    def title_key(self, title: Any) -> Optional[str]:
+        """Normalized title, only for long titles (as in Stage 0)."""
+        t = self.utils_0.normalize_title(title)
+        return t if len(t) >= self.utils_0.MIN_TITLE_KEY_LEN else None
+
+    def keys(self, df: pd.DataFrame) -> pd.DataFrame:
+        """doi_key / title_key per record."""
+        return pd.DataFrame({
+            "id": df["id"].astype(str).tolist(),
+            "doi_key": [self.utils_0.normalize_doi(d) or None for d in df["DOI"].tolist()],
+            "title_key": [self.title_key(t) for t in df["Title"].tolist()],
+        }, index=df.index)
+
+    def file_done(self, sha: str) -> bool:
+        return self.conn.execute("SELECT 1 FROM files WHERE sha256 = ?", (sha,)).fetchone() is not None
+
+    def add_file(self, sha: str, name: str, n_records: int, n_new: int, status: str, error: Optional[str] = None) -> None:
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO files (sha256, name, processed_at, n_records, n_new, status, error)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (sha, name, time.time(), n_records, n_new, status, error),
+            )
+
+    def _select(self, sql: str, values: List[Any]) -> List[Tuple]:
+        out: List[Tuple] = []
+        for k in range(0, len(values), 500):
+            chunk = values[k:k + 500]
+            out.extend(self.conn.execute(sql.format(marks=",".join("?" * len(chunk))), chunk).fetchall())
+        return out
+
+    def new_records(self, df: pd.DataFrame, known: Dict[str, Optional[str]]) -> pd.DataFrame:
+        """
+        Records not screened yet, first of each duplicate group in the file.
+        `known` maps ids screened elsewhere (--db) to their title key. An id
+        match is a duplicate only when the DOI or title key agrees too; a record
+        whose id belongs to a different paper gets its reference_id.
+        """
+        keys = self.keys(df)
+        # id -> (doi_key, title_key, screened) for every id this file could collide with
+        taken: Dict[str, Tuple[Optional[str], Optional[str], bool]] = {
+            uid: (None, title, True) for uid, title in known.items()}
+        ids = keys["id"].unique().tolist()
+        ids += [reference_id(d, t, y) for d, t, y in zip(df["DOI"], df["Title"], df["Year"])]
+        for uid, doi, title, status in self._select(
+                "SELECT id, doi_key, title_key, status FROM screened WHERE id IN ({marks})", ids):
+            taken[uid] = (doi, title, status == "screened")
+        seen_doi = {r[0] for r in self._select(
+            "SELECT doi_key FROM screened WHERE status = 'screened' AND doi_key IN ({marks})",
+            keys["doi_key"].dropna().unique().tolist())}
+        seen_title = {r[0] for r in self._select(
+            "SELECT title_key FROM screened WHERE status = 'screened' AND title_key IN ({marks})",
+            keys["title_key"].dropna().unique().tolist())}
+
+        def same_paper(uid: str, doi: Optional[str], title: Optional[str]) -> bool:
+            t_doi, t_title, _ = taken[uid]
+            return bool((doi and doi == t_doi) or (title and title == t_title))
+
+        keep, out_ids = [], []
+        for uid, doi, title, d, t, y in zip(keys["id"], keys["doi_key"], keys["title_key"],
+                                            df["DOI"], df["Title"], df["Year"]):
+            if uid in taken and not same_paper(uid, doi, title):
+                uid = reference_id(d, t, y)
+            dup = (uid in taken and taken[uid][2] and same_paper(uid, doi, title)) \
+                or bool(doi and doi in seen_doi) or bool(title and title in seen_title)
+            keep.append(not dup)
+            out_ids.append(uid)
+            taken.setdefault(uid, (doi, title, True))
+            if doi:
+                seen_doi.add(doi)
+            if title:
+                seen_title.add(title)
+        out = df.assign(id=out_ids)
+        return out[keep].reset_index(drop=True)
+
+    def retries(self) -> pd.DataFrame:
+        rows = [json.loads(r[0]) for r in self.conn.execute(
+            "SELECT row FROM screened WHERE status = 'failed' AND attempts < ?", (MAX_ATTEMPTS,))]
+        return pd.DataFrame(rows)
+
+    def record(self, df: pd.DataFrame, out: pd.DataFrame, included: pd.Series, failed: List[Any], source: str) -> None:
+        keys = self.keys(df).set_index("id")
+        failed_ids = {str(f) for f in failed}
+        now = time.time()
+        rows = []
+        for i, rec in enumerate(out.to_dict("records")):
+            uid = str(rec["id"])
+            clean = {k: (None if not isinstance(v, (list, dict)) and pd.isna(v) else v) for k, v in rec.items()}
+            status = "failed" if uid in failed_ids else "screened"
+            rows.append((uid, keys.at[uid, "doi_key"], keys.at[uid, "title_key"], source, status,
+                         int(bool(included.iloc[i])),
+                         json.dumps(clean, ensure_ascii=False, default=json_default), now))
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO screened (id, doi_key, title_key, source, status, attempts, included, row, screened_at)"
+                " VALUES (?, ?, ?, ?, ?, 1, ?, ?, ?)"
+                " ON CONFLICT(id) DO UPDATE SET status = excluded.status, attempts = screened.attempts + 1,"
+                "  included = excluded.included, row = excluded.row, screened_at = excluded.screened_at",
+                rows,
+            )
+
+    def table(self) -> pd.DataFrame:
+        """Every screened record (oldest first), with its all-stages `included` flag."""
+        rows = self.conn.execute(
+            "SELECT row, included FROM screened WHERE status = 'screened' ORDER BY screened_at, rowid").fetchall()
+        df = pd.DataFrame([json.loads(r[0]) for r in rows])
+        df["included"] = [bool(r[1]) for r in rows]
+        return df
+
+    def counts(self) -> Dict[str, int]:
+        row = self.conn.execute(
+            "SELECT COUNT(*), SUM(status = 'screened'), SUM(status = 'screened' AND included = 1), SUM(status = 'failed')"
+            " FROM screened").fetchone()
+        return {"records": row[0], "screened": row[1] or 0, "included": row[2] or 0, "failed": row[3] or 0}
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class Watcher:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.inbox = args.inbox
+        self.out = args.out
+        os.makedirs(self.out, exist_ok=True)
+        self.ledger = Ledger(os.path.join(self.out, "watch.sqlite"))
+        self.cache = ResponseCache(os.path.join(self.out, "responses.sqlite"))
+        budget = RateBudget(args.rpm)
+        started = time.time()
+        self.pipeline = Pipeline(parse_stages(args.stages), args.model, self.cache, wrap_client=budget.instrument)
+        self.store = ScreeningStore(args.db) if args.db else None
+        self.known: Dict[str, Optional[str]] = {}   # ids already in --db -> title key
+        if self.store is not None:
+            titles = dict(self.store.conn.execute("SELECT id, title FROM articles").fetchall())
+            self.known = {uid: self.ledger.title_key(titles.get(uid)) for uid in
+                          latest_decisions(self.store.conn, self.pipeline.stages[0])["id"].astype(str)}
+        self.stopping = False
+        print(f"[WATCH] stages {self.pipeline.stages} loaded in {time.time() - started:.1f}s; "
+              f"watching {self.inbox} every {args.interval:g}s, publishing to {self.out}", flush=True)
+
+    def _record_stage(self, source: str):
+        if self.store is None:
+            return None
+
+        def record(stage: int, df: pd.DataFrame, rows: List[Dict[str, Any]], raws: List[Optional[str]]) -> None:
+            screener = self.pipeline.screeners[stage]
+            # runs.system_prompt holds the prompt file's path, as the main_N.py runners record it
+            run_id = self.store.start_run(stage, model=screener.model, system_prompt=system_prompt_path(stage),
+                                          input_path=source)
+            self.store.add_articles(df)
+            for normalized, raw, prompt in zip(rows, raws, screener.prompts(df)):
+                if raw is not None:
+                    self.store.add_decision(run_id, stage, normalized["id"], normalized, raw=raw, prompt=prompt)
+            self.store.finish_run(run_id, n_rows=len(rows))
+        return record
+
+    def pending_files(self) -> List[str]:
+        now = time.time()
+        out = []
+        for name in sorted(os.listdir(self.inbox)):
+            path = os.path.join(self.inbox, name)
+            if (os.path.isfile(path) and not name.startswith(".")
+                    and os.path.splitext(name)[1].lower() in EXTENSIONS
+                    and now - os.path.getmtime(path) >= self.args.settle):
+                out.append(path)
+        return out
+
+    def _move(self, path: str, folder: str) -> None:
+        target = os.path.join(self.inbox, folder)
+        os.makedirs(target, exist_ok=True)
+        dest = os.path.join(target, os.path.basename(path))
+        if os.path.exists(dest):
+            root, ext = os.path.splitext(dest)
+            dest = f"{root}_{time.strftime('%Y%m%d-%H%M%S')}{ext}"
+        shutil.move(path, dest)
+
+    def screen(self, df: pd.DataFrame, source: str) -> Dict[str, int]:
+        started = time.time()
+        out, failed = self.pipeline.run(df, self.args.concurrency, self._record_stage(source))
+        included = self.pipeline.included(out)
+        self.ledger.record(df, out, included, failed, source)
+        if self.store is not None:
+            self.store.flush()
+        stem = os.path.splitext(os.path.basename(source))[0]
+        _publish(out, os.path.join(self.out, "batches", f"{time.strftime('%Y%m%d-%H%M%S')}_{stem}.csv"))
+        n_inc = int(included.sum())
+        print(f"[WATCH] {os.path.basename(source)}: screened {len(df)} records in {time.time() - started:.1f}s; "
+              f"included {n_inc}, failed {len(failed)}", flush=True)
+        return {"screened": len(df), "included": n_inc, "failed": len(failed)}
+
+    def publish(self) -> None:
+        df = self.ledger.table()
+        included = df.pop("included")
+        _publish(df, os.path.join(self.out, "screened.csv"))
+        _publish(df[included], os.path.join(self.out, "included.csv"))
+        c = self.ledger.counts()
+        print(f"[WATCH] published {c['included']} included of {c['screened']} screened "
+              f"({c['failed']} failed, awaiting retry) | {self.cache.line()}", flush=True)
+
+    def poll(self) -> bool:
+        """One pass over the inbox (and failed records); True if anything was screened."""
+        changed = False
+        retry = self.ledger.retries()
+        if not retry.empty:
+            print(f"[WATCH] retrying {len(retry)} failed records", flush=True)
+            self.screen(retry, "retry")
+            changed = True
+        for path in self.pending_files():
+            if self.stopping:
+                break
+            name = os.path.basename(path)
+            sha = _sha256(path)
+            if self.ledger.file_done(sha):
+                print(f"[WATCH] {name}: same content already processed, skipped", flush=True)
+                self._move(path, "processed")
+                continue
+            try:
+                df = read_references(path)
+            except Exception as e:
+                print(f"[WATCH] {name}: could not read ({e}); moved to failed/", flush=True)
+                self.ledger.add_file(sha, name, 0, 0, "failed", str(e))
+                self._move(path, "failed")
+                continue
+            new = self.ledger.new_records(df, self.known)
+            print(f"[WATCH] {name}: {len(df)} records, {len(new)} new", flush=True)
+            if not new.empty:
+                self.screen(new, name)
+                changed = True
+            self.ledger.add_file(sha, name, len(df), len(new), "done")
+            self._move(path, "processed")
+        if changed:
+            self.publish()
+        return changed
+
+    def stop(self, *_: Any) -> None:
+        self.stopping = True
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self.stop)
+        try:
+            while not self.stopping:
+                self.poll()
+                if self.args.once:
+                    break
+                deadline = time.time() + self.args.interval
+                while not self.stopping and time.time() < deadline:
+                    time.sleep(min(1.0, self.args.interval))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if self.store is not None:
+            self.store.close()
+        self.cache.close()
+        self.ledger.close()
+        print("[WATCH] stopped", flush=True)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Watch an inbox folder and screen new references as they arrive")
+    parser.add_argument("--inbox", required=True, help="Folder that new exports (.csv/.parquet/.ris/.nbib) are dropped into")
+    parser.add_argument("--out", required=True, help="Folder for included.csv, screened.csv, batches/ and the daemon state")
+    parser.add_argument("--stages", default="1-7", help="Stage chain to run, e.g. 1-7 or 1-4")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="Seconds between inbox polls")
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE,
+                        help="Only pick up files not modified for this many seconds (still being copied otherwise)")
+    parser.add_argument("--concurrency", type=int, default=1, help="API requests in flight per stage")
+    parser.add_argument("--rpm", type=float, default=None, help="Cap API requests per minute (all stages together)")
+    parser.add_argument("--db", default=None,
+                        help="Also record decisions in this SQLite store, and skip ids it already has at the first stage")
+    parser.add_argument("--once", action="store_true", help="Process the inbox once and exit")
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.inbox):
+        parser.error(f"inbox folder not found: {args.inbox}")
+    if not parse_stages(args.stages):
+        parser.error(f"no known stages in --stages {args.stages}")
+    Watcher(args).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,243 @@
+# workers.py — --workers N: one stage run split over N processes, merged in input order
+#
+# The runner started with --workers N is the coordinator. It starts N copies of
+# the same command line with --shard K/N; worker K screens only the rows whose
+# id hashes to K (sha256, so the split is the same on every machine and run),
+# with its own API client, and pickles its result rows with their input
+# positions. The coordinator then reads the input again in the same chunks and
+# does the runner's own merge over the results in input order, so the output
+# table is the one a single-process run writes.
+#
+# Per worker:
+#   - console lines are prefixed [wK]
+#   - --trace goes to a worker file; the coordinator appends them to --trace
+#     in worker order at the end
+#   - --metrics-jsonl / --metrics-prom / --profile-out get a .wK suffix
+#   - --db: every worker records its own run in the shared store
+#
+# --rpm caps API requests per minute. With workers the budget is shared: the
+# next free request slot lives in a small SQLite file in the shard directory,
+# taken under BEGIN IMMEDIATE, so N workers together stay under the cap. Each
+# wait is reported to --trace as a rate_limit.wait span next to the attempt.
+
+import hashlib
+import os
+import pickle
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from common.metrics import InstrumentedClient
+from common.tables import TableWriter, iter_table, read_table
+
+
+def shard_of(uid: Any, n: int) -> int:
+    """Stable shard for an id (independent of PYTHONHASHSEED, platform and run)."""
+    return int.from_bytes(hashlib.sha256(str(uid).encode("utf-8")).digest()[:8], "big") % n
+
+
+def _per_worker(path: str, k: int) -> str:
+    root, ext = os.path.splitext(path)
+    return f"{root}.w{k}{ext}"
+
+
+class RateBudget:
+    """
+    At most `rpm` API requests per minute, spaced evenly. In-process when path
+    is None; otherwise shared by every process using the same SQLite file.
+    `trace` (a TraceRecorder) gets a span for every wait.
+    """
+
+    def __init__(self, rpm: Optional[float], path: Optional[str] = None, trace: Any = None):
+        self.rpm = rpm
+        self.trace = trace
+        self.interval = 60.0 / rpm if rpm else 0.0
+        self.path = path
+        self.waited = 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def instrument(self, client: Any) -> Any:
+        # Outermost wrapper, so the wait is not counted as request latency
+        return InstrumentedClient(client, self) if self.rpm else client
+
+    def _take(self) -> float:
+        """Reserve the next free slot; returns its start time."""
+        now = time.time()
+        if self.path is None:
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+            return slot
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS rate (id INTEGER PRIMARY KEY, next_at REAL NOT NULL)")
+        self._conn.execute("BEGIN IMMEDIATE")
+        row = self._conn.execute("SELECT next_at FROM rate WHERE id = 0").fetchone()
+        slot = max(now, row[0] if row else 0.0)
+        self._conn.execute("INSERT OR REPLACE INTO rate (id, next_at) VALUES (0, ?)", (slot + self.interval,))
+        self._conn.execute("COMMIT")
+        return slot
+
+    def request_started(self) -> None:
+        with self._lock:
+            slot = self._take()
+        wait = slot - time.time()
+        if wait > 0:
+            self.waited += wait
+            start = time.time_ns()
+            time.sleep(wait)
+            if self.trace is not None:
+                self.trace.rate_wait(start, time.time_ns())
+
+    def request_finished(self, latency: float, usage: Any = None, error: Optional[Exception] = None) -> None:
+        pass
+
+
+class Shard:
+    """This worker's share of the input, and its result rows keyed by input position."""
+
+    def __init__(self, index: int, count: int, directory: str, id_col: str = "id"):
+        self.index = index
+        self.count = count
+        self.directory = directory
+        self.id_col = id_col
+        self.path = os.path.join(directory, f"shard_{index}.pkl")
+        self.rate_path = os.path.join(directory, "rate.sqlite")
+        self._rows: List[int] = []
+        self._out: Dict[int, Dict[str, Any]] = {}
+
+    @classmethod
+    def from_args(cls, stage: int, args: Any, id_col: str = "id") -> Optional["Shard"]:
+        """The worker's shard (None in a normal run); points its own output files at per-worker paths."""
+        if not getattr(args, "shard", None):
+            return None
+        k, _, n = args.shard.partition("/")
+        shard = cls(int(k), int(n), args.shard_dir, id_col)
+        for name in ("output", "outfile"):
+            if hasattr(args, name):
+                setattr(args, name, shard.path)
+        args.export_csv = None
+        if args.trace:
+            args.trace = os.path.join(args.shard_dir, f"trace_{shard.index}.jsonl")
+        if args.metrics_jsonl:
+            args.metrics_jsonl = _per_worker(args.metrics_jsonl, shard.index)
+        if args.metrics_prom:
+            args.metrics_prom = _per_worker(args.metrics_prom, shard.index)
+        args.profile_out = f"{args.profile_out or f'profile_stage{stage}'}.w{shard.index}"
+        return shard
+
+    def _keys(self, df: pd.DataFrame) -> List[str]:
+        if self.id_col in df.columns:
+            return [str(v) for v in df[self.id_col].tolist()]
+        return [f"row_{idx}" for idx in df.index]
+
+    def mine(self, df: pd.DataFrame) -> List[bool]:
+        return [shard_of(k, self.count) == self.index for k in self._keys(df)]
+
+    def total(self, path: str, limit: Optional[int] = None) -> int:
+        """Rows of the (limited) input that fall in this shard."""
+        df = read_table(path, columns=[self.id_col])
+        if self.id_col not in df.columns:
+            df = read_table(path)
+        return sum(self.mine(df.head(limit) if limit else df))
+
+    def select(self, df: pd.DataFrame) -> pd.DataFrame:
+        """This shard's rows of an input chunk (index labels are input positions, as iter_table yields them)."""
+        part = df[self.mine(df)]
+        self._rows = list(part.index)
+        return part
+
+    def add(self, results: List[Dict[str, Any]]) -> None:
+        """Result rows of the last selected chunk, in its order."""
+        assert len(results) == len(self._rows), "one result row per selected input row"
+        self._out.update(zip(self._rows, results))
+
+    def close(self) -> None:
+        with open(self.path, "wb") as f:
+            pickle.dump(self._out, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _relay(proc: subprocess.Popen, k: int) -> None:
+    for line in proc.stdout:
+        print(f"[w{k}] {line}", end="", flush=True)
+
+
+def run_sharded(
+    stage: int,
+    workers: int,
+    input_path: str,
+    output_path: str,
+    merge: Callable[[pd.DataFrame, pd.DataFrame], pd.DataFrame],
+    export_csv: Optional[str] = None,
+    chunk_size: Optional[int] = None,
+    columns: Optional[Iterable[str]] = None,
+    limit: Optional[int] = None,
+    trace: Optional[str] = None,
+) -> None:
+    """Coordinator: run this command as `workers` shard processes, then merge their rows in input order."""
+    started = time.time()
+    directory = tempfile.mkdtemp(prefix=f"stage{stage}_workers_")
+    argv = [sys.executable, os.path.abspath(sys.argv[0])] + sys.argv[1:]
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    print(f"[WORKERS] stage {stage}: {workers} workers (shards in {directory})", flush=True)
+    procs, relays = [], []
+    for k in range(workers):
+        proc = subprocess.Popen(argv + ["--shard", f"{k}/{workers}", "--shard-dir", directory],
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1, env=env)
+        relay = threading.Thread(target=_relay, args=(proc, k), daemon=True)
+        relay.start()
+        procs.append(proc)
+        relays.append(relay)
+    codes = [proc.wait() for proc in procs]
+    for relay in relays:
+        relay.join()
+    failed = [k for k, code in enumerate(codes) if code != 0]
+    if failed:
+        print(f"[WORKERS] worker(s) {failed} failed (exit codes {[codes[k] for k in failed]}); "
+              f"no output written, shard files kept in {directory}", flush=True)
+        sys.exit(1)
+
+    try:
+        rows: Dict[int, Dict[str, Any]] = {}
+        sizes = []
+        for k in range(workers):
+            path = os.path.join(directory, f"shard_{k}.pkl")
+            if not os.path.exists(path):
+                # The worker exited cleanly without a result file: its shard had no rows
+                sizes.append(0)
+                continue
+            with open(path, "rb") as f:
+                part = pickle.load(f)
+            sizes.append(len(part))
+            rows.update(part)
+
+        writer = TableWriter(output_path)
+        csv_writer = TableWriter(export_csv) if export_csv else None
+        for df in iter_table(input_path, chunk_size, columns=columns, limit=limit):
+            out = merge(df, pd.DataFrame([rows[pos] for pos in df.index]))
+            writer.append(out)
+            if csv_writer:
+                csv_writer.append(out)
+        writer.close()
+        if csv_writer:
+            csv_writer.close()
+        if trace:
+            with open(trace, "a", encoding="utf-8") as out_f:
+                for k in range(workers):
+                    path = os.path.join(directory, f"trace_{k}.jsonl")
+                    if os.path.exists(path):
+                        with open(path, encoding="utf-8") as f:
+                            shutil.copyfileobj(f, out_f)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    print(f"[WORKERS] stage {stage}: merged {writer.rows} rows in input order from {workers} workers "
+          f"(rows per worker {sizes}) in {time.time() - started:.1f}s", flush=True)
+    print(f"Stage {stage} screening complete. Wrote: {output_path}", flush=True)